@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -80,13 +81,80 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
+# DB_ENGINE=postgresql switches to PostgreSQL (DB_NAME, DB_USER, DB_PASSWORD,
+# DB_HOST, DB_PORT). With DB_POOL=1 connections come from psycopg's pool
+# (psycopg[binary,pool] in requirements.txt); otherwise they are kept for
+# DB_CONN_MAX_AGE seconds and health-checked before reuse.
+#
+# SQLite runs in WAL mode so reads do not wait for writes, and writers take
+# the lock up front (IMMEDIATE) and wait DB_TIMEOUT seconds for it instead
+# of failing with "database is locked".
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DB_POOL = os.environ.get('DB_POOL', '0') == '1'
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'safir'),
+            'USER': os.environ.get('DB_USER', 'safir'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            # Pooled connections are returned to the pool after each request.
+            'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('DB_POOL_MIN', '2')),
+                    'max_size': int(os.environ.get('DB_POOL_MAX', '10')),
+                    'timeout': int(os.environ.get('DB_POOL_TIMEOUT', '10')),
+                },
+            } if DB_POOL else {},
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA mmap_size=%d;'
+                    'PRAGMA cache_size=-%d;'
+                    'PRAGMA temp_store=MEMORY;'
+                ) % (
+                    int(os.environ.get('DB_MMAP_SIZE', 128 * 1024 * 1024)),
+                    int(os.environ.get('DB_CACHE_KB', 32 * 1024)),
+                ),
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': int(os.environ.get('DB_TIMEOUT', '20')),
+            },
+        }
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# The local-memory cache is per process. When running several workers use a
+# shared backend (e.g. django.core.cache.backends.filebased.FileBasedCache)
+# so that cache invalidation on write reaches every worker.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'safir'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
     }
 }
 
+RESPONSE_CACHE_TIMEOUT = 300  # seconds
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -139,6 +207,29 @@ STATIC_ROOT = BASE_DIR / 'static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploads are named by content hash and reference-counted (main.storage);
+# unused files are deleted by `collect_media` after MEDIA_RELEASE_GRACE
+# seconds, so a soft-deleted row can still be restored for a while.
+STORAGES = {
+    'default': {
+        'BACKEND': 'main.storage.HashedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+MEDIA_RELEASE_GRACE = 7 * 24 * 3600
+
+# Media serving (main.media). MEDIA_SERVE_MODE is 'django' (FileResponse,
+# sent with sendfile by gunicorn/uWSGI), 'accel' (nginx X-Accel-Redirect to
+# MEDIA_ACCEL_PREFIX) or 'sendfile' (X-Sendfile). Set MEDIA_SERVE=0 when the
+# front server maps MEDIA_URL to MEDIA_ROOT itself.
+MEDIA_SERVE = os.environ.get('MEDIA_SERVE', '1') == '1'
+MEDIA_SERVE_MODE = os.environ.get('MEDIA_SERVE_MODE', 'django')
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+MEDIA_CACHE_CONTROL = 'public, max-age=86400'
+MEDIA_IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -157,8 +248,20 @@ SWAGGER_SETTINGS = {
     'USE_SESSION_AUTH': True,
     'LOGIN_URL': 'rest_framework:login',
     'LOGOUT_URL': 'rest_framework:logout',
+    'SPEC_URL': ('schema-json', {'format': '.json'}),
+}
+
+REDOC_SETTINGS = {
+    'SPEC_URL': ('schema-json', {'format': '.json'}),
 }
 
+# Precomputed OpenAPI schema (main.schema): artifacts are written to
+# SCHEMA_ROOT once per code version, which is a hash of the sources unless
+# SCHEMA_VERSION is set (e.g. to the deployed commit).
+SCHEMA_ROOT = BASE_DIR / 'schema'
+SCHEMA_VERSION = os.environ.get('SCHEMA_VERSION')
+SCHEMA_CACHE_CONTROL = 'public, max-age=3600'
+
 REST_FRAMEWORK = {
     # 'DEFAULT_AUTHENTICATION_CLASSES': [
     #     'rest_framework.authentication.TokenAuthentication', # Token Authentication
@@ -167,4 +270,138 @@ REST_FRAMEWORK = {
     # 'DEFAULT_PERMISSION_CLASSES': [ # Consider if you want to change default permissions here
     #     'rest_framework.permissions.IsAuthenticated', #  Make sure default permission matches your views.  If you still use IsAuthenticated in views, keep this.
     # ]
-}
\ No newline at end of file
+}
+
+# Token authentication (main.auth.authentication): validated tokens are
+# kept in memory for AUTH_TOKEN_CACHE_TTL seconds, at most
+# AUTH_TOKEN_CACHE_SIZE of them per process. Other processes learn about a
+# logOut or a deactivation through the cache backend: with the default
+# LocMemCache, which is per process, a token deleted in one worker keeps
+# working in the others for up to AUTH_TOKEN_CACHE_TTL seconds. Use a
+# shared CACHE_BACKEND (Redis, Memcached) with several workers.
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_TOKEN_CACHE_TTL = 60
+
+# Login (main.auth.auth_view): after LOGIN_MAX_FAILURES wrong passwords for
+# a username from one client, or LOGIN_MAX_FAILURES_PER_IP from one client
+# for any usernames, logIn answers 429 to that client without checking the
+# password until LOGIN_FAILURE_WINDOW seconds have passed since the first
+# failure. The counters live in the default cache;
+# use a shared backend (database, redis, ...) with several processes.
+LOGIN_MAX_FAILURES = 5
+LOGIN_MAX_FAILURES_PER_IP = 20
+LOGIN_FAILURE_WINDOW = 300
+
+# Callables (dotted paths) called with the user on login, whose dicts are
+# merged into the response, e.g. to add the uuids of a staff profile.
+LOGIN_PROFILE_HOOKS = []
+
+# META key holding the client address when behind a proxy (e.g.
+# 'HTTP_X_REAL_IP'); REMOTE_ADDR is used otherwise.
+CLIENT_IP_HEADER = None
+
+# Contact form (main.contacts): (burst, seconds per extra submission) of the
+# in-process token buckets per client IP and per phone number; identical
+# submissions are stored once per CONTACT_DUPLICATE_WINDOW seconds. With
+# CONTACT_BUFFERED, submissions are answered with 202 and inserted in
+# batches of CONTACT_BUFFER_SIZE, or after CONTACT_BUFFER_MAX_AGE seconds;
+# past CONTACT_BUFFER_MAX_ROWS queued rows they are saved directly.
+CONTACT_RATE_LIMITS = {
+    'ip': (5, 60),
+    'phone': (3, 600),
+}
+CONTACT_DUPLICATE_WINDOW = 600
+CONTACT_BUFFERED = False
+CONTACT_BUFFER_SIZE = 50
+CONTACT_BUFFER_MAX_AGE = 5
+CONTACT_BUFFER_MAX_ROWS = 1000
+
+# Translation
+# Backend used by main.translation; set to 'main.translation.FakeBackend'
+# to work offline (tests, benchmarks).
+
+TRANSLATION_BACKEND = 'main.translation.GoogleBackend'
+TRANSLATION_BATCH_SIZE = 50
+TRANSLATION_BATCH_CHARS = 4500
+TRANSLATION_MAX_WORKERS = 4
+
+# In-process LRU entries kept in front of the TranslationMemory table.
+TRANSLATION_MEMORY_SIZE = 10000
+TRANSLATION_MEMORY_DB = True
+
+
+# Background jobs (main.jobs): translations and resized images are made by
+# `python manage.py runjobs`, which must run next to the web workers; until
+# it picks a row up, the row has no _ru/_en fields and no image_min/image_max.
+# Deployments without a worker set JOB_WORKER=0 to do that work inside the
+# request instead.
+JOB_WORKER = os.environ.get('JOB_WORKER', '1') == '1'
+
+# Translate new rows in the `runjobs` worker instead of inside the request.
+TRANSLATION_ASYNC = JOB_WORKER
+
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_DELAY = 10  # seconds, doubled after every failed attempt
+JOB_TIMEOUT = 600  # seconds before a running job is considered abandoned
+
+
+# Pagination of list endpoints (main.funcs.paginate)
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+COUNT_CACHE_TIMEOUT = 300  # seconds; counts are also dropped on every write
+
+# Let list/detail endpoints pick the response language from Accept-Language
+# when no `lang` parameter is given. Off by default: clients that read
+# title_uz/title_ru/title_en directly would otherwise get collapsed fields.
+API_ACCEPT_LANGUAGE = False
+
+
+# Cache-Control of conditional GET endpoints (main.caching.conditional),
+# per view name. Clients always revalidate by default and get a 304 when
+# nothing changed.
+
+HTTP_CACHE_CONTROL = {
+    'default': 'public, max-age=0, must-revalidate',
+    'viewCategory': 'public, max-age=60',
+    'viewSlider': 'public, max-age=60',
+    'viewCompany': 'public, max-age=300',
+}
+
+
+# Image pipeline (main.images): generate resized images in the `runjobs`
+# worker instead of inside the upload request.
+
+IMAGE_PROCESSING_ASYNC = JOB_WORKER
+
+# Responsive renditions: widths (px) of the srcset ladder, output formats
+# (those the installed Pillow cannot encode are skipped) and their quality.
+IMAGE_RENDITION_WIDTHS = (320, 640, 960, 1280)
+IMAGE_RENDITION_FORMATS = ('AVIF', 'WEBP')
+IMAGE_RENDITION_QUALITY = {'AVIF': 60, 'WEBP': 80, 'JPEG': 82}
+
+# Multi-image uploads (main.uploads): files are spooled to disk; larger
+# files are rejected with 413, and at most IMAGE_UPLOAD_MAX_FILES are
+# accepted per request, stored by IMAGE_UPLOAD_WORKERS threads.
+IMAGE_UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+IMAGE_UPLOAD_MAX_FILES = 50
+IMAGE_UPLOAD_WORKERS = 4
+
+# Placeholders: longest side (px) and quality of the inline preview.
+IMAGE_PLACEHOLDER_SIZE = 20
+IMAGE_PLACEHOLDER_QUALITY = 30
+
+
+# Typeahead (main.typeahead): at most TYPEAHEAD_MAX_ENTRIES keys (one per
+# word start, for the first TYPEAHEAD_MAX_WORDS words of every title) are
+# kept in memory per process. Writes from other processes are picked up
+# within TYPEAHEAD_CHECK_INTERVAL seconds, and the index is rebuilt at
+# least every TYPEAHEAD_MAX_AGE seconds. A lookup ranks at most
+# TYPEAHEAD_SCAN matching keys; up to TYPEAHEAD_MEMO_SIZE results are kept
+# until the next write.
+TYPEAHEAD_MAX_ENTRIES = 200000
+TYPEAHEAD_MAX_WORDS = 4
+TYPEAHEAD_SCAN = 500
+TYPEAHEAD_MEMO_SIZE = 10000
+TYPEAHEAD_CHECK_INTERVAL = 1.0
+TYPEAHEAD_MAX_AGE = 300
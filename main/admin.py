@@ -83,3 +83,18 @@ class CompanyEmailAdmin(admin.ModelAdmin):
 @admin.register(models.Contact)
 class ContactAdmin(admin.ModelAdmin):
     list_display = ['uuid']
+
+@admin.register(models.TranslationMemory)
+class TranslationMemoryAdmin(admin.ModelAdmin):
+    list_display = ['source_text', 'target_lang', 'translated_text']
+    search_fields = ['source_text', 'translated_text']
+
+@admin.register(models.Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['kind', 'content_type', 'object_id', 'status', 'attempts', 'available_at']
+    list_filter = ['kind', 'status']
+
+@admin.register(models.MediaFile)
+class MediaFileAdmin(admin.ModelAdmin):
+    list_display = ['name', 'refs', 'released_at']
+    search_fields = ['name']
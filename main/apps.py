@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.models.signals import post_delete, post_migrate, post_save
 
 
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        from rest_framework.authtoken.models import Token
+
+        from . import search
+        from .auth import authentication
+
+        post_migrate.connect(search.setup, sender=self)
+        post_delete.connect(authentication.token_deleted, sender=Token)
+        post_save.connect(authentication.user_saved, sender=settings.AUTH_USER_MODEL)
@@ -1,15 +1,55 @@
-from django.contrib.auth import authenticate
+import hashlib
+
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils.module_loading import import_string
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.authentication import TokenAuthentication
+from main.auth.authentication import CachedTokenAuthentication
 from rest_framework import permissions
-from django.shortcuts import get_object_or_404
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
-from main import models
+from main import funcs
+
+
+def profile_hooks():
+    """
+    LOGIN_PROFILE_HOOKS: dotted paths of callables taking the user and
+    returning a dict of extra fields for the login response (or None).
+    """
+    return [import_string(path) for path in getattr(settings, 'LOGIN_PROFILE_HOOKS', ())]
+
+
+def failure_keys(request, username):
+    # (cache key, allowed failures) of the username from this client, and of
+    # the client as a whole. Usernames are case-sensitive, and keying them
+    # alone would let anyone lock an account out from anywhere.
+    ip = funcs.client_ip(request)
+    pair = hashlib.md5(('%s\x00%s' % (username, ip)).encode('utf-8')).hexdigest()
+    return [
+        ('login:failures:user:%s' % pair, getattr(settings, 'LOGIN_MAX_FAILURES', 5)),
+        ('login:failures:ip:%s' % ip, getattr(settings, 'LOGIN_MAX_FAILURES_PER_IP', 20)),
+    ]
+
+
+def is_throttled(keys):
+    counts = cache.get_many([key for key, limit in keys])
+    return any(counts.get(key, 0) >= limit for key, limit in keys)
+
+
+def record_failure(keys):
+    window = getattr(settings, 'LOGIN_FAILURE_WINDOW', 300)
+    for key, limit in keys:
+        # The window starts at the first failure.
+        cache.add(key, 0, window)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, window)
+
 
 @swagger_auto_schema(method='post', request_body=openapi.Schema(
     type=openapi.TYPE_OBJECT,
@@ -18,16 +58,43 @@ from main import models
         'username': openapi.Schema(type=openapi.TYPE_STRING),
         'password': openapi.Schema(type=openapi.TYPE_STRING),
     },
-))
+), responses={
+    status.HTTP_404_NOT_FOUND: "Wrong username or password",
+    status.HTTP_429_TOO_MANY_REQUESTS: "Too many failed attempts",
+})
 @api_view(['POST'])
 def logIn(request):
-    user = get_object_or_404(User, username=request.data['username'])
-    if not user.check_password(request.data['password']):
+    username = request.data.get('username')
+    password = request.data.get('password')
+    if not username or not password:
+        return Response({'detail': 'username and password are required'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Refuse before hashing anything once a username or a client has failed
+    # too often, so that floods cannot keep the workers busy with PBKDF2.
+    keys = failure_keys(request, username)
+    if is_throttled(keys):
+        response = Response({'detail': 'Too many failed attempts'}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+        response['Retry-After'] = str(getattr(settings, 'LOGIN_FAILURE_WINDOW', 300))
+        return response
+
+    # The user and their token in one query.
+    user = User.objects.select_related('auth_token').filter(username=username).first()
+    if user is None:
+        # Hash anyway so that unknown usernames take as long as wrong passwords.
+        User().set_password(password)
+    # check_password rehashes and saves the password when the hasher or its
+    # iteration count changed since it was set.
+    if user is None or not user.is_active or not user.check_password(password):
+        record_failure(keys)
         return Response({
             'detail': 'Not Found'
         }, status=status.HTTP_404_NOT_FOUND)
-    token, created = Token.objects.get_or_create(user = user)
+    cache.delete(keys[0][0])
 
+    try:
+        token = user.auth_token
+    except Token.DoesNotExist:
+        token, created = Token.objects.get_or_create(user=user)
 
     context = {
             "user":{
@@ -37,26 +104,15 @@ def logIn(request):
                 "last_name":user.last_name,
             }
         }
-
-    try:
-        client = models.ClientStaff.objects.get(profile=user)
-        if client:
-            context['client_uuid'] = str(client.client.uuid)
-            context['client_staff_uuid'] = str(client.uuid)
-    except Exception as e:
-        print(e)
-        pass
+    for hook in profile_hooks():
+        context.update(hook(user) or {})
 
     return  Response(context)
 
 
 @api_view(['POST'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([permissions.IsAuthenticated])
 def logOut(request):
-    print(request.user)
-    token = Token.objects.filter(user=request.user)
-    print(token)
-    if token:
-        token.delete()
-    return Response({'success':True})
\ No newline at end of file
+    Token.objects.filter(user=request.user).delete()
+    return Response({'success':True})
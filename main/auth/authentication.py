@@ -0,0 +1,122 @@
+"""
+Token authentication without a query per request.
+
+CachedTokenAuthentication keeps validated token -> (user, token) pairs in a
+bounded in-process LRU for AUTH_TOKEN_CACHE_TTL seconds. Deleting a token
+(logOut) or saving its user (deactivation, password change, ...) drops the
+entries of this process right away and bumps the caching version of Token,
+which other processes check on every hit when the cache backend is shared.
+Each request gets its own copy of the cached user and token.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from main import caching
+
+
+class TokenCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[2] != version or entry[3] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, key, user, token, version):
+        with self.lock:
+            self.entries[key] = (user, token, version, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, key=None, user_id=None):
+        with self.lock:
+            keys = [key] if key is not None else [
+                cached for cached, entry in self.entries.items() if entry[0].pk == user_id
+            ]
+            for cached in keys:
+                if self.entries.pop(cached, None) is not None:
+                    self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else None,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+
+tokens = TokenCache(
+    getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 10000),
+    getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 60),
+)
+
+
+def detached(user, token):
+    """
+    Copies of a cached (user, token) pair, so that what a request sets on
+    request.user is neither seen by other requests nor cached.
+    """
+    user, token = copy.copy(user), copy.copy(token)
+    token.user = user
+    return user, token
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        version = caching.get_version(Token)
+        cached = tokens.get(key, version)
+        if cached is None:
+            cached = super().authenticate_credentials(key)
+            tokens.put(key, *cached, version)
+        return detached(*cached)
+
+
+def token_deleted(sender, instance, **kwargs):
+    """
+    post_delete handler of Token (logOut, admin, cascades).
+    """
+    tokens.discard(key=instance.key)
+    caching.bump_version(Token)
+
+
+def user_saved(sender, instance, **kwargs):
+    """
+    post_save handler of the user model: is_active and permissions may have
+    changed.
+    """
+    tokens.discard(user_id=instance.pk)
+    caching.bump_version(Token)
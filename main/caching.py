@@ -0,0 +1,223 @@
+"""
+Per-model version counters and values cached against them.
+
+Every write through Main.save (including soft deletes) bumps the version of
+the model, so anything cached under a key that contains the version is
+invalidated precisely and without scanning the cache. The time of the last
+bump is kept next to the version for Last-Modified.
+"""
+import functools
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+
+def version_key(model):
+    return 'version:%s' % model._meta.label_lower
+
+
+def modified_key(model):
+    return 'modified:%s' % model._meta.label_lower
+
+
+def get_version(model):
+    key = version_key(model)
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock rather than 1 so that a counter evicted from
+        # the cache never comes back with a value that was already used.
+        cache.add(key, time.time_ns(), None)
+        # What changed while the counter was missing is unknown: count it as
+        # modified now.
+        cache.add(modified_key(model), time.time(), None)
+        version = cache.get(key)
+    return version
+
+
+def get_versions(models):
+    found = cache.get_many([version_key(model) for model in models])
+    return [found.get(version_key(model)) or get_version(model) for model in models]
+
+
+def bump_version(model):
+    cache.set(modified_key(model), time.time(), None)
+    key = version_key(model)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = time.time_ns()
+        cache.set(key, version, None)
+        return version
+
+
+def cached_count(queryset):
+    """
+    queryset.count(), cached until the next write to the model.
+    """
+    try:
+        sql = str(queryset.query)
+    except EmptyResultSet:
+        return 0
+    key = 'count:%s:%s:%s' % (
+        queryset.model._meta.label_lower,
+        get_version(queryset.model),
+        hashlib.md5(sql.encode('utf-8')).hexdigest(),
+    )
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, getattr(settings, 'COUNT_CACHE_TIMEOUT', 300))
+    return count
+
+
+class HitCounter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    def record(self, name, hit):
+        with self.lock:
+            hits, misses = self.counts.get(name, (0, 0))
+            self.counts[name] = (hits + 1, misses) if hit else (hits, misses + 1)
+
+    def stats(self):
+        with self.lock:
+            return {
+                name: {'hits': hits, 'misses': misses}
+                for name, (hits, misses) in self.counts.items()
+            }
+
+
+response_stats = HitCounter()
+
+
+def response_key(name, request, kwargs, models):
+    from .funcs import get_language
+
+    params = sorted((key, request.GET.getlist(key)) for key in request.GET)
+    vary = repr((params, sorted(kwargs.items()), get_language(request)))
+    return 'response:%s:%s:%s' % (
+        name,
+        hashlib.md5(vary.encode('utf-8')).hexdigest(),
+        '.'.join(str(version) for version in get_versions(models)),
+    )
+
+
+def cache_response(*models, timeout=None):
+    """
+    Cache the data of successful GET responses of an API view.
+
+    The key is made of the view name, the normalized query string, the URL
+    kwargs, the response language and the versions of `models`, so a write
+    to any of them makes the next request rebuild the response.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view(request, *args, **kwargs)
+
+            key = response_key(view.__name__, request, kwargs, models)
+            data = cache.get(key)
+            if data is not None:
+                response_stats.record(view.__name__, hit=True)
+                response = Response(data)
+                response['X-Cache'] = 'HIT'
+                return response
+
+            response_stats.record(view.__name__, hit=False)
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response.data, timeout or getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300))
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+def cached_json(name, vary, models, build, timeout=None):
+    """
+    build() rendered to JSON bytes, cached per `name` and `vary` (the
+    parameters build() depends on) until the next write to one of `models`.
+    Hits skip both the queries and the serialization.
+    """
+    from rest_framework.renderers import JSONRenderer
+
+    key = 'json:%s:%s:%s' % (
+        name,
+        hashlib.md5(repr(vary).encode('utf-8')).hexdigest(),
+        '.'.join(str(version) for version in get_versions(models)),
+    )
+    content = cache.get(key)
+    response_stats.record(name, hit=content is not None)
+    if content is None:
+        content = JSONRenderer().render(build())
+        cache.set(key, content, timeout or getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300))
+    return content
+
+
+def validators(models):
+    """
+    (time of the last write as a timestamp, or None, signature) of `models`,
+    from their version counters: one cache lookup and no query, however
+    large the tables are.
+    """
+    keys = [version_key(model) for model in models] + [modified_key(model) for model in models]
+    found = cache.get_many(keys)
+    versions = [found.get(version_key(model)) or get_version(model) for model in models]
+    stamps = [found.get(modified_key(model)) for model in models]
+    # Without the time of every model, an older one could produce a 304
+    # for a client that only sends If-Modified-Since.
+    last_modified = max(stamps) if None not in stamps else None
+    return last_modified, '.'.join(str(version) for version in versions)
+
+
+def cache_control_for(name, default=None):
+    options = getattr(settings, 'HTTP_CACHE_CONTROL', {})
+    return options.get(name, default or options.get('default', 'public, max-age=0, must-revalidate'))
+
+
+def conditional(*models, cache_control=None):
+    """
+    Answer GET requests with ETag/Last-Modified validators derived from the
+    version counters of `models`, and with 304 Not Modified, without running
+    the view, when the client's validators still match. Writes that bypass
+    Main.save (queryset.update(), raw SQL) must call bump_version().
+
+    Cache-Control comes from HTTP_CACHE_CONTROL[<view name>], then
+    `cache_control`, then HTTP_CACHE_CONTROL['default'].
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+
+            from .funcs import get_language
+
+            last_modified, signature = validators(models)
+            params = sorted((key, request.GET.getlist(key)) for key in request.GET)
+            vary = repr((view.__name__, params, sorted(kwargs.items()), get_language(request), signature))
+            etag = quote_etag(hashlib.md5(vary.encode('utf-8')).hexdigest())
+            timestamp = int(last_modified) if last_modified else None
+
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response['ETag'] = etag
+                if timestamp is not None:
+                    response['Last-Modified'] = http_date(timestamp)
+                response['Cache-Control'] = cache_control_for(view.__name__, cache_control)
+                if getattr(settings, 'API_ACCEPT_LANGUAGE', False):
+                    patch_vary_headers(response, ['Accept-Language'])
+            return response
+        return wrapper
+    return decorator
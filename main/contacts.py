@@ -0,0 +1,202 @@
+"""
+Public contact form ingestion.
+
+createContact is the only unauthenticated write, so it is guarded before it
+reaches the database:
+
+- token buckets per client IP and per phone number, in process, refuse
+  bursts with 429 (CONTACT_RATE_LIMITS);
+- the same name/phone/message is only stored once per
+  CONTACT_DUPLICATE_WINDOW seconds (its hash is cached once it was saved or
+  queued);
+- with CONTACT_BUFFERED, submissions are queued in memory and inserted with
+  one bulk_create when CONTACT_BUFFER_SIZE are waiting, when the oldest is
+  CONTACT_BUFFER_MAX_AGE seconds old, or when the process exits. A crash
+  loses what is queued, which is the price of not taking the SQLite write
+  lock per submission. When the batch is refused the rows are inserted one
+  by one and those that still fail are logged and dropped. At most
+  CONTACT_BUFFER_MAX_ROWS are queued; past that submissions are saved
+  directly.
+"""
+import atexit
+import collections
+import hashlib
+import logging
+import math
+import re
+import threading
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.forms.models import model_to_dict
+
+from . import caching
+
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBuckets:
+    """
+    Token buckets by key: `burst` requests at once, then one every `period`
+    seconds. At most `maxsize` keys are tracked, least recently used first
+    out.
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.buckets = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, key, burst, period):
+        """
+        Take a token for `key`. Returns 0 when allowed, otherwise the
+        seconds until the next token.
+        """
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) / period)
+            if tokens >= 1:
+                self.buckets[key] = (tokens - 1, now)
+                wait = 0
+            else:
+                self.buckets[key] = (tokens, now)
+                wait = (1 - tokens) * period
+            while len(self.buckets) > self.maxsize:
+                self.buckets.popitem(last=False)
+            return wait
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+buckets = TokenBuckets(getattr(settings, 'CONTACT_RATE_LIMIT_KEYS', 10000))
+
+
+def normalize_phone(phone):
+    return re.sub(r'\D', '', phone or '')
+
+
+def throttle(scope, value):
+    """
+    Seconds to wait before `value` (an IP, a phone) may submit again, as an
+    int for Retry-After, or 0.
+    """
+    limits = getattr(settings, 'CONTACT_RATE_LIMITS', {})
+    if scope not in limits or not value:
+        return 0
+    burst, period = limits[scope]
+    return math.ceil(buckets.take('%s:%s' % (scope, value), burst, period))
+
+
+def submission_key(data):
+    content = '\x00'.join([
+        ' '.join(str(data.get('name', '')).split()).lower(),
+        normalize_phone(data.get('phone')),
+        ' '.join(str(data.get('message', '')).split()).lower(),
+    ])
+    return 'contact:seen:%s' % hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def is_duplicate(data):
+    """
+    Whether the same submission was stored or queued in the last
+    CONTACT_DUPLICATE_WINDOW seconds (see record_submission).
+    """
+    return cache.get(submission_key(data)) is not None
+
+
+def record_submission(data):
+    """
+    Remember a submission once it was saved or queued, so that failed ones
+    can be sent again.
+    """
+    cache.set(submission_key(data), 1, getattr(settings, 'CONTACT_DUPLICATE_WINDOW', 600))
+
+
+class Buffer:
+    """
+    Append-only queue of unsaved rows, flushed with bulk_create.
+    """
+
+    def __init__(self, label):
+        self.label = label
+        self.items = collections.deque()
+        self.lock = threading.Lock()
+        self.timer = None
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, instance):
+        """
+        Queue `instance`. Returns False, without queueing it, when
+        CONTACT_BUFFER_MAX_ROWS rows are already waiting.
+        """
+        with self.lock:
+            if len(self.items) >= getattr(settings, 'CONTACT_BUFFER_MAX_ROWS', 1000):
+                return False
+            self.items.append(instance)
+            full = len(self.items) >= getattr(settings, 'CONTACT_BUFFER_SIZE', 50)
+            if not full and self.timer is None:
+                self.schedule()
+        if full:
+            self.flush()
+        return True
+
+    def schedule(self):
+        # Called with the lock held.
+        self.timer = threading.Timer(getattr(settings, 'CONTACT_BUFFER_MAX_AGE', 5), self.flush_in_thread)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def flush_in_thread(self):
+        try:
+            self.flush()
+        finally:
+            connections.close_all()
+
+    def flush(self):
+        """
+        Insert every queued row. Returns the number inserted.
+        """
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            items = list(self.items)
+            self.items.clear()
+        if not items:
+            return 0
+        model = apps.get_model(self.label)
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create(items)
+            inserted = len(items)
+        except Exception:
+            logger.warning('Could not insert %d buffered %s rows at once, inserting them one by one',
+                           len(items), self.label, exc_info=True)
+            inserted = 0
+            for item in items:
+                try:
+                    with transaction.atomic():
+                        model.objects.bulk_create([item])
+                    inserted += 1
+                except Exception:
+                    logger.exception('Dropped buffered %s row %r', self.label, model_to_dict(item))
+        with self.lock:
+            # Rows queued meanwhile wait for the next round.
+            if self.items and self.timer is None:
+                self.schedule()
+        if inserted:
+            caching.bump_version(model)
+        return inserted
+
+
+buffer = Buffer('main.Contact')
+atexit.register(buffer.flush)
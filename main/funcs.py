@@ -1,22 +1,194 @@
 
-from deep_translator import GoogleTranslator
+import base64
+import datetime
+import json
+
+from django.conf import settings
 from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.translation.trans_real import parse_accept_lang_header
+from rest_framework import status
+from rest_framework.response import Response
+from . import caching, translation
 
 def translate_text(text: str, target_language: str) -> str:
     try:
-        translation = GoogleTranslator(source='auto', target=target_language).translate(text)
-        return translation
+        return translation.translate_text(text, target_language, source='auto')
     except Exception as e:
         return f"Error: {str(e)}"
 
 
-def paginate_queryset(queryset, page_number, page_size):
-    paginator = Paginator(queryset, page_size)
+class CachedCountPaginator(Paginator):
+    """
+    Paginator whose total comes from caching.cached_count, so paging through
+    a list does not run a full COUNT for every page. `count_queryset` can be
+    a cheaper queryset over the same rows (e.g. without annotations).
+    """
+
+    def __init__(self, object_list, per_page, count_queryset=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_queryset = count_queryset
+
+    @cached_property
+    def count(self):
+        if self.count_queryset is not None:
+            return caching.cached_count(self.count_queryset)
+        return caching.cached_count(self.object_list)
+
+
+def paginate_queryset(queryset, page_number, page_size, count_queryset=None):
+    paginator = CachedCountPaginator(queryset, page_size, count_queryset)
     page_obj = paginator.get_page(page_number)
     return {
         'items': page_obj,
-        'page': page_number,
+        'page': page_obj.number,
         'page_size': page_size,
         'total_pages': paginator.num_pages,
         'total_items': paginator.count,
-    }
\ No newline at end of file
+        'has_more': page_obj.has_next(),
+    }
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder rounds datetimes to milliseconds, which would
+        # make keyset comparisons skip or repeat rows.
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values):
+    data = json.dumps(values, cls=CursorEncoder, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """
+    Decode an opaque cursor into its list of ordering values.
+    Raises ValueError for anything that was not produced by encode_cursor.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def paginate_keyset(queryset, cursor, page_size, ordering=('priority', 'uuid')):
+    """
+    Keyset (cursor) pagination: return the page that follows `cursor`.
+
+    The last field of `ordering` must be unique. Fields prefixed with '-' are
+    descending. Only page_size + 1 rows are read, so no COUNT is needed to
+    know whether there is a next page.
+    """
+    queryset = queryset.order_by(*ordering)
+    fields = [field.lstrip('-') for field in ordering]
+
+    if cursor:
+        values = decode_cursor(cursor, len(fields))
+        after = Q()
+        for i, field in enumerate(ordering):
+            lookup = '%s__%s' % (fields[i], 'lt' if field.startswith('-') else 'gt')
+            condition = Q(**{lookup: values[i]})
+            for previous, value in zip(fields[:i], values[:i]):
+                condition &= Q(**{previous: value})
+            after |= condition
+        queryset = queryset.filter(after)
+
+    items = list(queryset[:page_size + 1])
+    has_more = len(items) > page_size
+    items = items[:page_size]
+    return {
+        'items': items,
+        'next_cursor': encode_cursor([getattr(items[-1], field) for field in fields]) if has_more else None,
+        'has_more': has_more,
+    }
+
+
+def get_page_size(request, default=None):
+    default = default or getattr(settings, 'PAGE_SIZE', 100)
+    try:
+        page_size = int(request.GET.get('page_size', default))
+    except ValueError:
+        page_size = default
+    return min(max(page_size, 1), getattr(settings, 'MAX_PAGE_SIZE', 500))
+
+
+def paginate(request, queryset, ordering=('priority', 'uuid'), default_page_size=None, count_queryset=None):
+    """
+    Paginate a queryset from the request's query string.
+
+    With a `cursor` parameter (empty for the first page) keyset pagination is
+    used; otherwise `page`/`page_size` select a page. Raises ValueError for
+    an invalid cursor.
+    """
+    queryset = queryset.order_by(*ordering)
+    page_size = get_page_size(request, default_page_size)
+    if 'cursor' in request.GET:
+        return paginate_keyset(queryset, request.GET.get('cursor'), page_size, ordering)
+    return paginate_queryset(queryset, request.GET.get('page', 1), page_size, count_queryset)
+
+
+def get_language(request):
+    """
+    Language requested through `?lang=`, or through the Accept-Language
+    header when API_ACCEPT_LANGUAGE is enabled. None means all languages.
+    """
+    codes = [code for code, name in settings.LANGUAGES]
+    lang = request.GET.get('lang')
+    if lang:
+        return lang if lang in codes else None
+    if getattr(settings, 'API_ACCEPT_LANGUAGE', False):
+        for code, quality in parse_accept_lang_header(request.META.get('HTTP_ACCEPT_LANGUAGE', '')):
+            code = code.split('-')[0].lower()
+            if code in codes:
+                return code
+    return None
+
+
+def get_list_param(request, name):
+    """
+    A comma-separated query parameter as a list, or None when absent.
+    """
+    if name not in request.GET:
+        return None
+    return [item.strip() for item in request.GET.get(name).split(',') if item.strip()]
+
+
+def client_ip(request):
+    """
+    Address of the client: REMOTE_ADDR, or the META key named by
+    CLIENT_IP_HEADER (e.g. 'HTTP_X_REAL_IP') when behind a proxy that sets it.
+    """
+    header = getattr(settings, 'CLIENT_IP_HEADER', None)
+    address = request.META.get(header) if header else None
+    return (address or request.META.get('REMOTE_ADDR') or '').split(',')[0].strip()
+
+
+def serializer_context(request, ordering=()):
+    return {
+        'lang': get_language(request),
+        'fields': get_list_param(request, 'fields'),
+        'expand': get_list_param(request, 'expand'),
+        'ordering': ordering,
+    }
+
+
+def paginated_response(request, queryset, serializer_class, key, ordering=('priority', 'uuid')):
+    context = serializer_context(request, ordering)
+    count_queryset = queryset.order_by()
+    queryset = serializer_class.setup_queryset(queryset, context)
+    try:
+        page = paginate(request, queryset, ordering, count_queryset=count_queryset)
+    except ValueError as e:
+        return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    items = page.pop('items')
+    data = {key: serializer_class(items, many=True, context=context).data}
+    data.update(page)
+    return Response(data, status=status.HTTP_200_OK)
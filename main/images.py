@@ -0,0 +1,329 @@
+"""
+Image pipeline.
+
+Uploads are stored once, untouched, in the model's source field
+(`image_original` by default). Derivatives (the ResizedImageField sizes) and
+renditions (a ladder of widths in modern formats, for `srcset`) are
+generated afterwards by the 'images' job, from a single decode of the
+source.
+"""
+import base64
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django_resized import ResizedImageField
+from PIL import Image, ImageOps
+
+
+STATUS_PENDING = 'pending'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+STATUS_CHOICES = (
+    (STATUS_PENDING, 'Pending'),
+    (STATUS_DONE, 'Done'),
+    (STATUS_FAILED, 'Failed'),
+)
+
+EXTENSIONS = {
+    'JPEG': '.jpg',
+    'PNG': '.png',
+    'WEBP': '.webp',
+    'AVIF': '.avif',
+    'GIF': '.gif',
+}
+
+CONTENT_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'WEBP': 'image/webp',
+    'AVIF': 'image/avif',
+    'GIF': 'image/gif',
+}
+
+
+# Set by process() next to the renditions.
+PLACEHOLDER_FIELDS = ['placeholder', 'image_width', 'image_height']
+
+ORIENTATION = 0x0112
+
+
+def resized_fields(model):
+    return [field for field in model._meta.fields if isinstance(field, ResizedImageField)]
+
+
+def rendition_widths():
+    return sorted(getattr(settings, 'IMAGE_RENDITION_WIDTHS', (320, 640, 960, 1280)))
+
+
+def rendition_formats():
+    """
+    IMAGE_RENDITION_FORMATS that the installed Pillow can encode (AVIF
+    needs Pillow built with libavif).
+    """
+    Image.init()
+    return [
+        image_format for image_format in getattr(settings, 'IMAGE_RENDITION_FORMATS', ('AVIF', 'WEBP'))
+        if image_format in Image.SAVE
+    ]
+
+
+def rendition_quality(image_format):
+    return getattr(settings, 'IMAGE_RENDITION_QUALITY', {}).get(image_format, 80)
+
+
+def source_file(instance):
+    """
+    The file renditions are made from: the stored original, or for rows
+    uploaded before originals were kept, the largest derivative.
+    """
+    source = getattr(instance, instance.image_source_field)
+    if source:
+        return source
+    fields = sorted(resized_fields(type(instance)), key=lambda field: field.size[0] * field.size[1], reverse=True)
+    for field in fields:
+        if getattr(instance, field.attname):
+            return getattr(instance, field.attname)
+    return None
+
+
+def attach_upload(instance, upload):
+    """
+    Store `upload` as the instance's original and schedule its derivatives
+    for when the instance is saved. Does nothing when there is no upload or
+    when it has the same content as the current original.
+    """
+    from .storage import stored_name
+
+    if not upload:
+        return False
+    current = getattr(instance, instance.image_source_field)
+    if current and current.name == stored_name(instance, instance.image_source_field, upload):
+        return False
+    setattr(instance, instance.image_source_field, upload)
+    mark_changed(instance)
+    return True
+
+
+def mark_changed(instance):
+    """
+    Schedule the derivatives of a new source for after the save, and drop
+    the renditions, placeholder and size of the previous one meanwhile.
+    """
+    instance.image_status = STATUS_PENDING
+    instance.renditions = []
+    instance.placeholder = ''
+    instance.image_width = instance.image_height = None
+    instance._process_images = True
+
+
+def before_save(instance):
+    """
+    Called by Main.save: a new file assigned to the source field without
+    attach_upload (admin, serializers) is processed too.
+    """
+    field_name = getattr(instance, 'image_source_field', None)
+    if field_name is None or instance.__dict__.get('_process_images'):
+        return
+    if field_name in instance.get_deferred_fields():
+        return
+    source = getattr(instance, field_name)
+    if source and not source._committed:
+        mark_changed(instance)
+
+
+def open_source(source, max_size=None):
+    """
+    Decode the source image once, upright, in a mode every output format
+    accepts. With `max_size`, JPEG sources are decoded directly at a reduced
+    scale that is still at least that large. Returns the image, the source
+    format and the intrinsic (upright, full scale) size.
+    """
+    source.open('rb')
+    try:
+        image = Image.open(source)
+        source_format = image.format
+        size = image.size
+        if image.getexif().get(ORIENTATION) in (5, 6, 7, 8):
+            size = size[::-1]
+        if max_size:
+            image.draft('RGB', max_size)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    finally:
+        source.close()
+
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    return image, source_format, size
+
+
+def encode(image, image_format, quality):
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    options = {'optimize': True} if image_format in ('JPEG', 'PNG') else {}
+    if quality and quality > 0:
+        options['quality'] = quality
+    image.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def extension(image_format):
+    return EXTENSIONS.get(image_format, '.' + image_format.lower())
+
+
+def stem(source):
+    return source.name.rsplit('/', 1)[-1].rsplit('.', 1)[0]
+
+
+def derivative_name(instance, field, image_format):
+    return field.generate_filename(instance, stem(getattr(instance, instance.image_source_field)) + extension(image_format))
+
+
+def make_derivatives(instance, image, source_format, fields):
+    updated = []
+    working = image
+    for field in fields:
+        # Fields are processed from the largest size down, so each one is
+        # resized from the previous (smaller) result rather than the source.
+        working = working.copy()
+        working.thumbnail(field.size, Image.Resampling.LANCZOS)
+        image_format = field.force_format or source_format or 'JPEG'
+        data = encode(working, image_format, field.quality)
+        name = field.storage.save(derivative_name(instance, field, image_format), ContentFile(data))
+        setattr(instance, field.attname, name)
+        updated.append(field.attname)
+    return updated
+
+
+def make_renditions(instance, image, source):
+    """
+    Encode `image` at every rendition width not larger than itself (or at
+    its own width when it is smaller than all of them), in every rendition
+    format. Returns the rendition records, smallest first per format.
+    """
+    storage = source.storage
+    widths = [width for width in rendition_widths() if width <= image.width] or [image.width]
+    renditions = []
+    for image_format in rendition_formats():
+        records = []
+        working = image
+        for width in reversed(widths):
+            if width != working.width:
+                height = max(round(working.height * width / working.width), 1)
+                working = working.resize((width, height), Image.Resampling.LANCZOS)
+            data = encode(working, image_format, rendition_quality(image_format))
+            name = 'renditions/%s-%d%s' % (stem(source), width, extension(image_format))
+            records.append({
+                'name': storage.save(name, ContentFile(data)),
+                'format': CONTENT_TYPES.get(image_format, 'image/' + image_format.lower()),
+                'width': working.width,
+                'height': working.height,
+                'bytes': len(data),
+            })
+        renditions += reversed(records)
+    return renditions
+
+
+def make_placeholder(image):
+    """
+    A tiny blurred preview of `image` as a data URI, to paint while the
+    real image loads.
+    """
+    size = getattr(settings, 'IMAGE_PLACEHOLDER_SIZE', 20)
+    preview = image.copy()
+    preview.thumbnail((size, size), Image.Resampling.BILINEAR)
+    image_format = 'WEBP' if 'WEBP' in rendition_formats() else 'JPEG'
+    data = encode(preview, image_format, getattr(settings, 'IMAGE_PLACEHOLDER_QUALITY', 30))
+    return 'data:%s;base64,%s' % (CONTENT_TYPES[image_format], base64.b64encode(data).decode('ascii'))
+
+
+def reuse(instance):
+    """
+    Copy the derivatives and renditions of another row of the same model
+    whose original has the same content (and therefore the same name).
+    Returns the names of the fields that were written, or None.
+    """
+    source = getattr(instance, instance.image_source_field)
+    if not source:
+        return None
+    fields = [field.attname for field in resized_fields(type(instance))] + ['renditions'] + PLACEHOLDER_FIELDS
+    done = (
+        type(instance).objects
+        .filter(**{instance.image_source_field: source.name, 'image_status': STATUS_DONE})
+        .exclude(pk=instance.pk)
+        .only(*fields)
+        .first()
+    )
+    if done is None:
+        return None
+    for name in fields:
+        setattr(instance, name, getattr(done, name))
+    instance.image_status = STATUS_DONE
+    instance.save(update_fields=fields + ['image_status', 'updated_at'])
+    return fields
+
+
+def process(instance):
+    """
+    Generate the ResizedImageFields and the renditions of the instance from
+    its source and save them. Returns the names of the fields that were
+    written.
+    """
+    reused = reuse(instance)
+    if reused is not None:
+        return reused
+
+    source = source_file(instance)
+    if source is None:
+        return []
+
+    # Derivatives already exist when renditions are made from one of them.
+    fields = []
+    if getattr(instance, instance.image_source_field):
+        fields = sorted(resized_fields(type(instance)), key=lambda field: field.size[0] * field.size[1], reverse=True)
+    largest = (
+        max([field.size[0] for field in fields] + rendition_widths()),
+        max([field.size[1] for field in fields] + [1]),
+    )
+    image, source_format, (width, height) = open_source(source, largest)
+
+    updated = make_derivatives(instance, image, source_format, fields)
+    instance.renditions = make_renditions(instance, image, source)
+    instance.placeholder = make_placeholder(image)
+    instance.image_width, instance.image_height = width, height
+    updated += ['renditions'] + PLACEHOLDER_FIELDS
+    instance.image_status = STATUS_DONE
+    instance.save(update_fields=updated + ['image_status', 'updated_at'])
+    return updated
+
+
+def run_job(instance, job):
+    """
+    Job handler for kind 'images'.
+    """
+    try:
+        process(instance)
+    except Exception:
+        if job.is_last_attempt:
+            instance.image_status = STATUS_FAILED
+            instance.save(update_fields=['image_status'])
+        raise
+
+
+def after_save(instance):
+    """
+    Called by Main.save: process or enqueue images attached with
+    attach_upload.
+    """
+    from . import jobs
+
+    if not instance.__dict__.pop('_process_images', False):
+        return
+    if reuse(instance) is not None:
+        return
+    if getattr(settings, 'IMAGE_PROCESSING_ASYNC', True):
+        jobs.enqueue('images', instance)
+    else:
+        process(instance)
@@ -0,0 +1,125 @@
+"""
+A small database-backed job queue.
+
+Jobs are rows in the Job table pointing at a model instance; the `runjobs`
+management command claims due jobs and dispatches them to the handler
+registered for their kind. No external broker is needed.
+"""
+import datetime
+import traceback
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+
+HANDLERS = {
+    'translate': 'main.translation.run_job',
+    'images': 'main.images.run_job',
+}
+
+
+def max_attempts():
+    return getattr(settings, 'JOB_MAX_ATTEMPTS', 5)
+
+
+def backoff(attempts):
+    """
+    Delay before the next attempt: JOB_RETRY_DELAY doubled per failed
+    attempt, capped at one hour.
+    """
+    delay = getattr(settings, 'JOB_RETRY_DELAY', 10) * 2 ** max(attempts - 1, 0)
+    return datetime.timedelta(seconds=min(delay, 3600))
+
+
+def enqueue(kind, instance, delay=0):
+    from .models import Job
+
+    return Job.objects.create(
+        kind=kind,
+        content_type=ContentType.objects.get_for_model(instance),
+        object_id=instance.pk,
+        available_at=timezone.now() + datetime.timedelta(seconds=delay),
+    )
+
+
+def enqueue_many(kind, instances):
+    from .models import Job
+
+    if not instances:
+        return []
+    content_type = ContentType.objects.get_for_model(instances[0])
+    now = timezone.now()
+    return Job.objects.bulk_create([
+        Job(kind=kind, content_type=content_type, object_id=instance.pk, available_at=now)
+        for instance in instances
+    ])
+
+
+def claim(limit=10, kinds=None):
+    """
+    Mark up to `limit` due jobs as running and return them.
+
+    Each job is claimed with a conditional UPDATE so that several workers can
+    poll the same table without running a job twice. Jobs left running by a
+    crashed worker for longer than JOB_TIMEOUT seconds are claimed again.
+    """
+    from .models import Job
+
+    now = timezone.now()
+    stale = now - datetime.timedelta(seconds=getattr(settings, 'JOB_TIMEOUT', 600))
+    due = (
+        Q(status=Job.STATUS_PENDING, available_at__lte=now)
+        | Q(status=Job.STATUS_RUNNING, updated_at__lt=stale)
+    )
+    candidates = Job.objects.filter(due)
+    if kinds:
+        candidates = candidates.filter(kind__in=kinds)
+
+    claimed = []
+    for job in candidates.order_by('available_at')[:limit]:
+        updated = Job.objects.filter(pk=job.pk, status=job.status, updated_at=job.updated_at).update(
+            status=Job.STATUS_RUNNING,
+            attempts=F('attempts') + 1,
+            updated_at=now,
+        )
+        if updated:
+            job.refresh_from_db()
+            claimed.append(job)
+    return claimed
+
+
+def run(job):
+    from .models import Job
+
+    handler = import_string(HANDLERS[job.kind])
+    try:
+        instance = job.content_type.get_object_for_this_type(pk=job.object_id)
+    except ObjectDoesNotExist:
+        instance = None
+
+    try:
+        if instance is not None:
+            handler(instance, job)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.is_last_attempt:
+            job.status = Job.STATUS_FAILED
+        else:
+            job.status = Job.STATUS_PENDING
+            job.available_at = timezone.now() + backoff(job.attempts)
+    else:
+        job.status = Job.STATUS_DONE
+        job.last_error = ''
+    job.save()
+    return job
+
+
+def run_pending(limit=10, kinds=None):
+    """
+    Claim and run one round of due jobs. Returns the jobs that were run.
+    """
+    return [run(job) for job in claim(limit, kinds)]
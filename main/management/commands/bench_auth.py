@@ -0,0 +1,52 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from main.auth import authentication
+from main.auth.authentication import CachedTokenAuthentication
+
+
+def make_view(authentication_class):
+    @api_view(['GET'])
+    @authentication_classes([authentication_class])
+    @permission_classes([IsAuthenticated])
+    def view(request):
+        return Response({'user': request.user.pk})
+    return view
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare authenticated requests per second with TokenAuthentication and "
+        "CachedTokenAuthentication, in process (a temporary user is created and removed)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000)
+        parser.add_argument('--users', type=int, default=100)
+
+    def handle(self, *args, **options):
+        marker = 'bench-auth-%d' % time.time_ns()
+        users = [User.objects.create_user('%s-%d' % (marker, i)) for i in range(options['users'])]
+        try:
+            keys = [Token.objects.create(user=user).key for user in users]
+            factory = RequestFactory()
+            authentication.tokens.clear()
+            for name, authentication_class in (('token', TokenAuthentication), ('cached', CachedTokenAuthentication)):
+                view = make_view(authentication_class)
+                start = time.perf_counter()
+                for i in range(options['requests']):
+                    request = factory.get('/', HTTP_AUTHORIZATION='Token %s' % keys[i % len(keys)])
+                    assert view(request).status_code == 200
+                elapsed = time.perf_counter() - start
+                self.stdout.write('%-7s %8.0f requests/s' % (name, options['requests'] / elapsed))
+            self.stdout.write('cache   %s' % authentication.tokens.stats())
+        finally:
+            User.objects.filter(username__startswith=marker).delete()
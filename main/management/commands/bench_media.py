@@ -0,0 +1,60 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory, override_settings
+from django.views.static import serve as static_serve
+
+from main import media
+
+
+MODES = ['static', 'django', 'range', 'not-modified', 'accel', 'sendfile']
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare media responses per second between serving modes, in process. "
+        "'static' is Django's static serve view used before; 'accel' and "
+        "'sendfile' only measure Django's side, the bytes are sent by the front server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--mode', action='append', choices=MODES)
+
+    def handle(self, *args, **options):
+        names = []
+        for root, dirs, files in os.walk(settings.MEDIA_ROOT):
+            for filename in files:
+                if filename.lower().endswith(('.jpg', '.jpeg', '.png', '.webp', '.avif')):
+                    names.append(os.path.relpath(os.path.join(root, filename), settings.MEDIA_ROOT).replace(os.sep, '/'))
+        if not names:
+            raise CommandError('No images under MEDIA_ROOT.')
+
+        factory = RequestFactory()
+        etags = {name: media.serve(factory.head('/media/' + name), name)['ETag'] for name in names}
+        for mode in options['mode'] or MODES:
+            serve_mode = mode if mode in ('accel', 'sendfile') else 'django'
+            with override_settings(MEDIA_SERVE_MODE=serve_mode):
+                total = 0
+                start = time.perf_counter()
+                for i in range(options['requests']):
+                    name = names[i % len(names)]
+                    response = self.request(factory, mode, name, etags[name])
+                    total += sum(len(chunk) for chunk in response)
+                    response.close()
+                elapsed = time.perf_counter() - start
+            self.stdout.write('%-13s %8.0f images/s %8.1f MB/s' % (
+                mode, options['requests'] / elapsed, total / elapsed / 1e6,
+            ))
+
+    def request(self, factory, mode, name, etag):
+        if mode == 'static':
+            return static_serve(factory.get('/media/' + name), name, document_root=settings.MEDIA_ROOT)
+        headers = {}
+        if mode == 'range':
+            headers['HTTP_RANGE'] = 'bytes=0-16383'
+        elif mode == 'not-modified':
+            headers['HTTP_IF_NONE_MATCH'] = etag
+        return media.serve(factory.get('/media/' + name, **headers), name)
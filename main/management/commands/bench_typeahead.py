@@ -0,0 +1,96 @@
+import random
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main import translation, typeahead
+
+
+WORDS = [
+    'yugurish', 'krossovka', 'futbolka', 'shim', 'kurtka', 'sumka', 'soat', 'telefon',
+    'кроссовки', 'футболка', 'куртка', 'сумка', 'часы', 'телефон', 'детский', 'зимний',
+    'running', 'shoes', 'shirt', 'jacket', 'bag', 'watch', 'phone', 'winter', 'kids', 'sport',
+]
+
+
+def percentile(samples, fraction):
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure typeahead lookup latency (p50/p99) and the size of the index, "
+        "built from the database or from --synthetic generated titles."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--synthetic', type=int, default=0, help='Index this many generated products instead of the database rows.')
+        parser.add_argument('--lookups', type=int, default=20000)
+        parser.add_argument('--lang', choices=translation.LANGUAGES)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        tracemalloc.start()
+        start = time.perf_counter()
+        if options['synthetic']:
+            typeahead.index.load(('product', row) for row in self.synthetic(rng, options['synthetic']))
+        else:
+            typeahead.build()
+        built = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        index = typeahead.index
+        if not len(index):
+            raise CommandError('The index is empty: add products/categories or use --synthetic.')
+        keys = [entry[0] for entry in index.entries]
+        prefixes = []
+        for _ in range(options['lookups']):
+            key = rng.choice(keys)
+            prefixes.append(key[:rng.randint(1, min(len(key), 8))])
+
+        # Cold: every lookup scans the array; warm: repeated prefixes are
+        # answered from the memo, as between two writes in production.
+        timings = {}
+        for mode in ('cold', 'warm'):
+            samples = []
+            for prefix in prefixes:
+                if mode == 'cold':
+                    index.memo = {}
+                start = time.perf_counter()
+                index.lookup(prefix, 10, options['lang'])
+                samples.append(time.perf_counter() - start)
+            timings[mode] = sorted(samples)
+
+        updates = []
+        for i in range(min(1000, len(index.rows))):
+            kind, pk = rng.choice(list(index.rows))
+            row = SimpleNamespace(pk=pk, priority=index.rows[kind, pk][0][1], **{
+                'title_%s' % lang: ' '.join(rng.sample(WORDS, 3)) for lang in translation.LANGUAGES
+            })
+            start = time.perf_counter()
+            index.add(kind, row)
+            updates.append(time.perf_counter() - start)
+        updates.sort()
+
+        self.stdout.write('entries      %10d (%d rows, built in %.2f s, ~%.1f MB)' % (
+            len(index), len(index.rows), built, memory / 1e6,
+        ))
+        for mode, samples in timings.items():
+            self.stdout.write('lookup %-5s p50 %7.1f us   p99 %7.1f us   max %7.1f us' % (
+                mode, percentile(samples, 0.5) * 1e6, percentile(samples, 0.99) * 1e6, samples[-1] * 1e6,
+            ))
+        if updates:
+            self.stdout.write('update       p50 %7.1f us   p99 %7.1f us' % (
+                percentile(updates, 0.5) * 1e6, percentile(updates, 0.99) * 1e6,
+            ))
+
+    def synthetic(self, rng, count):
+        for i in range(count):
+            yield SimpleNamespace(pk='p%d' % i, priority=rng.randint(0, 1000), **{
+                'title_%s' % lang: '%s %d' % (' '.join(rng.sample(WORDS, rng.randint(2, 4))), i)
+                for lang in translation.LANGUAGES
+            })
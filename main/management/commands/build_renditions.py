@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from main import images, jobs, models
+
+
+RENDITION_MODELS = [
+    models.Category,
+    models.Product,
+    models.ProductImage,
+    models.Slider,
+    models.Blog,
+    models.CompanyImage,
+]
+
+
+class Command(BaseCommand):
+    help = "Queue renditions and placeholders for images uploaded before they existed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Rebuild rows that already have renditions too.")
+        parser.add_argument('--sync', action='store_true', help="Process here instead of queueing 'images' jobs.")
+
+    def handle(self, *args, **options):
+        total = 0
+        for model in RENDITION_MODELS:
+            rows = model.objects.all()
+            if not options['all']:
+                rows = rows.filter(Q(renditions=[]) | Q(placeholder=''))
+
+            count = 0
+            for row in rows.iterator():
+                if images.source_file(row) is None:
+                    continue
+                if options['sync']:
+                    images.process(row)
+                else:
+                    jobs.enqueue('images', row)
+                count += 1
+            total += count
+            self.stdout.write('%s: %d' % (model._meta.verbose_name_plural, count))
+
+        self.stdout.write(self.style.SUCCESS('%d images %s.' % (total, 'processed' if options['sync'] else 'queued')))
@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from main import schema
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the OpenAPI schema artifacts of the current code version and delete "
+        "those of other versions. With --bench, compare generating the schema "
+        "(as every request did before) with serving the precomputed one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bench', action='store_true')
+        parser.add_argument('--requests', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        paths = schema.generate()
+        generated = time.perf_counter() - start
+        for path in schema.prune():
+            self.stdout.write('Removed %s' % path)
+        for extension, path in paths.items():
+            self.stdout.write('Wrote %s (%d bytes)' % (path, path.stat().st_size))
+        self.stdout.write('Version %s generated in %.1f ms' % (schema.code_version(), generated * 1000))
+        if options['bench']:
+            self.bench(options['requests'])
+
+    def bench(self, requests):
+        factory = RequestFactory()
+        schema.loaded.clear()
+        start = time.perf_counter()
+        schema.serve(factory.get('/api/swagger.json'), '.json')
+        first = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(requests):
+            response = schema.serve(factory.get('/api/swagger.json'), '.json')
+        cached = (time.perf_counter() - start) / requests
+
+        etag = response['ETag']
+        start = time.perf_counter()
+        for _ in range(requests):
+            schema.serve(factory.get('/api/swagger.json', HTTP_IF_NONE_MATCH=etag), '.json')
+        revalidated = (time.perf_counter() - start) / requests
+
+        start = time.perf_counter()
+        schema.OpenAPISchemaGenerator(schema.INFO).get_schema(request=None, public=True)
+        cold = time.perf_counter() - start
+
+        self.stdout.write('cold (introspection)      %9.3f ms' % (cold * 1000))
+        self.stdout.write('first load from artifact  %9.3f ms' % (first * 1000))
+        self.stdout.write('cached 200                %9.3f ms' % (cached * 1000))
+        self.stdout.write('cached 304                %9.3f ms' % (revalidated * 1000))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from main import models, storage
+
+
+MEDIA_MODELS = [
+    models.Category,
+    models.Product,
+    models.ProductImage,
+    models.Slider,
+    models.Blog,
+    models.CompanyImage,
+]
+
+
+class Command(BaseCommand):
+    help = "Delete media files that no row has referenced for MEDIA_RELEASE_GRACE seconds."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recount', action='store_true', help="Rebuild the reference counts from the rows first.")
+        parser.add_argument('--grace', type=int, help="Override MEDIA_RELEASE_GRACE (seconds).")
+        parser.add_argument('--dry-run', action='store_true', help="Only list the files that would be deleted.")
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            counts = storage.recount(MEDIA_MODELS)
+            self.stdout.write('%d referenced files.' % len(counts))
+
+        names = storage.collect(options['grace'], options['dry_run'])
+        for name in names:
+            self.stdout.write(name)
+        self.stdout.write(self.style.SUCCESS('%d files %s.' % (len(names), 'to delete' if options['dry_run'] else 'deleted')))
@@ -0,0 +1,71 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections
+
+from main import models
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure database read/write throughput under concurrency: reader threads "
+        "list products, writer threads create contacts (removed afterwards)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=10.0)
+
+    def handle(self, *args, **options):
+        deadline = time.monotonic() + options['seconds']
+        lock = threading.Lock()
+        counts = {'reads': 0, 'writes': 0, 'errors': 0}
+        latencies = {'reads': [], 'writes': []}
+        marker = 'loadtest-%d' % time.time_ns()
+
+        def read():
+            list(models.Product.objects.filter(is_active=True).order_by('priority', 'uuid')[:12])
+
+        def write():
+            models.Contact.objects.create(name=marker, phone='0', message='load test')
+
+        def worker(kind, operation):
+            try:
+                while time.monotonic() < deadline:
+                    start = time.perf_counter()
+                    try:
+                        operation()
+                    except OperationalError:
+                        with lock:
+                            counts['errors'] += 1
+                        continue
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        counts[kind] += 1
+                        latencies[kind].append(elapsed)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=('reads', read)) for _ in range(options['readers'])]
+        threads += [threading.Thread(target=worker, args=('writes', write)) for _ in range(options['writers'])]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        models.Contact.objects.filter(name=marker).delete()
+
+        self.stdout.write('%s, %d readers, %d writers, %.1fs' % (
+            connection.vendor, options['readers'], options['writers'], elapsed,
+        ))
+        for kind in ('reads', 'writes'):
+            samples = sorted(latencies[kind]) or [0]
+            self.stdout.write('%-6s %8.0f/s  p50 %6.1fms  p99 %6.1fms' % (
+                kind, counts[kind] / elapsed,
+                samples[len(samples) // 2] * 1000, samples[int(len(samples) * 0.99)] * 1000,
+            ))
+        self.stdout.write('errors %d' % counts['errors'])
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from main import caching, search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product/blog search index from the active rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        search.setup()
+        counts = search.rebuild(options['batch_size'])
+        for kind in counts:
+            caching.bump_version(search.model_for(kind))
+        self.stdout.write(self.style.SUCCESS(
+            'Indexed %s.' % ', '.join('%d %ss' % (count, kind) for kind, count in counts.items())
+        ))
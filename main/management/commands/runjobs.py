@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main import jobs
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (translations, ...)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', action='append', choices=sorted(jobs.HANDLERS), help="Only run jobs of this kind.")
+        parser.add_argument('--limit', type=int, default=10, help="Jobs claimed per round.")
+        parser.add_argument('--sleep', type=float, default=1.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--once', action='store_true', help="Exit when the queue is empty.")
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                done = jobs.run_pending(options['limit'], options['kind'])
+                for job in done:
+                    self.stdout.write('%s %s' % (job, job.status))
+                if not done:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+
+from main import models, translation
+
+
+WARM_MODELS = [
+    models.Category,
+    models.Product,
+    models.Slider,
+    models.Blog,
+    models.Company,
+]
+
+
+class Command(BaseCommand):
+    help = "Fill the translation memory from rows that already have _ru/_en translations."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        total = 0
+        for model in WARM_MODELS:
+            pairs = {lang: {} for lang in translation.TARGET_LANGUAGES}
+            fields = list(translation.translatable_fields(model()))
+            only = ['uuid'] + [name for name, siblings in fields] + [
+                field for name, siblings in fields for lang, field in siblings
+            ]
+
+            for row in model.objects.only(*only).iterator(chunk_size=options['batch_size']):
+                for name, siblings in fields:
+                    source = getattr(row, name)
+                    if not source:
+                        continue
+                    segments = translation.Document(source).segments
+                    for lang, field in siblings:
+                        target = getattr(row, field)
+                        if not target:
+                            continue
+                        translated = translation.Document(target).segments
+                        # Only trust rows whose markup lines up node for node.
+                        if len(translated) != len(segments):
+                            continue
+                        pairs[lang].update(zip(segments, translated))
+
+            for lang, known in pairs.items():
+                translation.memory.remember(known, lang)
+                total += len(known)
+            self.stdout.write('%s: %s' % (
+                model._meta.verbose_name_plural,
+                ', '.join('%s=%d' % (lang, len(known)) for lang, known in pairs.items()),
+            ))
+
+        self.stdout.write(self.style.SUCCESS('Translation memory warmed with %d segments.' % total))
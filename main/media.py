@@ -0,0 +1,147 @@
+"""
+Media file serving.
+
+Content-addressed files (see main.storage) never change under their name, so
+they are served with a far-future immutable Cache-Control. The bytes are
+sent according to MEDIA_SERVE_MODE:
+
+- 'django': a FileResponse, which WSGI servers with `wsgi.file_wrapper`
+  (gunicorn, uWSGI) send with sendfile(2); Range requests are answered here;
+- 'accel': an empty response with X-Accel-Redirect to MEDIA_ACCEL_PREFIX,
+  for nginx (`location <prefix> { internal; alias <MEDIA_ROOT>/; }`);
+- 'sendfile': an empty response with X-Sendfile, for Apache mod_xsendfile
+  and lighttpd.
+
+In the offload modes the front server handles Range itself.
+"""
+import mimetypes
+import os
+import re
+import stat as statlib
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+from .storage import is_hashed_name
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def cache_control(name):
+    if is_hashed_name(name):
+        return getattr(settings, 'MEDIA_IMMUTABLE_CACHE_CONTROL', 'public, max-age=31536000, immutable')
+    return getattr(settings, 'MEDIA_CACHE_CONTROL', 'public, max-age=86400')
+
+
+def parse_range(header, size):
+    """
+    (start, end) of a single `bytes=` range, inclusive; None when the header
+    is missing or not a single range (the whole file is sent then), and
+    False when it cannot be satisfied.
+    """
+    match = RANGE_RE.match(header or '')
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if not length:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def read_range(handle, start, length):
+    try:
+        handle.seek(start)
+        while length > 0:
+            chunk = handle.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        handle.close()
+
+
+def offload(name, path, mode):
+    response = HttpResponse()
+    if mode == 'accel':
+        prefix = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(name)
+    else:
+        response['X-Sendfile'] = path
+    # Let the front server set the type from the file it sends.
+    del response['Content-Type']
+    return response
+
+
+def file_response(request, path, size, etag):
+    content_type, encoding = mimetypes.guess_type(path)
+    content_type = content_type or 'application/octet-stream'
+
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    if not if_range or if_range == etag:
+        byte_range = parse_range(request.headers.get('Range'), size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */%d' % size
+        return response
+
+    if byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            read_range(open(path, 'rb'), start, end - start + 1),
+            status=206,
+            content_type=content_type,
+        )
+        response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+        response['Content-Length'] = str(end - start + 1)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+@require_safe
+def serve(request, path):
+    name = path.lstrip('/')
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, name)
+        stat = os.stat(full_path)
+    except (OSError, ValueError, SuspiciousFileOperation):
+        raise Http404('File not found')
+    if not statlib.S_ISREG(stat.st_mode):
+        raise Http404('File not found')
+
+    etag = quote_etag('%x-%x' % (int(stat.st_mtime), stat.st_size))
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        mode = getattr(settings, 'MEDIA_SERVE_MODE', 'django')
+        if mode in ('accel', 'sendfile'):
+            response = offload(name, full_path, mode)
+        else:
+            response = file_response(request, full_path, stat.st_size, etag)
+    if response.status_code in (200, 206, 304):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Cache-Control'] = cache_control(name)
+    return response
@@ -1,8 +1,17 @@
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
 from django.db import models
+from django.utils import timezone
 from shortuuidfield import ShortUUIDField
 from django_resized import ResizedImageField
-from deep_translator import GoogleTranslator
-from bs4 import BeautifulSoup
+from . import caching, images, jobs, search, storage, translation, typeahead
+
+
+# Condition of the partial indexes behind the `is_active=True` list queries.
+# Django renders both as a bare `WHERE "is_active"`, which lets SQLite match
+# them (it cannot use an index whose leading column is only tested for
+# truth).
+ACTIVE = models.Q(is_active=True)
 
 
 class Main(models.Model):
@@ -10,35 +19,87 @@ class Main(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+    translation_status = models.CharField(max_length=16, choices=translation.STATUS_CHOICES, default=translation.STATUS_DONE)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        storage.remember(instance, field_names, values)
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        storage.remember(self)
 
     def translate_html(self, html_text, target_lang):
-        soup = BeautifulSoup(html_text, "html.parser")
-        for text in soup.find_all(text=True):
-            translated_text = GoogleTranslator(source='uz', target=target_lang).translate(text.strip())
-            text.replace_with(translated_text)
-        return str(soup)
+        return translation.translate_html(html_text, target_lang)
 
     def save(self, *args, **kwargs):
-        if not self.uuid:
-            for field in self._meta.fields:
-                if field.name.endswith('_uz'):
-                    uz_value = getattr(self, field.name)
-                    ru_field_name = field.name.replace('_uz', '_ru')
-                    en_field_name = field.name.replace('_uz', '_en')
-
-                    if uz_value:
-                        if hasattr(self, ru_field_name):
-                            setattr(self, ru_field_name, self.translate_html(uz_value, 'ru'))
-                        if hasattr(self, en_field_name):
-                            setattr(self, en_field_name, self.translate_html(uz_value, 'en'))
+        images.before_save(self)
+        enqueue_translation = False
+        if not self.uuid and translation.needs_translation(self):
+            if getattr(settings, 'TRANSLATION_ASYNC', True):
+                # Translations are filled later by the `runjobs` worker.
+                self.translation_status = translation.STATUS_PENDING
+                enqueue_translation = True
+            else:
+                translation.translate_instance(self)
 
         super(Main, self).save(*args, **kwargs)
+        caching.bump_version(type(self))
+        storage.update_references(self)
+        search.update(self, kwargs.get('update_fields'))
+        typeahead.update(self, kwargs.get('update_fields'))
+
+        if enqueue_translation:
+            jobs.enqueue('translate', self)
+        images.after_save(self)
+
+    def delete(self, *args, **kwargs):
+        result = super(Main, self).delete(*args, **kwargs)
+        caching.bump_version(type(self))
+        storage.release_references(self)
+        search.remove(self)
+        typeahead.remove(self)
+        return result
+
+    class Meta:
+        abstract = True
+
+
+class ImageRenditions(models.Model):
+    """
+    Responsive renditions of `image_source_field`, its intrinsic size and a
+    tiny placeholder (a data URI), generated in the background (see
+    main.images). Each rendition is recorded as
+    {name, format, width, height, bytes}.
+    """
+    image_source_field = 'image'
+
+    renditions = models.JSONField(default=list, blank=True)
+    placeholder = models.TextField(blank=True, default='')
+    image_width = models.PositiveIntegerField(null=True, blank=True)
+    image_height = models.PositiveIntegerField(null=True, blank=True)
+    image_status = models.CharField(max_length=16, choices=images.STATUS_CHOICES, default=images.STATUS_DONE)
+
+    class Meta:
+        abstract = True
+
+
+class ImagePipeline(ImageRenditions):
+    """
+    Keeps the uploaded original; the ResizedImageFields of the model are
+    generated from it in the background, together with the renditions.
+    """
+    image_source_field = 'image_original'
+
+    image_original = models.ImageField(upload_to='originals/', null=True, blank=True)
 
     class Meta:
         abstract = True
 
 
-class Category(Main):
+class Category(ImageRenditions, Main):
     title_uz = models.CharField(max_length=255)
     title_ru = models.CharField(max_length=255, null=True, blank=True)
     title_en = models.CharField(max_length=255, null=True, blank=True)
@@ -55,9 +116,35 @@ class Category(Main):
         verbose_name = 'Category'
         verbose_name_plural = 'Categories'
         ordering = ('priority',)
+        indexes = [
+            models.Index(fields=['priority', 'uuid'], condition=ACTIVE, name='category_active_priority_idx'),
+        ]
+
 
+class ProductQuerySet(models.QuerySet):
+    def with_category(self):
+        return self.select_related('category')
 
-class Product(Main):
+    def with_images(self):
+        return self.prefetch_related(models.Prefetch(
+            'productimage_set',
+            queryset=ProductImage.objects.filter(is_active=True),
+            to_attr='active_images',
+        ))
+
+    def with_image_count(self):
+        return self.annotate(image_count=models.Count(
+            'productimage', filter=models.Q(productimage__is_active=True),
+        ))
+
+    def for_serializer(self):
+        """
+        Everything ProductSerializer reads, in a constant number of queries.
+        """
+        return self.with_category().with_images().with_image_count()
+
+
+class Product(ImagePipeline, Main):
     title_uz = models.CharField(max_length=255)
     title_ru = models.CharField(max_length=255, null=True, blank=True)
     title_en = models.CharField(max_length=255, null=True, blank=True)
@@ -66,29 +153,39 @@ class Product(Main):
     description_en = models.TextField(null=True, blank=True)
     price = models.DecimalField(max_digits=20, decimal_places=2)
     
-    image_min = ResizedImageField(size = [300,300], quality=100, upload_to='product_images/300/')
-    image_max = ResizedImageField(size = [600,600], quality=100, upload_to='product_images/600/')
+    image_min = ResizedImageField(size = [300,300], quality=85, upload_to='product_images/300/', null=True, blank=True)
+    image_max = ResizedImageField(size = [600,600], quality=85, upload_to='product_images/600/', null=True, blank=True)
 
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     priority = models.IntegerField(default=0)
+
+    objects = ProductQuerySet.as_manager()
     
     def __str__(self):
         return self.title_uz
     
     @property
     def total_images(self):
-        return self.productimage_set.count()
+        if hasattr(self, 'image_count'):
+            return self.image_count
+        if hasattr(self, 'active_images'):
+            return len(self.active_images)
+        return self.productimage_set.filter(is_active=True).count()
 
     class Meta:
         verbose_name = 'Product'
 
         verbose_name_plural = 'Products'
         ordering = ('priority',)
+        indexes = [
+            models.Index(fields=['priority', 'uuid'], condition=ACTIVE, name='product_active_priority_idx'),
+            models.Index(fields=['category', 'priority', 'uuid'], condition=ACTIVE, name='product_category_priority_idx'),
+        ]
 
 
-class ProductImage(Main):
-    image_min = ResizedImageField(size = [300,300], quality=100, upload_to='product_images/300/')
-    image_max = ResizedImageField(size = [600,600], quality=100, upload_to='product_images/600/')
+class ProductImage(ImagePipeline, Main):
+    image_min = ResizedImageField(size = [300,300], quality=85, upload_to='product_images/300/', null=True, blank=True)
+    image_max = ResizedImageField(size = [600,600], quality=85, upload_to='product_images/600/', null=True, blank=True)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
 
     def __str__(self):
@@ -98,9 +195,13 @@ class ProductImage(Main):
         verbose_name = 'Product Image'
         verbose_name_plural = 'Product Images'
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['-created_at', 'uuid'], condition=ACTIVE, name='productimage_active_idx'),
+            models.Index(fields=['product', '-created_at', 'uuid'], condition=ACTIVE, name='productimage_product_idx'),
+        ]
 
 
-class Slider(Main):
+class Slider(ImagePipeline, Main):
     title_uz = models.CharField(max_length=255)
     title_ru = models.CharField(max_length=255, null=True, blank=True)
     title_en = models.CharField(max_length=255, null=True, blank=True)
@@ -108,8 +209,8 @@ class Slider(Main):
     description_ru = models.TextField(null=True, blank=True)
     description_en = models.TextField(null=True, blank=True)
 
-    image_min = ResizedImageField(size = [300,300], quality=100, upload_to='product_images/300/', null=True, blank=True)
-    image_max = ResizedImageField(size = [1200,600], quality=100, upload_to='product_images/600/', null=True, blank=True)
+    image_min = ResizedImageField(size = [300,300], quality=85, upload_to='product_images/300/', null=True, blank=True)
+    image_max = ResizedImageField(size = [1200,600], quality=85, upload_to='product_images/600/', null=True, blank=True)
 
     priority = models.IntegerField(default=0)
 
@@ -120,9 +221,12 @@ class Slider(Main):
         verbose_name = 'Slider'
         verbose_name_plural = 'Sliders'
         ordering = ('priority',)
+        indexes = [
+            models.Index(fields=['priority', 'uuid'], condition=ACTIVE, name='slider_active_priority_idx'),
+        ]
 
 
-class Blog(Main):
+class Blog(ImagePipeline, Main):
     title_uz = models.CharField(max_length=255)
     title_ru = models.CharField(max_length=255, null=True, blank=True)
     title_en = models.CharField(max_length=255, null=True, blank=True)
@@ -130,8 +234,8 @@ class Blog(Main):
     description_ru = models.TextField(null=True, blank=True)
     description_en = models.TextField(null=True, blank=True)
 
-    image_min = ResizedImageField(size = [300,300], quality=100, upload_to='product_images/300/', null=True, blank=True)
-    image_max = ResizedImageField(size = [1200,600], quality=100, upload_to='product_images/600/', null=True, blank=True)
+    image_min = ResizedImageField(size = [300,300], quality=85, upload_to='product_images/300/', null=True, blank=True)
+    image_max = ResizedImageField(size = [1200,600], quality=85, upload_to='product_images/600/', null=True, blank=True)
 
     priority = models.IntegerField(default=0)
 
@@ -142,6 +246,9 @@ class Blog(Main):
         verbose_name = 'Blog'
         verbose_name_plural = 'Blogs'
         ordering = ('priority',)
+        indexes = [
+            models.Index(fields=['priority', 'uuid'], condition=ACTIVE, name='blog_active_priority_idx'),
+        ]
 
 
 
@@ -190,7 +297,7 @@ class CompanyAddress(Main):
         verbose_name_plural = 'Company Addresses'
 
 
-class CompanyImage(Main):
+class CompanyImage(ImageRenditions, Main):
     image = models.ImageField(upload_to='company_images/')
 
     def __str__(self):
@@ -236,8 +343,91 @@ class Contact(Main):
         verbose_name_plural = 'Contacts'
 
 
+class TranslationMemory(models.Model):
+    source_hash = models.CharField(max_length=64)
+    target_lang = models.CharField(max_length=8)
+    source_text = models.TextField()
+    translated_text = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.source_text[:50]
 
+    class Meta:
+        verbose_name = 'Translation Memory'
+        verbose_name_plural = 'Translation Memory'
+        unique_together = ('source_hash', 'target_lang')
 
 
+class SearchDocument(models.Model):
+    """
+    Searchable text of a Product or Blog, in all languages (see
+    main.search for the text index built over this table).
+    """
+    kind = models.CharField(max_length=16)
+    object_id = models.CharField(max_length=64)
+    title = models.TextField(blank=True, default='')
+    body = models.TextField(blank=True, default='')
 
+    def __str__(self):
+        return '%s:%s' % (self.kind, self.object_id)
 
+    class Meta:
+        verbose_name = 'Search Document'
+        verbose_name_plural = 'Search Documents'
+        unique_together = ('kind', 'object_id')
+
+
+class MediaFile(models.Model):
+    """
+    Reference count of a file in the content-addressed media storage (see
+    main.storage).
+    """
+    name = models.CharField(max_length=255, primary_key=True)
+    refs = models.IntegerField(default=0)
+    released_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = 'Media File'
+        verbose_name_plural = 'Media Files'
+
+
+class Job(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    )
+
+    kind = models.CharField(max_length=32)
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.CharField(max_length=64)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    available_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return '%s %s:%s' % (self.kind, self.content_type_id, self.object_id)
+
+    @property
+    def is_last_attempt(self):
+        return self.attempts >= jobs.max_attempts()
+
+    class Meta:
+        verbose_name = 'Job'
+        verbose_name_plural = 'Jobs'
+        ordering = ('available_at',)
+        indexes = [
+            models.Index(fields=['status', 'available_at']),
+        ]
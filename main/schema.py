@@ -0,0 +1,160 @@
+"""
+Precomputed OpenAPI schema.
+
+Introspecting every view for the schema takes a long time, so it is done once
+per code version: `build_schema` (or the first request after a deploy) writes
+`<SCHEMA_ROOT>/openapi-<version>.json` and `.yaml`, and they are then served
+from memory with an ETag. The version is a hash of the project's Python
+sources and of the installed API libraries, or SCHEMA_VERSION when set
+(e.g. the commit being deployed). The Swagger UI and ReDoc pages are
+rendered without a schema: the browser fetches it from SPEC_URL.
+"""
+import functools
+import hashlib
+import os
+import tempfile
+import threading
+from importlib import metadata
+from pathlib import Path
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_safe
+from drf_yasg import openapi
+from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+from drf_yasg.generators import OpenAPISchemaGenerator
+from drf_yasg.renderers import ReDocRenderer, SwaggerUIRenderer
+
+
+INFO = openapi.Info(
+    title="API Documentation",
+    default_version='v1',
+    description="API documentation for your project",
+)
+
+# format -> (codec, content type)
+FORMATS = {
+    '.json': (OpenAPICodecJson, 'application/json'),
+    '.yaml': (OpenAPICodecYaml, 'application/yaml'),
+}
+
+UI_RENDERERS = {
+    'swagger': SwaggerUIRenderer,
+    'redoc': ReDocRenderer,
+}
+
+SOURCE_DIRS = ('main', 'config')
+PACKAGES = ('Django', 'djangorestframework', 'drf-yasg')
+
+lock = threading.Lock()
+loaded = {}
+
+
+@functools.lru_cache(maxsize=None)
+def code_version():
+    version = getattr(settings, 'SCHEMA_VERSION', None)
+    if version:
+        return str(version)
+    digest = hashlib.sha256()
+    for package in PACKAGES:
+        try:
+            digest.update(('%s=%s;' % (package, metadata.version(package))).encode('utf-8'))
+        except metadata.PackageNotFoundError:
+            pass
+    for directory in SOURCE_DIRS:
+        for path in sorted(Path(settings.BASE_DIR, directory).rglob('*.py')):
+            digest.update(str(path.relative_to(settings.BASE_DIR)).encode('utf-8'))
+            digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def schema_root():
+    return Path(getattr(settings, 'SCHEMA_ROOT', Path(settings.BASE_DIR, 'schema')))
+
+
+def artifact_path(version, extension):
+    return schema_root() / ('openapi-%s%s' % (version, extension))
+
+
+def generate(version=None):
+    """
+    Introspect the views and write the artifacts of `version` (default: the
+    current one). Returns {format: path}.
+    """
+    version = version or code_version()
+    schema = OpenAPISchemaGenerator(INFO).get_schema(request=None, public=True)
+    root = schema_root()
+    root.mkdir(parents=True, exist_ok=True)
+    paths = {}
+    for extension, (codec, content_type) in FORMATS.items():
+        content = codec(validators=[]).encode(schema)
+        path = artifact_path(version, extension)
+        # Write then rename, so that other processes never read half a file.
+        handle, temporary = tempfile.mkstemp(dir=root, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as temporary_file:
+            temporary_file.write(content)
+        os.replace(temporary, path)
+        paths[extension] = path
+    return paths
+
+
+def prune(version=None):
+    """
+    Delete the artifacts of other versions. Returns their paths.
+    """
+    keep = {artifact_path(version or code_version(), extension) for extension in FORMATS}
+    removed = [path for path in schema_root().glob('openapi-*') if path not in keep]
+    for path in removed:
+        path.unlink()
+    return removed
+
+
+def load(extension):
+    """
+    (content, etag) of the current schema in `extension`, generated when the
+    artifact of this code version does not exist yet.
+    """
+    version = code_version()
+    found = loaded.get((version, extension))
+    if found is not None:
+        return found
+    with lock:
+        found = loaded.get((version, extension))
+        if found is None:
+            path = artifact_path(version, extension)
+            if not path.exists():
+                generate(version)
+            content = path.read_bytes()
+            etag = quote_etag('%s-%s' % (version, hashlib.sha256(content).hexdigest()[:16]))
+            found = loaded[version, extension] = (content, etag)
+    return found
+
+
+@require_safe
+def serve(request, format):
+    if format not in FORMATS:
+        raise Http404('Unknown schema format')
+    content, etag = load(format)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(content, content_type=FORMATS[format][1])
+    response['ETag'] = etag
+    response['Cache-Control'] = getattr(settings, 'SCHEMA_CACHE_CONTROL', 'public, max-age=3600')
+    return response
+
+
+@never_cache
+@require_safe
+def ui(request, renderer):
+    """
+    The Swagger UI or ReDoc page. Only INFO is needed to render it, unlike
+    drf_yasg's SchemaView which generates a schema for every page view.
+    """
+    renderer = UI_RENDERERS[renderer]()
+    context = {'request': request}
+    renderer.set_context(context, openapi.Swagger(info=INFO, _prefix='/', paths=openapi.Paths({})))
+    return HttpResponse(render_to_string(renderer.template, context, request))
@@ -0,0 +1,246 @@
+"""
+Full-text search over products and blogs.
+
+Every active Product/Blog has a SearchDocument row with its titles and its
+descriptions (HTML stripped) in all languages, kept up to date by Main.save.
+The text index over those rows is created after migrate, with raw SQL for
+the backend in use:
+
+- SQLite: an FTS5 external-content table kept in sync by triggers, ranked
+  with bm25 and with prefix indexes for autocomplete;
+- PostgreSQL: a generated `tsvector` column with a GIN index, ranked with
+  ts_rank.
+
+Other backends fall back to icontains over the documents.
+"""
+import math
+import re
+
+from bs4 import BeautifulSoup
+from django.db import connection
+from django.db.models import Q
+
+from . import translation
+
+
+# kind -> model label; resolved lazily because models import this module.
+KINDS = {
+    'product': 'main.Product',
+    'blog': 'main.Blog',
+}
+
+INDEXED_FIELDS = ('title', 'description')
+
+TABLE = 'main_searchdocument'
+FTS_TABLE = 'main_searchdocument_fts'
+
+SQLITE_SETUP = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+        kind, title, body, content='{table}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    # Title matches weigh ten times more than description matches.
+    "INSERT INTO {fts}({fts}, rank) VALUES ('rank', 'bm25(0.0, 10.0, 1.0)')",
+    """
+    CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+        INSERT INTO {fts}(rowid, kind, title, body) VALUES (new.id, new.kind, new.title, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+        INSERT INTO {fts}({fts}, rowid, kind, title, body) VALUES ('delete', old.id, old.kind, old.title, old.body);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN
+        INSERT INTO {fts}({fts}, rowid, kind, title, body) VALUES ('delete', old.id, old.kind, old.title, old.body);
+        INSERT INTO {fts}(rowid, kind, title, body) VALUES (new.id, new.kind, new.title, new.body);
+    END
+    """,
+]
+
+POSTGRESQL_SETUP = [
+    """
+    ALTER TABLE {table} ADD COLUMN IF NOT EXISTS vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A')
+        || setweight(to_tsvector('simple', coalesce(body, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS {table}_vector_idx ON {table} USING GIN (vector)",
+]
+
+
+def setup(using=None, **kwargs):
+    """
+    post_migrate handler: create the text index for the current backend.
+    """
+    from django.db import connections
+
+    conn = connections[using or 'default']
+    statements = {'sqlite': SQLITE_SETUP, 'postgresql': POSTGRESQL_SETUP}.get(conn.vendor, [])
+    if TABLE not in conn.introspection.table_names():
+        return
+    with conn.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement.format(table=TABLE, fts=FTS_TABLE))
+
+
+def model_for(kind):
+    from django.apps import apps
+
+    return apps.get_model(KINDS[kind])
+
+
+def kind_of(model):
+    for kind, label in KINDS.items():
+        if model._meta.label == label:
+            return kind
+    return None
+
+
+def strip_html(html):
+    if not html:
+        return ''
+    return BeautifulSoup(html, 'html.parser').get_text(' ', strip=True)
+
+
+def document_text(instance):
+    titles, bodies = [], []
+    for lang in translation.LANGUAGES:
+        titles.append(getattr(instance, 'title_%s' % lang, None) or '')
+        bodies.append(strip_html(getattr(instance, 'description_%s' % lang, None)))
+    return ' '.join(filter(None, titles)), ' '.join(filter(None, bodies))
+
+
+def update(instance, update_fields=None):
+    """
+    Index or unindex `instance` after a save. Saves that only touch other
+    fields (image processing, ...) are skipped.
+    """
+    from .models import SearchDocument
+
+    kind = kind_of(type(instance))
+    if kind is None:
+        return
+    if update_fields is not None:
+        indexed = {'is_active'} | {
+            '%s_%s' % (base, lang) for base in INDEXED_FIELDS for lang in translation.LANGUAGES
+        }
+        if not indexed & set(update_fields):
+            return
+
+    if not instance.is_active:
+        remove(instance)
+        return
+    title, body = document_text(instance)
+    SearchDocument.objects.update_or_create(
+        kind=kind, object_id=instance.pk, defaults={'title': title, 'body': body},
+    )
+
+
+def remove(instance):
+    from .models import SearchDocument
+
+    kind = kind_of(type(instance))
+    if kind is not None:
+        SearchDocument.objects.filter(kind=kind, object_id=instance.pk).delete()
+
+
+def rebuild(batch_size=1000):
+    """
+    Recreate every document from the active rows. Returns {kind: count}.
+    """
+    from .models import SearchDocument
+
+    SearchDocument.objects.all().delete()
+    counts = {}
+    for kind in KINDS:
+        model = model_for(kind)
+        only = ['pk'] + [
+            '%s_%s' % (base, lang) for base in INDEXED_FIELDS for lang in translation.LANGUAGES
+        ]
+        documents = []
+        for row in model.objects.filter(is_active=True).only(*only).iterator(chunk_size=batch_size):
+            title, body = document_text(row)
+            documents.append(SearchDocument(kind=kind, object_id=row.pk, title=title, body=body))
+        SearchDocument.objects.bulk_create(documents, batch_size=batch_size)
+        counts[kind] = len(documents)
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO {fts}({fts}) VALUES ('optimize')".format(fts=FTS_TABLE))
+    return counts
+
+
+def terms(query):
+    """
+    Words of `query`, at most 10. Single letters are dropped: as prefixes
+    they match nearly every row and the prefix index does not cover them.
+    """
+    return [word for word in re.findall(r'\w+', query.lower()) if len(word) > 1][:10]
+
+
+def sqlite_query(words, kinds):
+    # Every word must match, as a prefix for typeahead, in the title or the
+    # body; the kind is part of the match so that FTS5 can sort and limit
+    # on its own before the join.
+    match = '{title body} : (%s)' % ' '.join('"%s"*' % word for word in words)
+    if set(kinds) != set(KINDS):
+        match = 'kind : (%s) AND %s' % (' OR '.join('"%s"' % kind for kind in kinds), match)
+    select = (
+        'SELECT d.kind, d.object_id, -f.rank FROM ('
+        'SELECT rowid, rank FROM {fts} WHERE {fts} MATCH %s ORDER BY rank LIMIT %s OFFSET %s'
+        ') f JOIN {table} d ON d.id = f.rowid ORDER BY f.rank'
+    ).format(fts=FTS_TABLE, table=TABLE)
+    count = 'SELECT COUNT(*) FROM {fts} WHERE {fts} MATCH %s'.format(fts=FTS_TABLE)
+    return select, count, [match]
+
+
+def postgresql_query(words, kinds):
+    tsquery = ' & '.join('%s:*' % word for word in words)
+    base = (
+        "FROM {table} d, to_tsquery('simple', %s) q WHERE d.vector @@ q AND d.kind IN ({kinds})"
+    ).format(table=TABLE, kinds=', '.join(['%s'] * len(kinds)))
+    select = 'SELECT d.kind, d.object_id, ts_rank(d.vector, q) AS rank ' + base + ' ORDER BY rank DESC LIMIT %s OFFSET %s'
+    return select, 'SELECT COUNT(*) ' + base, [tsquery] + list(kinds)
+
+
+def search(query, kinds=None, page=1, page_size=20):
+    """
+    Ranked matches of every word of `query` (as prefixes) in the titles or
+    descriptions. Returns the same page metadata as funcs.paginate_queryset,
+    with `items` a list of (kind, object_id, rank).
+    """
+    from .models import SearchDocument
+
+    kinds = [kind for kind in (kinds or KINDS) if kind in KINDS]
+    words = terms(query)
+    page = max(page, 1)
+    if not words or not kinds:
+        items, total = [], 0
+    elif connection.vendor in ('sqlite', 'postgresql'):
+        build = sqlite_query if connection.vendor == 'sqlite' else postgresql_query
+        select, count, params = build(words, kinds)
+        with connection.cursor() as cursor:
+            cursor.execute(count, params)
+            total = cursor.fetchone()[0]
+            cursor.execute(select, params + [page_size, (page - 1) * page_size])
+            items = [(kind, object_id, float(rank)) for kind, object_id, rank in cursor.fetchall()]
+    else:
+        documents = SearchDocument.objects.filter(kind__in=kinds)
+        for word in words:
+            documents = documents.filter(Q(title__icontains=word) | Q(body__icontains=word))
+        total = documents.count()
+        start = (page - 1) * page_size
+        items = [(kind, object_id, 0.0) for kind, object_id in documents.order_by('id').values_list('kind', 'object_id')[start:start + page_size]]
+
+    total_pages = max(math.ceil(total / page_size), 1)
+    return {
+        'items': items,
+        'page': page,
+        'page_size': page_size,
+        'total_pages': total_pages,
+        'total_items': total,
+        'has_more': page < total_pages,
+    }
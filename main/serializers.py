@@ -1,22 +1,192 @@
-from . import models
+from . import models, translation
 from rest_framework import serializers
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class TranslatedField(serializers.Field):
+    """
+    Read-only value of `<base>_<lang>`, falling back to the Uzbek original
+    while the translation is missing or still pending.
+    """
+
+    def __init__(self, base, lang, **kwargs):
+        self.base = base
+        self.lang = lang
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, obj):
+        value = getattr(obj, '%s_%s' % (self.base, self.lang))
+        if not value:
+            value = getattr(obj, '%s_%s' % (self.base, translation.SOURCE_LANGUAGE))
+        return value
+
+
+class RenditionsField(serializers.JSONField):
+    """
+    The `renditions` of an image model with storage names turned into URLs,
+    ready for `srcset`: [{url, format, width, height, bytes}, ...].
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        storage = self.parent.Meta.model._meta.get_field(self.parent.Meta.model.image_source_field).storage
+        request = self.context.get('request')
+        renditions = []
+        for rendition in value or ():
+            url = storage.url(rendition['name'])
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            renditions.append({
+                'url': url,
+                'format': rendition['format'],
+                'width': rendition['width'],
+                'height': rendition['height'],
+                'bytes': rendition['bytes'],
+            })
+        return renditions
+
+
+class BaseSerializer(serializers.ModelSerializer):
+    """
+    ModelSerializer with per-request projections, driven by its context:
+
+    - `lang`: title_uz/title_ru/title_en are replaced by a single `title` in
+      that language (and so on for every translated field);
+    - `fields`: only these fields are produced;
+    - `expand`: nested relations (see `expandable_fields`) to include.
+
+    When neither `fields` nor `expand` is given every field is produced, as
+    before. `fields`/`expand` only apply to the top-level serializer.
+    """
+
+    # Nested or computed fields that are only produced when expanded.
+    expandable_fields = ()
+
+    # Model fields maintained by the image pipeline and the translation jobs,
+    # never written by clients.
+    generated_fields = (
+        'image_original', 'image_status', 'renditions', 'placeholder',
+        'image_width', 'image_height', 'translation_status',
+    )
+
+    @property
+    def is_root(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    def get_fields(self):
+        fields = super().get_fields()
+
+        lang = self.context.get('lang')
+        if lang:
+            bases = translation.translated_bases(self.Meta.model)
+            projected = {}
+            for name, field in fields.items():
+                base, _, suffix = name.rpartition('_')
+                if base in bases and suffix in translation.LANGUAGES:
+                    if base not in projected:
+                        projected[base] = TranslatedField(base, lang)
+                    continue
+                projected[name] = field
+            fields = projected
+
+        requested = self.context.get('fields')
+        expand = self.context.get('expand')
+        if not self.is_root or (requested is None and expand is None):
+            return fields
+
+        expanded = set(expand or ()) | set(requested or ())
+        return {
+            name: field for name, field in fields.items()
+            if (name in self.expandable_fields and name in expanded)
+            or (name not in self.expandable_fields and (requested is None or name in requested))
+        }
+
+    def get_extra_kwargs(self):
+        extra_kwargs = super().get_extra_kwargs()
+        for name in self.generated_fields:
+            extra_kwargs.setdefault(name, {})['read_only'] = True
+        return extra_kwargs
+
+    def loaded_fields(self, prefix=''):
+        """
+        Model fields (as only() lookups) read when producing self.fields.
+        """
+        model = self.Meta.model
+        concrete = {field.name for field in model._meta.concrete_fields}
+        names = [prefix + model._meta.pk.name]
+        for name, field in self.fields.items():
+            if isinstance(field, TranslatedField):
+                names.append('%s%s_%s' % (prefix, field.base, field.lang))
+                names.append('%s%s_%s' % (prefix, field.base, translation.SOURCE_LANGUAGE))
+            elif isinstance(field, BaseSerializer):
+                names.append(prefix + field.source)
+                names += field.loaded_fields(prefix='%s%s__' % (prefix, field.source))
+            elif field.source in concrete:
+                names.append(prefix + field.source)
+        return names
+
+    @classmethod
+    def setup_queryset(cls, queryset, context):
+        """
+        Shape the queryset for what this serializer will read: with `lang`
+        or `fields` in the context only the columns that are serialized are
+        loaded, together with the `ordering` fields used for pagination.
+        """
+        if context.get('lang') is None and context.get('fields') is None:
+            return queryset
+        serializer = cls(context=context)
+        names = serializer.loaded_fields()
+        names += [name.lstrip('-') for name in context.get('ordering', ())]
+        return queryset.only(*dict.fromkeys(names))
+
+    @classmethod
+    def expanded_fields(cls, context):
+        return set(cls(context=context).fields) & set(cls.expandable_fields)
+
+
+class CategorySerializer(BaseSerializer):
+    renditions = RenditionsField()
+
     class Meta:
         model = models.Category
         fields = '__all__'
+        # Replaced through images.attach_upload, which also schedules the renditions.
+        read_only_fields = ['image']
         
                     
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(BaseSerializer):
     total_images = serializers.SerializerMethodField()
     product_images = serializers.SerializerMethodField()
     category = CategorySerializer()
+    renditions = RenditionsField()
+    expandable_fields = ('category', 'product_images', 'total_images')
+
+    @classmethod
+    def setup_queryset(cls, queryset, context):
+        expanded = cls.expanded_fields(context)
+        if 'category' in expanded:
+            queryset = queryset.with_category()
+        if 'product_images' in expanded:
+            queryset = queryset.with_images()
+        if 'total_images' in expanded:
+            queryset = queryset.with_image_count()
+        return super().setup_queryset(queryset, context)
+
     def get_total_images(self, obj):
         return obj.total_images
     
     def get_product_images(self, obj):
-        return ProductImageSerializer(obj.productimage_set.all(), many=True).data
+        images = getattr(obj, 'active_images', None)
+        if images is None:
+            images = obj.productimage_set.filter(is_active=True)
+        return ProductImageSerializer(images, many=True).data
     
     def get_category(self, obj):
         return CategorySerializer(obj.category).data
@@ -28,55 +198,65 @@ class ProductSerializer(serializers.ModelSerializer):
         
 
                     
-class ProductImageSerializer(serializers.ModelSerializer):
+class ProductImageSerializer(BaseSerializer):
+    renditions = RenditionsField()
+
     class Meta:
         model = models.ProductImage
         fields = '__all__'
         
                         
-class SliderSerializer(serializers.ModelSerializer):
+class SliderSerializer(BaseSerializer):
+    renditions = RenditionsField()
+
     class Meta:
         model = models.Slider
         fields = '__all__'
         
                     
-class BlogSerializer(serializers.ModelSerializer):
+class BlogSerializer(BaseSerializer):
+    renditions = RenditionsField()
+
     class Meta:
         model = models.Blog
         fields = '__all__'
         
                     
-class CompanySerializer(serializers.ModelSerializer):
+class CompanySerializer(BaseSerializer):
     class Meta:
         model = models.Company
         fields = '__all__'
         
                     
-class CompanyAddressSerializer(serializers.ModelSerializer):
+class CompanyAddressSerializer(BaseSerializer):
     class Meta:
         model = models.CompanyAddress
         fields = '__all__'
         
                         
-class CompanyImageSerializer(serializers.ModelSerializer):
+class CompanyImageSerializer(BaseSerializer):
+    renditions = RenditionsField()
+
     class Meta:
         model = models.CompanyImage
         fields = '__all__'
+        # Replaced through images.attach_upload, which also schedules the renditions.
+        read_only_fields = ['image']
         
                         
-class CompanyPhoneSerializer(serializers.ModelSerializer):
+class CompanyPhoneSerializer(BaseSerializer):
     class Meta:
         model = models.CompanyPhone
         fields = '__all__'
         
                         
-class CompanyEmailSerializer(serializers.ModelSerializer):
+class CompanyEmailSerializer(BaseSerializer):
     class Meta:
         model = models.CompanyEmail
         fields = '__all__'
         
                         
-class ContactSerializer(serializers.ModelSerializer):
+class ContactSerializer(BaseSerializer):
     class Meta:
         model = models.Contact
         fields = '__all__'
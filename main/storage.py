@@ -0,0 +1,256 @@
+"""
+Content-addressed media storage.
+
+Files are named after a hash of their bytes, so storing the same upload
+again writes nothing and returns the existing name. Because several rows can
+then point at one file, files are reference-counted in the MediaFile table:
+Main.save acquires the files a row starts using and releases those it stops
+using (soft deletes release all of them), and `collect_media` deletes files
+that nobody has used for MEDIA_RELEASE_GRACE seconds.
+"""
+import collections
+import datetime
+import functools
+import hashlib
+import logging
+import posixpath
+import re
+
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import models as db_models
+from django.db.models import F
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+HASHED_NAME_RE = re.compile(r'^[0-9a-f]{32}(\.[\w]+)?$')
+
+
+def is_hashed_name(name):
+    """
+    Whether `name` was produced by HashedStorage (and so never changes).
+    """
+    return bool(HASHED_NAME_RE.match(posixpath.basename(name)))
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()[:32]
+
+
+class HashedStorage(FileSystemStorage):
+    """
+    FileSystemStorage that stores `<directory>/<content hash><extension>`
+    and never writes a file twice.
+    """
+
+    def hashed_name(self, name, content):
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        directory, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()
+        return posixpath.join(directory, content_hash(content) + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+
+def stored_name(instance, field_name, upload):
+    """
+    The name `upload` will get once saved in `field_name` of `instance`, or
+    None when the field's storage is not content-addressed.
+    """
+    field = instance._meta.get_field(field_name)
+    if not isinstance(field.storage, HashedStorage):
+        return None
+    return field.storage.hashed_name(field.generate_filename(instance, upload.name), upload)
+
+
+@functools.lru_cache(maxsize=None)
+def tracked_fields(model):
+    """
+    (attname, is a file field) of the fields of `model` that reference
+    stored files: its file fields and its renditions.
+    """
+    return tuple(
+        (field.attname, isinstance(field, db_models.FileField))
+        for field in model._meta.concrete_fields
+        if isinstance(field, db_models.FileField) or field.attname == 'renditions'
+    )
+
+
+def names_of(value, is_file):
+    if is_file:
+        name = getattr(value, 'name', value)
+        return [name] if name else []
+    return [rendition['name'] for rendition in value or ()]
+
+
+def references(instance):
+    """
+    {field name: [file names]} for the loaded file fields of `instance`,
+    including its renditions. Inactive rows reference nothing.
+    """
+    deferred = instance.get_deferred_fields()
+    active = instance.is_active if 'is_active' not in deferred else True
+    return {
+        attname: names_of(getattr(instance, attname), is_file) if active else []
+        for attname, is_file in tracked_fields(type(instance))
+        if attname not in deferred
+    }
+
+
+def remember(instance, field_names=None, values=None):
+    """
+    Record the files `instance` references as loaded. With the `field_names`
+    and `values` of Model.from_db, they are only kept and turned into
+    references when the row is saved or deleted, so that rows that are only
+    read cost nothing.
+    """
+    if not tracked_fields(type(instance)):
+        return
+    if field_names is None:
+        instance._media_refs = references(instance)
+    else:
+        instance._media_loaded = (field_names, values)
+
+
+def remembered(instance):
+    """
+    The references recorded by remember() or the last save, or None.
+    """
+    refs = instance.__dict__.get('_media_refs')
+    loaded = instance.__dict__.pop('_media_loaded', None)
+    if refs is None and loaded is not None:
+        values = dict(zip(*loaded))
+        active = values.get('is_active', True)
+        refs = instance._media_refs = {
+            attname: names_of(values[attname], is_file) if active else []
+            for attname, is_file in tracked_fields(type(instance))
+            if attname in values
+        }
+    return refs
+
+
+def update_references(instance):
+    """
+    Acquire and release files according to what changed since the row was
+    loaded (or last saved).
+    """
+    if not tracked_fields(type(instance)):
+        return
+    before = remembered(instance)
+    after = references(instance)
+    if before is None:
+        before = {}
+    else:
+        # Fields loaded after the row was fetched were not counted then.
+        after = {field: names for field, names in after.items() if field in before}
+    acquired, released = collections.Counter(), collections.Counter()
+    for field, names in after.items():
+        acquired.update(names)
+        released.update(before.get(field, ()))
+    acquired, released = acquired - released, released - acquired
+    if acquired:
+        acquire(acquired)
+    if released:
+        release(released)
+    instance._media_refs = after
+
+
+def release_references(instance):
+    """
+    Release every file counted for `instance`, e.g. after a hard delete.
+    """
+    if not tracked_fields(type(instance)):
+        return
+    refs = remembered(instance)
+    if refs is None:
+        refs = references(instance)
+    released = collections.Counter(name for names in refs.values() for name in names)
+    if released:
+        release(released)
+    instance._media_refs = {}
+
+
+def by_count(names):
+    groups = collections.defaultdict(list)
+    for name, count in names.items():
+        groups[count].append(name)
+    return groups.items()
+
+
+def acquire(names):
+    from .models import MediaFile
+
+    MediaFile.objects.bulk_create([MediaFile(name=name) for name in names], ignore_conflicts=True)
+    for count, group in by_count(names):
+        MediaFile.objects.filter(name__in=group).update(refs=F('refs') + count, released_at=None)
+
+
+def release(names):
+    from .models import MediaFile
+
+    for count, group in by_count(names):
+        MediaFile.objects.filter(name__in=group).update(refs=F('refs') - count)
+    MediaFile.objects.filter(name__in=list(names), refs__lte=0, released_at=None).update(released_at=timezone.now())
+
+
+def collect(grace=None, dry_run=False):
+    """
+    Delete files released for longer than `grace` seconds (default
+    MEDIA_RELEASE_GRACE). Returns the deleted names.
+    """
+    from .models import MediaFile
+
+    if grace is None:
+        grace = getattr(settings, 'MEDIA_RELEASE_GRACE', 7 * 24 * 3600)
+    cutoff = timezone.now() - datetime.timedelta(seconds=grace)
+    unused = MediaFile.objects.filter(refs__lte=0, released_at__lte=cutoff)
+    names = list(unused.values_list('name', flat=True))
+    if dry_run:
+        return names
+    deleted = []
+    for name in names:
+        # Forget the row first, and only if it was not acquired again since
+        # it was listed: the file is deleted only when that succeeded.
+        if not unused.filter(name=name).delete()[0]:
+            continue
+        default_storage.delete(name)
+        deleted.append(name)
+        if MediaFile.objects.filter(name=name).exists():
+            # Stored again between the two deletes: the new row points to a
+            # file that is gone and the upload has to be repeated.
+            logger.error('Media file %s was acquired while it was being deleted', name)
+    return deleted
+
+
+def recount(models):
+    """
+    Rebuild every reference count from the rows of `models`.
+    """
+    from .models import MediaFile
+
+    counts = collections.Counter()
+    for model in models:
+        for row in model.objects.iterator():
+            for names in references(row).values():
+                counts.update(names)
+
+    MediaFile.objects.update(refs=0)
+    acquire(counts)
+    MediaFile.objects.filter(refs__lte=0, released_at=None).update(released_at=timezone.now())
+    return counts
@@ -1,3 +1,1090 @@
-from django.test import TestCase
+import datetime
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.models import Q
+from django.test import TestCase, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from . import caching, contacts, images, jobs, models, schema, storage, translation, typeahead
+from .auth import authentication
+
+
+class RecordingBackend(translation.FakeBackend):
+    # (target, texts) of every batch sent, across instances and threads.
+    batches = []
+
+    def translate_batch(self, texts, source, target):
+        self.batches.append((target, list(texts)))
+        return super().translate_batch(texts, source, target)
+
+
+@override_settings(TRANSLATION_ASYNC=False, TRANSLATION_BACKEND='main.tests.RecordingBackend', TRANSLATION_MEMORY_DB=False)
+class TranslateManyTest(TestCase):
+    def setUp(self):
+        RecordingBackend.batches.clear()
+        translation.memory.clear()
+        self.addCleanup(translation.memory.clear)
+
+    def test_segments_are_sent_once_per_target(self):
+        result = translation.translate_many(['Salom', 'dunyo', 'Salom', '  ', 'dunyo'], ['ru', 'en'])
+        self.assertEqual(result['ru'], {'Salom': '[ru] Salom', 'dunyo': '[ru] dunyo'})
+        self.assertEqual(result['en'], {'Salom': '[en] Salom', 'dunyo': '[en] dunyo'})
+        self.assertEqual(sorted(RecordingBackend.batches), [('en', ['Salom', 'dunyo']), ('ru', ['Salom', 'dunyo'])])
+
+        translation.translate_many(['dunyo', 'Salom'], ['ru', 'en'])
+        self.assertEqual(len(RecordingBackend.batches), 2)
+
+    @override_settings(TRANSLATION_BATCH_SIZE=2, TRANSLATION_BATCH_CHARS=1000, TRANSLATION_MAX_WORKERS=4)
+    def test_batches_are_bounded_by_items(self):
+        segments = ['segment %d' % i for i in range(5)]
+        result = translation.translate_many(segments, ['ru', 'en'])
+        self.assertEqual(len(RecordingBackend.batches), 6)
+        for target in ('ru', 'en'):
+            sizes = sorted(len(texts) for lang, texts in RecordingBackend.batches if lang == target)
+            self.assertEqual(sizes, [1, 2, 2])
+            self.assertEqual(result[target], {segment: '[%s] %s' % (target, segment) for segment in segments})
+
+    @override_settings(TRANSLATION_BATCH_SIZE=50, TRANSLATION_BATCH_CHARS=10)
+    def test_batches_are_bounded_by_characters(self):
+        translation.translate_many(['aaaa', 'bbbb', 'cccc', 'dddddddddddd'], ['ru'])
+        self.assertEqual([texts for lang, texts in RecordingBackend.batches], [['aaaa', 'bbbb'], ['cccc'], ['dddddddddddd']])
+
+    def test_document_round_trip(self):
+        for value in (
+            '<p>Salom <b>dunyo</b></p>\n<p> Salom </p><!-- izoh -->',
+            '{"title": "Salom", "items": [1, 2]}',
+            'Tom &amp; Jerry',
+        ):
+            self.assertEqual(translation.Document(value).render({}), value)
+
+    def test_document_swaps_text_nodes(self):
+        document = translation.Document('<p>Salom <b>dunyo</b></p>\n<p> Salom </p><!-- Salom -->')
+        self.assertEqual(document.segments, ['Salom', 'dunyo', 'Salom'])
+        rendered = document.render(translation.translate_segments(document.segments, 'ru'))
+        self.assertEqual(rendered, '<p>[ru] Salom <b>[ru] dunyo</b></p>\n<p> [ru] Salom </p><!-- Salom -->')
+        self.assertEqual(RecordingBackend.batches, [('ru', ['Salom', 'dunyo'])])
+
+    def test_instance_fields_share_batches(self):
+        category = models.Category(title_uz='Salom', description_uz='<p>Salom</p><p>dunyo</p>')
+        updated = translation.translate_instance(category)
+        self.assertEqual(set(updated), {'title_ru', 'title_en', 'description_ru', 'description_en'})
+        self.assertEqual(category.description_en, '<p>[en] Salom</p><p>[en] dunyo</p>')
+        self.assertEqual(sorted(RecordingBackend.batches), [('en', ['Salom', 'dunyo']), ('ru', ['Salom', 'dunyo'])])
+
+
+class BlankBackend(RecordingBackend):
+    # Fails (returns nothing) for segments starting with '?'.
+    def translate_batch(self, texts, source, target):
+        translated = super().translate_batch(texts, source, target)
+        return ['' if text.startswith('?') else value for text, value in zip(texts, translated)]
+
+
+@override_settings(TRANSLATION_ASYNC=False, TRANSLATION_BACKEND='main.tests.RecordingBackend', TRANSLATION_MEMORY_DB=True)
+class TranslationMemoryTest(TestCase):
+    def setUp(self):
+        RecordingBackend.batches.clear()
+        translation.memory.clear()
+        self.addCleanup(translation.memory.clear)
+
+    def test_lru_eviction(self):
+        memory = translation.MemoryCache(2)
+        memory.put('a', 1)
+        memory.put('b', 2)
+        self.assertEqual(memory.get('a'), 1)
+        memory.put('c', 3)
+        # 'b' was the least recently used.
+        self.assertIsNone(memory.get('b'))
+        self.assertEqual((memory.get('a'), memory.get('c')), (1, 3))
+        self.assertEqual(memory.stats()['evictions'], 1)
+        self.assertEqual(memory.stats()['size'], 2)
+
+    def test_recall_from_the_database(self):
+        translation.translate_many(['Salom', 'dunyo'], ['ru'])
+        self.assertEqual(models.TranslationMemory.objects.filter(target_lang='ru').count(), 2)
+
+        translation.memory.clear()
+        result = translation.translate_many(['dunyo', 'Salom', 'Xayr'], ['ru'])
+        self.assertEqual(result['ru'], {'Salom': '[ru] Salom', 'dunyo': '[ru] dunyo', 'Xayr': '[ru] Xayr'})
+        self.assertEqual(RecordingBackend.batches[1:], [('ru', ['Xayr'])])
+        self.assertEqual(translation.memory.stats()['db_hits'], 2)
+
+        translation.translate_many(['Salom', 'Xayr'], ['ru'])
+        self.assertEqual(len(RecordingBackend.batches), 2)
+        self.assertEqual(translation.memory.stats()['hits'], 2)
+
+    def test_memory_is_keyed_by_normalized_text(self):
+        translation.translate_many(['Salom  dunyo'], ['ru'])
+        self.assertEqual(translation.translate_many(['Salom dunyo'], ['ru'])['ru'], {'Salom dunyo': '[ru] Salom  dunyo'})
+        self.assertEqual(len(RecordingBackend.batches), 1)
+
+    @override_settings(TRANSLATION_BACKEND='main.tests.BlankBackend')
+    def test_failed_segments_fall_back_and_are_not_remembered(self):
+        result = translation.translate_many(['Salom', '?dunyo'], ['ru'])
+        self.assertEqual(result['ru'], {'Salom': '[ru] Salom', '?dunyo': '?dunyo'})
+        self.assertEqual(list(models.TranslationMemory.objects.values_list('source_text', flat=True)), ['Salom'])
+
+        translation.translate_many(['Salom', '?dunyo'], ['ru'])
+        self.assertEqual(RecordingBackend.batches[-1], ('ru', ['?dunyo']))
+
+
+class FailingBackend(translation.TranslationBackend):
+    def translate_batch(self, texts, source, target):
+        raise ConnectionError('translator unreachable')
+
+
+@override_settings(TRANSLATION_ASYNC=True, TRANSLATION_BACKEND='main.translation.FakeBackend',
+                   JOB_MAX_ATTEMPTS=2, JOB_RETRY_DELAY=10, JOB_TIMEOUT=600)
+class TranslationJobTest(TestCase):
+    def setUp(self):
+        translation.memory.clear()
+        self.addCleanup(translation.memory.clear)
+
+    def create_category(self):
+        return models.Category.objects.create(title_uz='Krossovka', description_uz='<p>Yangi</p>', image='category_images/x.jpg')
+
+    def make_due(self):
+        models.Job.objects.update(available_at=timezone.now())
+
+    def test_save_enqueues_a_translation_job(self):
+        category = self.create_category()
+        self.assertEqual(category.translation_status, translation.STATUS_PENDING)
+        self.assertFalse(category.title_ru)
+        job = models.Job.objects.get(kind='translate')
+        self.assertEqual((job.object_id, job.status), (category.pk, models.Job.STATUS_PENDING))
+
+        # Later saves of the same row do not enqueue again.
+        category.priority = 3
+        category.save()
+        self.assertEqual(models.Job.objects.count(), 1)
+
+    def test_run_pending_fills_translations(self):
+        category = self.create_category()
+        [job] = jobs.run_pending(kinds=['translate'])
+        self.assertEqual((job.status, job.attempts), (models.Job.STATUS_DONE, 1))
+        category.refresh_from_db()
+        self.assertEqual(category.translation_status, translation.STATUS_DONE)
+        self.assertEqual((category.title_ru, category.title_en), ('[ru] Krossovka', '[en] Krossovka'))
+        self.assertEqual(category.description_en, '<p>[en] Yangi</p>')
+        self.assertEqual(jobs.run_pending(kinds=['translate']), [])
+
+    @override_settings(TRANSLATION_BACKEND='main.tests.FailingBackend')
+    def test_failing_backend_retries_then_fails(self):
+        category = self.create_category()
+        before = timezone.now()
+        [job] = jobs.run_pending(kinds=['translate'])
+        self.assertEqual((job.status, job.attempts), (models.Job.STATUS_PENDING, 1))
+        self.assertIn('translator unreachable', job.last_error)
+        self.assertGreaterEqual(job.available_at, before + datetime.timedelta(seconds=10))
+        category.refresh_from_db()
+        self.assertEqual(category.translation_status, translation.STATUS_PENDING)
+
+        # Not due before the backoff delay.
+        self.assertEqual(jobs.run_pending(kinds=['translate']), [])
+
+        self.make_due()
+        [job] = jobs.run_pending(kinds=['translate'])
+        self.assertEqual((job.status, job.attempts), (models.Job.STATUS_FAILED, 2))
+        category.refresh_from_db()
+        self.assertEqual(category.translation_status, translation.STATUS_FAILED)
+        self.assertEqual(category.title_ru, None)
+
+        self.make_due()
+        self.assertEqual(jobs.run_pending(kinds=['translate']), [])
+
+    def test_backoff_doubles_and_is_capped(self):
+        self.assertEqual(
+            [jobs.backoff(attempts).total_seconds() for attempts in (1, 2, 3, 20)],
+            [10, 20, 40, 3600],
+        )
+
+    def test_stale_running_jobs_are_reclaimed(self):
+        self.create_category()
+        [job] = jobs.claim(kinds=['translate'])
+        self.assertEqual(job.status, models.Job.STATUS_RUNNING)
+        # Running, and recently updated: another worker has it.
+        self.assertEqual(jobs.claim(kinds=['translate']), [])
+
+        models.Job.objects.update(updated_at=timezone.now() - datetime.timedelta(seconds=601))
+        [job] = jobs.claim(kinds=['translate'])
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(jobs.run(job).status, models.Job.STATUS_DONE)
+
+
+@override_settings(TRANSLATION_ASYNC=False, TRANSLATION_BACKEND='main.translation.FakeBackend')
+class ProductListQueriesTest(TestCase):
+    def setUp(self):
+        self.category = models.Category.objects.create(title_uz='Krossovka', image='category_images/x.jpg')
+
+    def create_products(self, count):
+        for i in range(count):
+            product = models.Product.objects.create(
+                title_uz='Mahsulot %d' % i,
+                price=10,
+                image_min='product_images/300/x.jpg',
+                image_max='product_images/600/x.jpg',
+                category=self.category,
+                priority=i,
+            )
+            for _ in range(2):
+                models.ProductImage.objects.create(
+                    product=product,
+                    image_min='product_images/300/x.jpg',
+                    image_max='product_images/600/x.jpg',
+                )
+
+    def count_queries(self, limit):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/product/', {'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['products']), limit)
+        return len(queries)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        self.create_products(12)
+        self.assertEqual(self.count_queries(2), self.count_queries(12))
+
+    def test_sparse_fields_skip_unrequested_relations(self):
+        self.create_products(3)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/product/', {'fields': 'uuid,title_uz,price'})
+        self.assertEqual(set(response.data['products'][0]), {'uuid', 'title_uz', 'price'})
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('main_category', sql)
+        self.assertNotIn('main_productimage', sql)
+
+    def test_only_active_images_are_listed(self):
+        self.create_products(1)
+        models.ProductImage.objects.update(is_active=False)
+        response = self.client.get('/api/product/')
+        product = response.data['products'][0]
+        self.assertEqual(product['total_images'], 0)
+        self.assertEqual(product['product_images'], [])
+
+
+@override_settings(TRANSLATION_ASYNC=False, TRANSLATION_BACKEND='main.translation.FakeBackend')
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        self.category = models.Category.objects.create(title_uz='Krossovka', image='category_images/x.jpg')
+
+    def test_not_modified_until_a_write(self):
+        response = self.client.get('/api/category/')
+        etag = response['ETag']
+
+        response = self.client.get('/api/category/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.category.is_active = False
+        self.category.save()
+        response = self.client.get('/api/category/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['categories'], [])
+
+    def test_validators_run_no_query(self):
+        etag = self.client.get('/api/category/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/category/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_last_modified_follows_writes(self):
+        self.category.save()
+        last_modified = self.client.get('/api/category/')['Last-Modified']
+        response = self.client.get('/api/category/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(TRANSLATION_ASYNC=False, TRANSLATION_BACKEND='main.translation.FakeBackend')
+class ProductCursorPaginationTest(TestCase):
+    def setUp(self):
+        category = models.Category.objects.create(title_uz='Krossovka', image='category_images/x.jpg')
+        for i in range(5):
+            models.Product.objects.create(
+                title_uz='Mahsulot %d' % i,
+                price=10,
+                image_min='product_images/300/x.jpg',
+                image_max='product_images/600/x.jpg',
+                category=category,
+                priority=i // 2,
+            )
+
+    def test_pages_cover_every_product_once(self):
+        seen, cursor = [], ''
+        while True:
+            response = self.client.get('/api/product/', {'cursor': cursor, 'page_size': 2})
+            self.assertEqual(response.status_code, 200)
+            seen += [product['uuid'] for product in response.data['products']]
+            if not response.data['has_more']:
+                break
+            cursor = response.data['next_cursor']
+        expected = list(models.Product.objects.order_by('priority', 'uuid').values_list('uuid', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/product/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(TRANSLATION_ASYNC=False, TRANSLATION_BACKEND='main.translation.FakeBackend')
+class LanguageProjectionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        translation.memory.clear()
+        self.addCleanup(translation.memory.clear)
+        self.category = models.Category.objects.create(title_uz='Krossovka', description_uz='<p>Yangi</p>', image='category_images/x.jpg')
+        models.Product.objects.create(title_uz='Mahsulot', price=10, category=self.category, priority=0)
+
+    def test_lang_collapses_translated_fields(self):
+        response = self.client.get('/api/category/', {'lang': 'ru'})
+        category = response.data['categories'][0]
+        self.assertEqual(category['title'], '[ru] Krossovka')
+        self.assertEqual(category['description'], '<p>[ru] Yangi</p>')
+        self.assertFalse({'title_uz', 'title_ru', 'title_en', 'description_uz'} & set(category))
+
+        response = self.client.get('/api/category/')
+        category = response.data['categories'][0]
+        self.assertNotIn('title', category)
+        self.assertEqual((category['title_uz'], category['title_en']), ('Krossovka', '[en] Krossovka'))
+
+    def test_nested_relations_are_projected(self):
+        response = self.client.get('/api/product/', {'lang': 'en', 'expand': 'category'})
+        product = response.data['products'][0]
+        self.assertEqual(product['title'], '[en] Mahsulot')
+        self.assertEqual(product['category']['title'], '[en] Krossovka')
+        self.assertNotIn('title_uz', product['category'])
+
+    def test_missing_translation_falls_back_to_uzbek(self):
+        models.Category.objects.filter(pk=self.category.pk).update(title_en='')
+        response = self.client.get('/api/category/', {'lang': 'en'})
+        self.assertEqual(response.data['categories'][0]['title'], 'Krossovka')
+
+    def test_unknown_lang_returns_every_language(self):
+        response = self.client.get('/api/category/', {'lang': 'fr'})
+        self.assertIn('title_ru', response.data['categories'][0])
+
+    def test_accept_language(self):
+        response = self.client.get('/api/category/', HTTP_ACCEPT_LANGUAGE='ru-RU,ru;q=0.9')
+        self.assertIn('title_ru', response.data['categories'][0])
+
+        with self.settings(API_ACCEPT_LANGUAGE=True):
+            response = self.client.get('/api/category/', HTTP_ACCEPT_LANGUAGE='ru-RU,ru;q=0.9')
+            category = response.data['categories'][0]
+            self.assertEqual(category['title'], '[ru] Krossovka')
+            self.assertNotIn('title_uz', category)
+            self.assertIn('Accept-Language', response['Vary'])
+            # ?lang= wins over the header.
+            response = self.client.get('/api/category/', {'lang': 'en'}, HTTP_ACCEPT_LANGUAGE='ru')
+            self.assertEqual(response.data['categories'][0]['title'], '[en] Krossovka')
+
+
+@override_settings(TRANSLATION_ASYNC=False, TRANSLATION_BACKEND='main.translation.FakeBackend')
+class ResponseCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = models.Category.objects.create(title_uz='Krossovka', image='category_images/x.jpg')
+        models.Product.objects.create(title_uz='Mahsulot', price=10, category=self.category, priority=0)
+
+    def get(self, **params):
+        return self.client.get('/api/product/', params)
+
+    def test_hit_after_miss(self):
+        first = self.get()
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            second = self.get()
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.data, first.data)
+
+    def test_hits_run_no_query_on_every_catalog_view(self):
+        models.Company.objects.create(title_uz='Safir', description_uz='Kompaniya', address_uz='Toshkent')
+        product = models.Product.objects.get()
+        for url, params in (
+            ('/api/category/', {}),
+            ('/api/product/', {'lang': 'ru', 'fields': 'uuid,title'}),
+            ('/api/product/detail/%s/' % product.uuid, {'expand': 'category'}),
+            ('/api/slider/', {}),
+            ('/api/blog/', {}),
+            ('/api/company/', {}),
+            ('/api/search/', {'q': 'Mahsulot'}),
+        ):
+            self.assertEqual(self.client.get(url, params)['X-Cache'], 'MISS', url)
+            with self.assertNumQueries(0):
+                response = self.client.get(url, params)
+            self.assertEqual((response.status_code, response['X-Cache']), (200, 'HIT'), url)
+
+    def test_write_invalidates(self):
+        self.get()
+        self.category.title_uz = 'Sumka'
+        self.category.save()
+        response = self.get(expand='category')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['products'][0]['category']['title_uz'], 'Sumka')
+
+        models.Product.objects.create(title_uz='Mahsulot 2', price=10, category=self.category, priority=1)
+        response = self.get(expand='category')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.data['products']), 2)
+
+    def test_projection_is_part_of_the_key(self):
+        self.assertEqual(self.get()['X-Cache'], 'MISS')
+        for params in ({'lang': 'ru'}, {'lang': 'en'}, {'fields': 'uuid'}, {'fields': 'uuid,price'}, {'expand': 'category'}):
+            response = self.get(**params)
+            self.assertEqual(response['X-Cache'], 'MISS', params)
+            self.assertEqual(self.get(**params)['X-Cache'], 'HIT', params)
+        self.assertEqual(set(self.get(fields='uuid').data['products'][0]), {'uuid'})
+        self.assertIn('title', self.get(lang='ru').data['products'][0])
+
+    def test_errors_are_not_cached(self):
+        self.assertEqual(self.get(cursor='not-a-cursor').status_code, 400)
+        self.assertEqual(self.get(cursor='not-a-cursor')['X-Cache'], 'MISS')
+
+
+@override_settings(TRANSLATION_ASYNC=False, TRANSLATION_BACKEND='main.translation.FakeBackend')
+class ImagePipelineTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.category = models.Category.objects.create(title_uz='Krossovka', image='category_images/x.jpg')
+
+    def upload(self, size=(1200, 900)):
+        buffer = BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, 'JPEG')
+        return SimpleUploadedFile('photo.jpg', buffer.getvalue(), 'image/jpeg')
+
+    def test_derivatives_are_generated_by_the_job(self):
+        with self.settings(MEDIA_ROOT=self.media_root):
+            product = models.Product(title_uz='Mahsulot', price=10, category=self.category, priority=0)
+            images.attach_upload(product, self.upload())
+            product.save()
+            self.assertEqual(product.image_status, images.STATUS_PENDING)
+            self.assertFalse(product.image_min)
+
+            # Valid (e.g. in the admin) before the worker made the derivatives.
+            product.full_clean()
+
+            jobs.run_pending(kinds=['images'])
+            product.refresh_from_db()
+            self.assertEqual(product.image_status, images.STATUS_DONE)
+            self.assertEqual(Image.open(product.image_min.path).size, (300, 225))
+            self.assertEqual(Image.open(product.image_max.path).size, (600, 450))
+            self.assertEqual((product.image_width, product.image_height), (1200, 900))
+            self.assertTrue(product.placeholder.startswith('data:image/webp;base64,'))
+            self.assertLess(len(product.placeholder), 1000)
+
+    def test_renditions_are_listed_smallest_first(self):
+        with self.settings(MEDIA_ROOT=self.media_root, IMAGE_PROCESSING_ASYNC=False,
+                           IMAGE_RENDITION_WIDTHS=(320, 640, 960), IMAGE_RENDITION_FORMATS=('WEBP',)):
+            product = models.Product(title_uz='Mahsulot', price=10, category=self.category, priority=0)
+            images.attach_upload(product, self.upload((800, 600)))
+            product.save()
+
+            response = self.client.get('/api/product/detail/%s/' % product.uuid, {'fields': 'renditions'})
+        renditions = response.data['productDetail']['renditions']
+        self.assertEqual([(r['width'], r['height']) for r in renditions], [(320, 240), (640, 480)])
+        self.assertTrue(all(r['format'] == 'image/webp' and r['bytes'] > 0 for r in renditions))
+
+    def put_image(self, url, upload):
+        token = Token.objects.create(user=User.objects.create_user('admin'))
+        return self.client.put(
+            url, encode_multipart(BOUNDARY, {'image': upload}),
+            content_type=MULTIPART_CONTENT, HTTP_AUTHORIZATION='Token %s' % token.key,
+        )
+
+    def test_updating_the_image_replaces_size_and_placeholder(self):
+        with self.settings(MEDIA_ROOT=self.media_root, IMAGE_PROCESSING_ASYNC=False,
+                           IMAGE_RENDITION_WIDTHS=(320,), IMAGE_RENDITION_FORMATS=('WEBP',)):
+            category = models.Category(title_uz='Sumka')
+            images.attach_upload(category, self.upload((800, 600)))
+            category.save()
+            category.refresh_from_db()
+            self.assertEqual((category.image_width, category.image_height), (800, 600))
+            placeholder = category.placeholder
+
+            response = self.put_image('/api/category/update/%s/' % category.uuid, self.upload((1000, 500)))
+            self.assertEqual(response.status_code, 200)
+            category.refresh_from_db()
+        self.assertEqual(category.image_status, images.STATUS_DONE)
+        self.assertEqual((category.image_width, category.image_height), (1000, 500))
+        self.assertNotEqual(category.placeholder, placeholder)
+        self.assertEqual([(r['width'], r['height']) for r in category.renditions], [(320, 160)])
+
+    def test_updating_the_image_replaces_renditions(self):
+        with self.settings(MEDIA_ROOT=self.media_root, IMAGE_PROCESSING_ASYNC=False,
+                           IMAGE_RENDITION_WIDTHS=(320,), IMAGE_RENDITION_FORMATS=('WEBP',)):
+            product = models.Product.objects.create(title_uz='Mahsulot', price=10, category=self.category, priority=0)
+            image = models.ProductImage(product=product)
+            images.attach_upload(image, self.upload((800, 600)))
+            image.save()
+            image.refresh_from_db()
+            old = [r['name'] for r in image.renditions]
+
+            response = self.put_image('/api/productimage/update/%s/' % image.uuid, self.upload((600, 900)))
+            self.assertEqual(response.status_code, 200)
+            image.refresh_from_db()
+        self.assertEqual([(r['width'], r['height']) for r in image.renditions], [(320, 480)])
+        self.assertTrue(set(r['name'] for r in image.renditions).isdisjoint(old))
+        self.assertEqual(Image.open(os.path.join(self.media_root, image.image_min.name)).size, (200, 300))
+        self.assertFalse(models.MediaFile.objects.filter(name__in=old, refs__gt=0).exists())
+
+    def test_generated_fields_are_read_only(self):
+        token = Token.objects.create(user=User.objects.create_user('admin'))
+        response = self.client.put(
+            '/api/category/update/%s/' % self.category.uuid,
+            {'title_uz': 'Sumka', 'image_status': images.STATUS_FAILED, 'placeholder': 'data:x',
+             'image_width': 1, 'renditions': [{'name': 'x'}], 'translation_status': 'failed'},
+            content_type='application/json', HTTP_AUTHORIZATION='Token %s' % token.key,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.title_uz, 'Sumka')
+        self.assertEqual(self.category.image_status, images.STATUS_DONE)
+        self.assertEqual((self.category.placeholder, self.category.image_width, self.category.renditions), ('', None, []))
+        self.assertNotEqual(self.category.translation_status, 'failed')
+
+    def test_assigning_a_new_source_reprocesses(self):
+        # e.g. through the admin, without attach_upload.
+        with self.settings(MEDIA_ROOT=self.media_root, IMAGE_PROCESSING_ASYNC=False, IMAGE_RENDITION_FORMATS=('WEBP',)):
+            self.category.image = self.upload((640, 480))
+            self.category.save()
+            self.category.refresh_from_db()
+        self.assertEqual((self.category.image_width, self.category.image_height), (640, 480))
+
+    def test_same_upload_is_stored_and_processed_once(self):
+        with self.settings(MEDIA_ROOT=self.media_root, IMAGE_RENDITION_FORMATS=('WEBP',)):
+            first = models.Product(title_uz='Mahsulot', price=10, category=self.category, priority=0)
+            images.attach_upload(first, self.upload())
+            first.save()
+            jobs.run_pending(kinds=['images'])
+            first.refresh_from_db()
+
+            second = models.Product(title_uz='Mahsulot 2', price=10, category=self.category, priority=1)
+            images.attach_upload(second, self.upload())
+            second.save()
+            # The derivatives of the first product are reused, no job needed.
+            self.assertFalse(models.Job.objects.filter(kind='images', object_id=second.pk).exists())
+            self.assertEqual(second.image_original.name, first.image_original.name)
+            self.assertEqual(second.image_min.name, first.image_min.name)
+            self.assertEqual(second.renditions, first.renditions)
+            self.assertFalse(images.attach_upload(second, self.upload()))
+
+            media = models.MediaFile.objects.get(name=first.image_min.name)
+            self.assertEqual(media.refs, 2)
+
+            first.is_active = False
+            first.save()
+            second.is_active = False
+            second.save()
+            media.refresh_from_db()
+            self.assertEqual(media.refs, 0)
+            self.assertIn(first.image_min.name, storage.collect(grace=0))
+            self.assertFalse(os.path.exists(first.image_min.path))
+
+
+class MediaServeTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.name = 'renditions/%s.webp' % ('a' * 32)
+        os.makedirs(os.path.join(self.media_root, 'renditions'))
+        with open(os.path.join(self.media_root, self.name), 'wb') as handle:
+            handle.write(bytes(range(256)) * 4)
+
+    def get(self, name, **headers):
+        with self.settings(MEDIA_ROOT=self.media_root):
+            return self.client.get('/media/' + name, **headers)
+
+    def test_hashed_names_are_immutable(self):
+        response = self.get(self.name)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(len(b''.join(response.streaming_content)), 1024)
+
+        response = self.get(self.name, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_range(self):
+        response = self.get(self.name, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(10, 20)))
+
+        response = self.get(self.name, HTTP_RANGE='bytes=2000-')
+        self.assertEqual(response.status_code, 416)
+
+    def test_accel_redirect(self):
+        with self.settings(MEDIA_SERVE_MODE='accel'):
+            response = self.get(self.name)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.name)
+
+    def test_outside_media_root(self):
+        self.assertEqual(self.get('../settings.py').status_code, 404)
+
+
+@override_settings(TRANSLATION_ASYNC=False, TRANSLATION_BACKEND='main.translation.FakeBackend')
+class MediaReferencesTest(TestCase):
+    def refs(self, name):
+        return models.MediaFile.objects.get(name=name).refs
+
+    def test_references_follow_loaded_rows(self):
+        category = models.Category.objects.create(title_uz='Krossovka', image='category_images/a.jpg')
+        self.assertEqual(self.refs('category_images/a.jpg'), 1)
+
+        category = models.Category.objects.get(pk=category.pk)
+        # Nothing is computed for rows that are only read.
+        self.assertNotIn('_media_refs', category.__dict__)
+        category.image = 'category_images/b.jpg'
+        category.save()
+        self.assertEqual((self.refs('category_images/a.jpg'), self.refs('category_images/b.jpg')), (0, 1))
+
+        category = models.Category.objects.only('title_uz', 'image').get(pk=category.pk)
+        category.is_active = False
+        category.save()
+        self.assertEqual(self.refs('category_images/b.jpg'), 0)
+
+    def test_collect_spares_files_acquired_meanwhile(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with self.settings(MEDIA_ROOT=media_root):
+            names = [storage.default_storage.save('renditions/%s.webp' % c, ContentFile(c.encode())) for c in 'ab']
+            models.MediaFile.objects.bulk_create([
+                models.MediaFile(name=name, refs=0, released_at=timezone.now() - datetime.timedelta(days=30))
+                for name in names
+            ])
+            delete = storage.default_storage.delete
+
+            def delete_and_upload(name):
+                # The same content is uploaded again while collect runs.
+                delete(name)
+                storage.acquire({other: 1 for other in names if other != name and storage.default_storage.exists(other)})
+
+            with mock.patch.object(storage.default_storage, 'delete', side_effect=delete_and_upload):
+                deleted = storage.collect(grace=0)
+            [kept] = [name for name in names if name not in deleted]
+            self.assertEqual(len(deleted), 1)
+            self.assertTrue(storage.default_storage.exists(kept))
+            self.assertEqual(self.refs(kept), 1)
+            self.assertFalse(storage.default_storage.exists(deleted[0]))
+            self.assertFalse(models.MediaFile.objects.filter(name=deleted[0]).exists())
+
+    def test_models_without_files_are_not_tracked(self):
+        models.Contact.objects.create(name='Ali', phone='1', message='Salom')
+        contact = models.Contact.objects.get()
+        self.assertFalse(storage.tracked_fields(models.Contact))
+        self.assertNotIn('_media_loaded', contact.__dict__)
+        contact.save()
+        self.assertFalse(models.MediaFile.objects.exists())
+
+
+@override_settings(TRANSLATION_ASYNC=False, TRANSLATION_BACKEND='main.translation.FakeBackend')
+class MultiImageUploadTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        category = models.Category.objects.create(title_uz='Krossovka', image='category_images/x.jpg')
+        self.product = models.Product.objects.create(
+            title_uz='Mahsulot', price=10, image_min='product_images/300/x.jpg',
+            image_max='product_images/600/x.jpg', category=category,
+        )
+        models.ProductImage.objects.create(product=self.product, image_min='product_images/300/x.jpg', image_max='product_images/600/x.jpg')
+        user = User.objects.create_user('admin', password='secret')
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Token %s' % Token.objects.create(user=user).key
+
+    def upload(self, color):
+        buffer = BytesIO()
+        Image.new('RGB', (40, 30), color).save(buffer, 'PNG')
+        return SimpleUploadedFile('%s.png' % color, buffer.getvalue(), 'image/png')
+
+    def post(self, files):
+        with self.settings(MEDIA_ROOT=self.media_root):
+            return self.client.post('/api/productimage/create/', {'product': self.product.uuid, 'image': files})
+
+    def test_files_are_inserted_at_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post([self.upload('red'), self.upload('blue'), self.upload('green')])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['productImages']), 3)
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "main_productimage"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(models.Job.objects.filter(kind='images').count(), 3)
+
+    def test_non_images_are_rejected_before_storing(self):
+        fake = SimpleUploadedFile('evil.png', b'<?php echo 1; ?>', 'image/png')
+        response = self.post([self.upload('red'), fake])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(models.ProductImage.objects.count(), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'originals')))
+
+    def test_size_cap(self):
+        with self.settings(IMAGE_UPLOAD_MAX_SIZE=10):
+            response = self.post([self.upload('red')])
+        self.assertEqual(response.status_code, 413)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite specific')
+class QueryPlanTest(TestCase):
+    """
+    The list queries must be answered from an index, in index order, without
+    scanning the table or sorting in a temporary B-tree.
+    """
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn('INDEX %s' % index, plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_active_by_priority(self):
+        for model in (models.Category, models.Product, models.Slider, models.Blog):
+            with self.subTest(model=model.__name__):
+                queryset = model.objects.filter(is_active=True).order_by('priority', 'uuid')[:12]
+                self.assertUsesIndex(queryset, '%s_active_priority_idx' % model._meta.model_name)
+
+    def test_next_page(self):
+        # The filter funcs.paginate_keyset adds after a cursor.
+        queryset = models.Product.objects.filter(is_active=True).order_by('priority', 'uuid').filter(
+            Q(priority__gt=3) | Q(priority=3, uuid__gt='x'))[:13]
+        self.assertUsesIndex(queryset, 'product_active_priority_idx')
+
+    def test_products_of_category(self):
+        queryset = models.Product.objects.filter(is_active=True, category='x').order_by('priority', 'uuid')[:12]
+        self.assertUsesIndex(queryset, 'product_category_priority_idx')
+
+    def test_product_images(self):
+        queryset = models.ProductImage.objects.filter(is_active=True).order_by('-created_at', 'uuid')[:12]
+        self.assertUsesIndex(queryset, 'productimage_active_idx')
+        queryset = models.ProductImage.objects.filter(is_active=True, product='x').order_by('-created_at', 'uuid')[:12]
+        self.assertUsesIndex(queryset, 'productimage_product_idx')
+
+
+@override_settings(TRANSLATION_ASYNC=False, TRANSLATION_BACKEND='main.translation.FakeBackend')
+class SearchTest(TestCase):
+    def setUp(self):
+        category = models.Category.objects.create(title_uz='Krossovka', image='category_images/x.jpg')
+        self.shoe = models.Product.objects.create(
+            title_uz='Yugurish krossovkasi', description_uz='<p>Yengil <strong>poyabzal</strong></p>', price=10,
+            image_min='product_images/300/x.jpg', image_max='product_images/600/x.jpg', category=category,
+        )
+        self.bag = models.Product.objects.create(
+            title_uz='Sumka', description_uz='<p>Krossovka uchun sumka</p>', price=10,
+            image_min='product_images/300/x.jpg', image_max='product_images/600/x.jpg', category=category,
+        )
+        models.Blog.objects.create(title_uz='Yangiliklar', description_uz='<p>Krossovkalar haqida</p>')
+
+    def search(self, **params):
+        response = self.client.get('/api/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_prefix_and_ranking(self):
+        data = self.search(q='kross', type='product')
+        self.assertEqual([result['item']['uuid'] for result in data['results']], [self.shoe.uuid, self.bag.uuid])
+        self.assertEqual(data['total_items'], 2)
+
+    def test_html_is_not_indexed(self):
+        document = models.SearchDocument.objects.get(object_id=self.shoe.uuid)
+        self.assertTrue(document.body.startswith('Yengil poyabzal '))
+        self.assertNotIn('<', document.body)
+        self.assertEqual(self.search(q='strong')['results'], [])
+        self.assertEqual(len(self.search(q='poyabzal')['results']), 1)
+
+    def test_soft_deleted_rows_leave_the_index(self):
+        self.shoe.is_active = False
+        self.shoe.save()
+        data = self.search(q='krossovka', type='product')
+        self.assertEqual([result['item']['uuid'] for result in data['results']], [self.bag.uuid])
+
+    def test_rebuild(self):
+        models.SearchDocument.objects.all().delete()
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.search(q='krossovka')['total_items'], 3)
+
+
+class TypeaheadTest(TestCase):
+    def setUp(self):
+        # The index lives in the process: start every test from an empty one.
+        typeahead.index = typeahead.PrefixIndex()
+        self.category = models.Category.objects.create(title_uz='Krossovka', image='category_images/x.jpg')
+        self.shoe = models.Product.objects.create(
+            title_uz='Yugurish krossovkasi', price=10, priority=1,
+            image_min='product_images/300/x.jpg', image_max='product_images/600/x.jpg', category=self.category,
+        )
+
+    def suggest(self, **params):
+        response = self.client.get('/api/typeahead/', params)
+        self.assertEqual(response.status_code, 200)
+        return [(item['type'], item['uuid'], item['title']) for item in response.data['results']]
+
+    def test_word_prefix_by_priority(self):
+        self.assertEqual(self.suggest(q='KROSS', lang='uz'), [
+            ('category', self.category.uuid, 'Krossovka'),
+            ('product', self.shoe.uuid, 'Yugurish krossovkasi'),
+        ])
+        self.assertEqual(self.suggest(q='yug', type='category'), [])
+        self.assertEqual(self.suggest(q='kross', lang='uz', limit=1), [('category', self.category.uuid, 'Krossovka')])
+
+    def test_writes_update_the_index_in_place(self):
+        self.suggest(q='kross')
+        self.shoe.is_active = False
+        self.shoe.save()
+        bag = models.Product.objects.create(
+            title_uz='Krossovka sumkasi', price=10, priority=2,
+            image_min='product_images/300/x.jpg', image_max='product_images/600/x.jpg', category=self.category,
+        )
+        with self.assertNumQueries(0):
+            found = self.suggest(q='kross', lang='uz')
+        self.assertEqual(found, [
+            ('category', self.category.uuid, 'Krossovka'),
+            ('product', bag.uuid, 'Krossovka sumkasi'),
+        ])
+
+    @override_settings(TYPEAHEAD_CHECK_INTERVAL=0)
+    def test_other_processes_writes_still_rebuild(self):
+        self.suggest(q='kross')
+        # Another process renames the shoe: only the version tells us.
+        models.Product.objects.filter(pk=self.shoe.pk).update(title_uz='Yugurish tuflisi')
+        caching.bump_version(models.Product)
+        models.Category.objects.create(title_uz='Tufli', image='category_images/x.jpg')
+        models.Product.objects.create(
+            title_uz='Sport sumkasi', price=10, priority=2,
+            image_min='product_images/300/x.jpg', image_max='product_images/600/x.jpg', category=self.category,
+        )
+        self.assertEqual(self.suggest(q='yug', lang='uz'), [('product', self.shoe.uuid, 'Yugurish tuflisi')])
+
+
+@override_settings(TRANSLATION_ASYNC=False, TRANSLATION_BACKEND='main.translation.FakeBackend')
+class SiteBootstrapTest(TestCase):
+    def setUp(self):
+        self.company = models.Company.objects.create(
+            title_uz='Safir', description_uz='Kompaniya', address_uz='Toshkent', address_ru='Ташкент', address_en='Tashkent',
+        )
+        models.CompanyPhone.objects.create(phone='+998901234567')
+        models.CompanyEmail.objects.create(email='info@example.com')
+        models.Category.objects.create(title_uz='Krossovka', image='category_images/x.jpg')
+
+    def test_one_query_per_section_then_cached(self):
+        # company + 4 sections + categories
+        with self.assertNumQueries(6):
+            response = self.client.get('/api/site/', {'include': 'categories,unknown', 'lang': 'uz'})
+        data = response.json()
+        self.assertEqual(data['company']['title'], 'Safir')
+        self.assertEqual([phone['phone'] for phone in data['phones']], ['+998901234567'])
+        self.assertEqual([category['title'] for category in data['categories']], ['Krossovka'])
+        self.assertNotIn('sliders', data)
+
+        with self.assertNumQueries(0):
+            cached = self.client.get('/api/site/', {'include': 'categories', 'lang': 'uz'})
+        self.assertEqual(cached.content, response.content)
+
+    def test_writes_invalidate(self):
+        self.client.get('/api/site/')
+        models.CompanyPhone.objects.create(phone='+998907654321')
+        phones = [phone['phone'] for phone in self.client.get('/api/site/').json()['phones']]
+        self.assertEqual(phones, ['+998901234567', '+998907654321'])
+
+
+class CachedTokenAuthenticationTest(TestCase):
+    def setUp(self):
+        authentication.tokens.clear()
+        self.user = User.objects.create_user('admin', password='secret')
+        self.token = Token.objects.create(user=self.user)
+        self.headers = {'HTTP_AUTHORIZATION': 'Token %s' % self.token.key}
+
+    def test_token_lookup_is_cached(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/cache/stats/', **self.headers).status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/cache/stats/', **self.headers)
+        self.assertEqual(response.data['authTokens']['hits'], 1)
+
+    def test_logout_invalidates(self):
+        self.client.get('/api/cache/stats/', **self.headers)
+        self.assertEqual(self.client.post('/api/auth/logout/', **self.headers).status_code, 200)
+        self.assertEqual(self.client.get('/api/cache/stats/', **self.headers).status_code, 401)
+
+    def test_requests_get_their_own_user(self):
+        authenticate = authentication.CachedTokenAuthentication().authenticate_credentials
+        first, first_token = authenticate(self.token.key)
+        first.first_name = 'Changed'
+        second, second_token = authenticate(self.token.key)
+        self.assertEqual(authentication.tokens.stats()['hits'], 1)
+        self.assertIsNot(first, second)
+        self.assertEqual(second.pk, self.user.pk)
+        self.assertEqual(second.first_name, '')
+        self.assertIs(second_token.user, second)
+
+    def test_deactivation_invalidates(self):
+        self.client.get('/api/cache/stats/', **self.headers)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/cache/stats/', **self.headers).status_code, 401)
+
+
+def login_profile(user):
+    return {'profile': user.username.upper()}
+
+
+class LogInTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('admin', password='secret')
+        Token.objects.create(user=self.user)
+
+    def log_in(self, password='secret', **extra):
+        return self.client.post('/api/auth/login/', {'username': 'admin', 'password': password}, **extra)
+
+    def test_user_and_token_in_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.log_in()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['user']['token'], self.user.auth_token.key)
+
+    @override_settings(LOGIN_PROFILE_HOOKS=['main.tests.login_profile'])
+    def test_profile_hooks(self):
+        self.assertEqual(self.log_in().data['profile'], 'ADMIN')
+
+    @override_settings(PASSWORD_HASHERS=[
+        'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.MD5PasswordHasher',
+    ])
+    def test_old_hashes_are_upgraded(self):
+        self.user.password = make_password('secret', hasher='md5')
+        self.user.save()
+        self.assertEqual(self.log_in().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+
+    @override_settings(LOGIN_MAX_FAILURES=3)
+    def test_failures_are_throttled(self):
+        for i in range(3):
+            self.assertEqual(self.log_in('wrong').status_code, 404)
+        response = self.log_in()
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        # Other usernames from another client are not affected.
+        response = self.client.post('/api/auth/login/', {'username': 'nobody', 'password': 'x'}, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(LOGIN_MAX_FAILURES=3)
+    def test_other_clients_cannot_lock_an_account_out(self):
+        for i in range(3):
+            self.assertEqual(self.log_in('wrong', REMOTE_ADDR='10.0.0.2').status_code, 404)
+        self.assertEqual(self.log_in('wrong', REMOTE_ADDR='10.0.0.2').status_code, 429)
+        self.assertEqual(self.log_in().status_code, 200)
+
+    @override_settings(LOGIN_MAX_FAILURES=3)
+    def test_usernames_are_case_sensitive(self):
+        User.objects.create_user('Admin', password='other')
+        for i in range(3):
+            self.log_in('wrong')
+        response = self.client.post('/api/auth/login/', {'username': 'Admin', 'password': 'other'})
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(LOGIN_MAX_FAILURES_PER_IP=3)
+    def test_client_limit_covers_every_username(self):
+        for username in ['a', 'b', 'c']:
+            self.client.post('/api/auth/login/', {'username': username, 'password': 'x'})
+        self.assertEqual(self.log_in().status_code, 429)
+        self.assertEqual(self.log_in(REMOTE_ADDR='10.0.0.2').status_code, 200)
+
+
+class SchemaTest(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.enterContext(override_settings(SCHEMA_ROOT=self.root))
+        schema.loaded.clear()
+
+    def test_generated_once_and_revalidated(self):
+        response = self.client.get('/api/swagger.json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('/category/', response.json()['paths'])
+        self.assertTrue(os.path.exists(schema.artifact_path(schema.code_version(), '.yaml')))
+
+        response = self.client.get('/api/swagger.json', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get('/api/swagger.yaml')['Content-Type'], 'application/yaml')
+
+    def test_ui_loads_the_precomputed_schema(self):
+        with mock.patch.object(schema.OpenAPISchemaGenerator, 'get_schema') as get_schema:
+            for url in ('/api/swagger/', '/api/redoc/'):
+                response = self.client.get(url)
+                self.assertContains(response, '/api/swagger.json')
+                self.assertContains(response, schema.INFO.title)
+        get_schema.assert_not_called()
+
+
+class CreateContactTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        contacts.buckets.clear()
+
+    def submit(self, message='Salom', phone='+998 90 123-45-67', **extra):
+        return self.client.post('/api/contact/create/', {'name': 'Ali', 'phone': phone, 'message': message}, **extra)
+
+    def test_duplicates_are_stored_once(self):
+        self.assertEqual(self.submit().status_code, 200)
+        self.assertEqual(self.submit(phone='+998901234567').status_code, 202)
+        self.assertEqual(models.Contact.objects.count(), 1)
+
+    @override_settings(CONTACT_RATE_LIMITS={'ip': (2, 60), 'phone': (10, 60)})
+    def test_rate_limited_per_ip(self):
+        self.assertEqual(self.submit('1').status_code, 200)
+        self.assertEqual(self.submit('2').status_code, 200)
+        response = self.submit('3')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+        self.assertEqual(self.submit('3', REMOTE_ADDR='10.0.0.2').status_code, 200)
+
+    def test_failed_submissions_are_not_duplicates(self):
+        self.client.raise_request_exception = False
+        with mock.patch('main.serializers.ContactSerializer.save', side_effect=DatabaseError):
+            self.assertEqual(self.submit().status_code, 500)
+        self.assertEqual(self.submit().status_code, 200)
+        self.assertEqual(models.Contact.objects.count(), 1)
+
+    @override_settings(CONTACT_BUFFER_SIZE=10, CONTACT_BUFFER_MAX_AGE=60)
+    def test_buffer_drops_only_the_rows_that_fail(self):
+        buffer = contacts.Buffer('main.Contact')
+        self.addCleanup(buffer.flush)
+        buffer.add(models.Contact(name='Ali', phone='1', message='Salom'))
+        buffer.add(models.Contact(name=None, phone='2', message='Salom'))
+        buffer.add(models.Contact(name='Vali', phone='3', message='Salom'))
+        with self.assertLogs('main.contacts') as logs:
+            self.assertEqual(buffer.flush(), 2)
+        self.assertIn("'phone': '2'", logs.output[-1])
+        self.assertEqual(sorted(models.Contact.objects.values_list('phone', flat=True)), ['1', '3'])
+        self.assertEqual(len(buffer), 0)
+
+    @override_settings(CONTACT_BUFFERED=True, CONTACT_BUFFER_SIZE=10, CONTACT_BUFFER_MAX_ROWS=2, CONTACT_BUFFER_MAX_AGE=60)
+    def test_full_buffer_saves_directly(self):
+        self.addCleanup(contacts.buffer.flush)
+        for i in range(2):
+            self.assertEqual(self.submit(str(i), phone='90000000%d' % i).status_code, 202)
+        self.assertEqual(self.submit('2', phone='900000002').status_code, 200)
+        self.assertEqual(len(contacts.buffer), 2)
+        self.assertEqual(models.Contact.objects.count(), 1)
+
+    @override_settings(CONTACT_BUFFERED=True, CONTACT_BUFFER_SIZE=3, CONTACT_BUFFER_MAX_AGE=60)
+    def test_buffered_writes(self):
+        self.addCleanup(contacts.buffer.flush)
+        for i in range(2):
+            self.assertEqual(self.submit(str(i), phone='90000000%d' % i).status_code, 202)
+        self.assertEqual(models.Contact.objects.count(), 0)
+        with CaptureQueriesContext(connection) as queries:
+            self.submit('2', phone='900000002')
+        self.assertEqual([query['sql'].split()[0] for query in queries if 'SAVEPOINT' not in query['sql']], ['INSERT'])
+        self.assertEqual(models.Contact.objects.count(), 3)
@@ -0,0 +1,396 @@
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from bs4 import BeautifulSoup, NavigableString
+from deep_translator import GoogleTranslator
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+SOURCE_LANGUAGE = 'uz'
+TARGET_LANGUAGES = ('ru', 'en')
+LANGUAGES = (SOURCE_LANGUAGE,) + TARGET_LANGUAGES
+
+STATUS_PENDING = 'pending'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+STATUS_CHOICES = (
+    (STATUS_PENDING, 'Pending'),
+    (STATUS_DONE, 'Done'),
+    (STATUS_FAILED, 'Failed'),
+)
+
+
+#########################
+# Backends
+#########################
+
+class TranslationBackend:
+    """
+    Base class for translation backends.
+
+    A backend receives a list of plain text segments and returns their
+    translations in the same order.
+    """
+
+    def translate_batch(self, texts, source, target):
+        raise NotImplementedError
+
+
+class GoogleBackend(TranslationBackend):
+    def translate_batch(self, texts, source, target):
+        return GoogleTranslator(source=source, target=target).translate_batch(texts)
+
+
+class FakeBackend(TranslationBackend):
+    """
+    Local backend for tests and benchmarks: no network, deterministic output.
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def translate_batch(self, texts, source, target):
+        self.calls += 1
+        return ['[%s] %s' % (target, text) for text in texts]
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    path = getattr(settings, 'TRANSLATION_BACKEND', 'main.translation.GoogleBackend')
+    if _backend is None or _backend.__class__ is not import_string(path):
+        _backend = import_string(path)()
+    return _backend
+
+
+#########################
+# Translation memory
+#########################
+
+def normalize(text):
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def segment_hash(text):
+    return hashlib.sha256(normalize(text).encode('utf-8')).hexdigest()
+
+
+class MemoryCache:
+    """
+    Translation memory: an in-process LRU in front of the TranslationMemory
+    table, keyed by (normalized segment hash, target language).
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.db_hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        return {
+            'size': len(self.entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'db_hits': self.db_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def recall(self, segments, target):
+        """
+        Look segments up in the LRU, then in the database.
+
+        Returns ({segment: translation}, [missing segments]).
+        """
+        from .models import TranslationMemory
+
+        found, missing = {}, []
+        for segment in segments:
+            value = self.get((segment_hash(segment), target))
+            if value is None:
+                missing.append(segment)
+            else:
+                found[segment] = value
+        with self.lock:
+            self.hits += len(found)
+
+        if missing and getattr(settings, 'TRANSLATION_MEMORY_DB', True):
+            hashes = {segment_hash(segment): segment for segment in missing}
+            rows = TranslationMemory.objects.filter(
+                target_lang=target, source_hash__in=list(hashes),
+            ).values_list('source_hash', 'translated_text')
+            recalled = 0
+            for source_hash, translated in rows:
+                found[hashes[source_hash]] = translated
+                self.put((source_hash, target), translated)
+                recalled += 1
+            missing = [segment for segment in missing if segment not in found]
+            with self.lock:
+                self.db_hits += recalled
+
+        with self.lock:
+            self.misses += len(missing)
+        return found, missing
+
+    def remember(self, translations, target):
+        from .models import TranslationMemory
+
+        rows = []
+        for segment, translated in translations.items():
+            key = segment_hash(segment)
+            self.put((key, target), translated)
+            rows.append(TranslationMemory(
+                source_hash=key,
+                target_lang=target,
+                source_text=segment,
+                translated_text=translated,
+            ))
+        if rows and getattr(settings, 'TRANSLATION_MEMORY_DB', True):
+            TranslationMemory.objects.bulk_create(rows, ignore_conflicts=True, batch_size=500)
+
+
+memory = MemoryCache(getattr(settings, 'TRANSLATION_MEMORY_SIZE', 10000))
+
+
+#########################
+# Segments
+#########################
+
+def text_nodes(soup):
+    """
+    Return the translatable text nodes of a parsed document.
+
+    Comments, doctypes and whitespace-only nodes are skipped.
+    """
+    return [
+        node for node in soup.find_all(string=True)
+        if type(node) is NavigableString and node.strip()
+    ]
+
+
+def make_batches(texts, max_items, max_chars):
+    batch, size = [], 0
+    for text in texts:
+        if batch and (len(batch) >= max_items or size + len(text) > max_chars):
+            yield batch
+            batch, size = [], 0
+        batch.append(text)
+        size += len(text)
+    if batch:
+        yield batch
+
+
+def translate_segments(segments, target, source=SOURCE_LANGUAGE):
+    """
+    Translate a list of unique segments into `target`.
+
+    Returns a dict mapping each source segment to its translation.
+    """
+    return translate_many(segments, [target], source)[target]
+
+
+def translate_many(segments, targets, source=SOURCE_LANGUAGE):
+    """
+    Translate unique segments into several languages at once.
+
+    Segments already in the translation memory are served from it. The rest
+    are split into batches bounded by TRANSLATION_BATCH_SIZE items and
+    TRANSLATION_BATCH_CHARS characters; batches for all target languages run
+    concurrently on at most TRANSLATION_MAX_WORKERS threads.
+    Returns {target: {segment: translation}}.
+    """
+    backend = get_backend()
+    segments = list(dict.fromkeys(segment for segment in segments if segment.strip()))
+    result = {target: {} for target in targets}
+    if not segments:
+        return result
+
+    max_items = getattr(settings, 'TRANSLATION_BATCH_SIZE', 50)
+    max_chars = getattr(settings, 'TRANSLATION_BATCH_CHARS', 4500)
+    max_workers = getattr(settings, 'TRANSLATION_MAX_WORKERS', 4)
+
+    tasks, missing_by_target = [], {}
+    for target in targets:
+        result[target], missing = memory.recall(segments, target)
+        missing_by_target[target] = missing
+        tasks.extend((target, batch) for batch in make_batches(missing, max_items, max_chars))
+    if not tasks:
+        return result
+
+    def run(task):
+        target, batch = task
+        return target, batch, backend.translate_batch(batch, source, target)
+
+    if len(tasks) == 1 or max_workers <= 1:
+        done = map(run, tasks)
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(tasks))) as pool:
+            done = list(pool.map(run, tasks))
+
+    fresh = {target: {} for target in targets}
+    for target, batch, translated in done:
+        for text, translation in zip(batch, translated):
+            if translation:
+                fresh[target][text] = translation
+    for target in targets:
+        # Segments the backend returned nothing for fall back to the source
+        # text, which is not remembered so that they are retried next time.
+        memory.remember(fresh[target], target)
+        result[target].update(fresh[target])
+        for segment in missing_by_target[target]:
+            result[target].setdefault(segment, segment)
+    return result
+
+
+#########################
+# Documents
+#########################
+
+class Document:
+    """
+    A parsed field value whose text nodes can be swapped per language.
+    """
+
+    def __init__(self, html_text):
+        self.soup = BeautifulSoup(html_text, "html.parser")
+        self.nodes = text_nodes(self.soup)
+        self.originals = [str(node) for node in self.nodes]
+
+    @property
+    def segments(self):
+        return [text.strip() for text in self.originals]
+
+    def render(self, translations):
+        for i, node in enumerate(self.nodes):
+            text = self.originals[i]
+            stripped = text.strip()
+            leading = text[:len(text) - len(text.lstrip())]
+            trailing = text[len(text.rstrip()):]
+            new_node = NavigableString(leading + translations.get(stripped, stripped) + trailing)
+            node.replace_with(new_node)
+            self.nodes[i] = new_node
+        return str(self.soup)
+
+
+def translate_text(text, target, source=SOURCE_LANGUAGE):
+    if not text or not text.strip():
+        return text
+    return translate_segments([text.strip()], target, source)[text.strip()]
+
+
+def translate_html(html_text, target, source=SOURCE_LANGUAGE):
+    document = Document(html_text)
+    return document.render(translate_segments(document.segments, target, source))
+
+
+def translatable_fields(instance):
+    """
+    Yield (uz_field, [(lang, field_name), ...]) for every `_uz` field of the
+    instance that has language siblings.
+    """
+    for field in instance._meta.fields:
+        if not field.name.endswith('_' + SOURCE_LANGUAGE):
+            continue
+        base = field.name[:-len(SOURCE_LANGUAGE)]
+        siblings = [
+            (lang, base + lang) for lang in TARGET_LANGUAGES
+            if hasattr(instance, base + lang)
+        ]
+        if siblings:
+            yield field.name, siblings
+
+
+def translated_bases(model):
+    """
+    Names like 'title' for which the model has title_uz/title_ru/title_en.
+    """
+    names = [field.name for field in model._meta.fields]
+    return [
+        name[:-len(SOURCE_LANGUAGE) - 1] for name in names
+        if name.endswith('_' + SOURCE_LANGUAGE)
+        and all(name[:-len(SOURCE_LANGUAGE)] + lang in names for lang in TARGET_LANGUAGES)
+    ]
+
+
+def needs_translation(instance):
+    return any(getattr(instance, name) for name, siblings in translatable_fields(instance))
+
+
+def translate_instance(instance, targets=TARGET_LANGUAGES, overwrite=True):
+    """
+    Fill the `_ru`/`_en` siblings of every `_uz` field on the instance.
+
+    Text nodes from all fields are collected and deduplicated first, so each
+    distinct segment is sent to the backend once per target language. With
+    overwrite=False siblings that already have a value are left alone.
+    Returns the names of the fields that were set.
+    """
+    documents = []
+    for name, siblings in translatable_fields(instance):
+        value = getattr(instance, name)
+        siblings = [
+            (lang, field) for lang, field in siblings
+            if lang in targets and (overwrite or not getattr(instance, field))
+        ]
+        if value and siblings:
+            documents.append((Document(value), siblings))
+
+    segments = [segment for document, _ in documents for segment in document.segments]
+    translations = translate_many(segments, list(targets))
+
+    updated = []
+    for document, siblings in documents:
+        for lang, field in siblings:
+            setattr(instance, field, document.render(translations[lang]))
+            updated.append(field)
+    return updated
+
+
+#########################
+# Background jobs
+#########################
+
+def run_job(instance, job):
+    """
+    Job handler for kind 'translate': fill the missing translations of a
+    freshly created row.
+    """
+    try:
+        updated = translate_instance(instance, overwrite=False)
+    except Exception:
+        if job.is_last_attempt:
+            instance.translation_status = STATUS_FAILED
+            instance.save(update_fields=['translation_status'])
+        raise
+    instance.translation_status = STATUS_DONE
+    instance.save(update_fields=updated + ['translation_status', 'updated_at'])
@@ -0,0 +1,263 @@
+"""
+Typeahead suggestions from an in-process prefix index.
+
+Titles of active products and categories, in every language, are kept in a
+sorted array of normalized keys (one per word start, so "krossovka" also
+finds "Yugurish krossovkasi") searched with bisect. Main.save and delete
+update it in place; changes made by other processes are noticed through
+the caching versions of the models, checked at most once every
+TYPEAHEAD_CHECK_INTERVAL seconds, and trigger a rebuild. The number of
+entries is capped at TYPEAHEAD_MAX_ENTRIES, highest priority rows first.
+"""
+import bisect
+import operator
+import re
+import threading
+import time
+import unicodedata
+
+from django.conf import settings
+
+from . import caching, translation
+
+
+KINDS = {
+    'category': 'main.Category',
+    'product': 'main.Product',
+}
+
+WORD_RE = re.compile(r'\w+')
+
+# Sorts after every character: (prefix + LAST,) bounds the keys starting
+# with `prefix`.
+LAST = '\U0010ffff'
+
+# priority, kind, uuid, lang
+SUGGESTION_ORDER = operator.itemgetter(1, 2, 3, 4)
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text.casefold())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(WORD_RE.findall(text))
+
+
+def model_for(kind):
+    from django.apps import apps
+
+    return apps.get_model(KINDS[kind])
+
+
+def kind_of(model):
+    for kind, label in KINDS.items():
+        if model._meta.label == label:
+            return kind
+    return None
+
+
+def row_entries(kind, row):
+    """
+    (key, priority, kind, uuid, lang) entries and {(kind, uuid, lang): title}
+    of a row.
+    """
+    max_words = getattr(settings, 'TYPEAHEAD_MAX_WORDS', 4)
+    entries, titles = [], {}
+    for lang in translation.LANGUAGES:
+        title = getattr(row, 'title_%s' % lang, None)
+        if not title:
+            continue
+        titles[kind, row.pk, lang] = title
+        words = normalize(title).split(' ')
+        for i in range(min(len(words), max_words)):
+            entries.append((' '.join(words[i:]), row.priority, kind, row.pk, lang))
+    return entries, titles
+
+
+class PrefixIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = []
+        self.titles = {}
+        self.rows = {}
+        self.memo = {}
+        self.generation = 0
+        self.versions = None
+        self.built_at = 0.0
+        self.checked_at = 0.0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def built(self):
+        return self.versions is not None
+
+    def load(self, rows):
+        """
+        Replace the whole index with `rows`, an iterable of (kind, row)
+        in decreasing importance.
+        """
+        limit = getattr(settings, 'TYPEAHEAD_MAX_ENTRIES', 200000)
+        entries, titles, index_rows = [], {}, {}
+        for kind, row in rows:
+            row_keys, row_titles = row_entries(kind, row)
+            if len(entries) + len(row_keys) > limit:
+                break
+            entries += row_keys
+            titles.update(row_titles)
+            index_rows[kind, row.pk] = row_keys
+        entries.sort()
+        with self.lock:
+            self.entries, self.titles, self.rows = entries, titles, index_rows
+            self.changed()
+            self.built_at = self.checked_at = time.monotonic()
+
+    def add(self, kind, row):
+        row_keys, row_titles = row_entries(kind, row)
+        limit = getattr(settings, 'TYPEAHEAD_MAX_ENTRIES', 200000)
+        with self.lock:
+            self.discard(kind, row.pk)
+            self.changed()
+            if len(self.entries) + len(row_keys) > limit:
+                return
+            for entry in row_keys:
+                bisect.insort(self.entries, entry)
+            self.titles.update(row_titles)
+            self.rows[kind, row.pk] = row_keys
+
+    def remove(self, kind, pk):
+        with self.lock:
+            self.discard(kind, pk)
+            self.changed()
+
+    def discard(self, kind, pk):
+        # Called with the lock held.
+        for entry in self.rows.pop((kind, pk), ()):
+            i = bisect.bisect_left(self.entries, entry)
+            if i < len(self.entries) and self.entries[i] == entry:
+                del self.entries[i]
+            self.titles.pop((kind, pk, entry[4]), None)
+
+    def changed(self):
+        # Called with the lock held.
+        self.generation += 1
+        self.memo = {}
+
+    def lookup(self, prefix, limit=10, lang=None, kinds=None):
+        """
+        Suggestions whose title has a word starting with `prefix`, by
+        priority, as dicts {type, uuid, lang, title}. A title shared by
+        several languages is suggested once. Only the first TYPEAHEAD_SCAN
+        keys starting with `prefix` are considered, which bounds the cost of
+        one- and two-letter prefixes; their results are memoized until the
+        next change.
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        memo_key = (prefix, limit, lang, tuple(kinds or ()))
+        found = self.memo.get(memo_key)
+        if found is not None:
+            return found
+        scan = getattr(settings, 'TYPEAHEAD_SCAN', 500)
+        with self.lock:
+            entries, titles, generation = self.entries, self.titles, self.generation
+            start = bisect.bisect_left(entries, (prefix,))
+            end = bisect.bisect_left(entries, (prefix + LAST,), start, min(start + scan, len(entries)))
+            window = entries[start:end]
+        if lang or kinds:
+            window = [entry for entry in window if (not lang or entry[4] == lang) and (not kinds or entry[2] in kinds)]
+        window.sort(key=SUGGESTION_ORDER)
+        found, seen = [], set()
+        for key, priority, kind, pk, entry_lang in window:
+            title = titles.get((kind, pk, entry_lang))
+            if title is None or (kind, pk, title) in seen:
+                continue
+            seen.add((kind, pk, title))
+            found.append({'type': kind, 'uuid': pk, 'lang': entry_lang, 'title': title})
+            if len(found) == limit:
+                break
+        with self.lock:
+            if generation == self.generation:
+                if len(self.memo) >= getattr(settings, 'TYPEAHEAD_MEMO_SIZE', 10000):
+                    self.memo = {}
+                self.memo[memo_key] = found
+        return found
+
+
+index = PrefixIndex()
+
+
+def current_versions():
+    return caching.get_versions([model_for(kind) for kind in KINDS])
+
+
+def build():
+    versions = current_versions()
+    only = ['pk', 'priority'] + ['title_%s' % lang for lang in translation.LANGUAGES]
+    querysets = [
+        (kind, model_for(kind).objects.filter(is_active=True).order_by('priority', 'pk').only(*only))
+        for kind in KINDS
+    ]
+    # Categories first: they are few and keep their place when the cap is hit.
+    index.load((kind, row) for kind, queryset in querysets for row in queryset.iterator())
+    index.versions = versions
+
+
+def ensure_fresh():
+    """
+    Build the index on first use, and rebuild it when another process has
+    written to the models or it is older than TYPEAHEAD_MAX_AGE seconds.
+    """
+    now = time.monotonic()
+    if not index.built:
+        build()
+        return
+    if now - index.checked_at < getattr(settings, 'TYPEAHEAD_CHECK_INTERVAL', 1.0):
+        return
+    index.checked_at = now
+    if current_versions() != index.versions or now - index.built_at > getattr(settings, 'TYPEAHEAD_MAX_AGE', 300):
+        build()
+
+
+def suggest(prefix, limit=10, lang=None, kinds=None):
+    ensure_fresh()
+    return index.lookup(prefix, limit, lang, kinds)
+
+
+def absorb_own_write(kind):
+    """
+    Our own write bumped the version of `kind` by one; it is not a reason to
+    rebuild. Any other step means another process wrote too, so the stored
+    version is left behind and the next check rebuilds.
+    """
+    position = list(KINDS).index(kind)
+    version = caching.get_version(model_for(kind))
+    with index.lock:
+        if index.versions is not None and index.versions[position] == version - 1:
+            index.versions[position] = version
+
+
+def update(instance, update_fields=None):
+    """
+    Called by Main.save: apply the change to this process's index.
+    """
+    kind = kind_of(type(instance))
+    if kind is None or not index.built:
+        return
+    absorb_own_write(kind)
+    if update_fields is not None:
+        watched = {'is_active', 'priority'} | {'title_%s' % lang for lang in translation.LANGUAGES}
+        if not watched & set(update_fields):
+            return
+    if instance.is_active:
+        index.add(kind, instance)
+    else:
+        index.remove(kind, instance.pk)
+
+
+def remove(instance):
+    kind = kind_of(type(instance))
+    if kind is not None and index.built:
+        absorb_own_write(kind)
+        index.remove(kind, instance.pk)
@@ -0,0 +1,135 @@
+"""
+Multi-image uploads.
+
+The request body is spooled to temporary files (never held in memory) with a
+per-file size cap, every file is checked from its header before anything is
+decoded, the files are stored concurrently, and the rows are inserted with a
+single bulk_create in one transaction.
+"""
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, TemporaryFileUploadHandler
+from django.db import transaction
+from PIL import Image
+
+from . import caching, images, jobs, storage
+
+
+# Leading bytes of the accepted formats: (offset, signature, format).
+SIGNATURES = (
+    (0, b'\xff\xd8\xff', 'JPEG'),
+    (0, b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (0, b'GIF87a', 'GIF'),
+    (0, b'GIF89a', 'GIF'),
+    (8, b'WEBP', 'WEBP'),
+    (4, b'ftypavif', 'AVIF'),
+)
+
+
+class UploadError(Exception):
+    pass
+
+
+def max_size():
+    return getattr(settings, 'IMAGE_UPLOAD_MAX_SIZE', 20 * 1024 * 1024)
+
+
+class CappedUploadHandler(FileUploadHandler):
+    """
+    Skips files larger than IMAGE_UPLOAD_MAX_SIZE as they stream in and
+    records their names in `request.rejected_uploads`.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > max_size():
+            self.request.rejected_uploads = getattr(self.request, 'rejected_uploads', []) + [self.file_name]
+            raise SkipFile()
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def spool(request):
+    """
+    Make `request` write uploaded files straight to temporary files, with
+    the size cap. Must be called before request.data/FILES is read.
+    """
+    request = getattr(request, '_request', request)
+    request.upload_handlers = [CappedUploadHandler(request), TemporaryFileUploadHandler(request)]
+
+
+def rejected(request):
+    return getattr(getattr(request, '_request', request), 'rejected_uploads', [])
+
+
+def sniff(upload):
+    """
+    Image format of `upload` from its leading bytes and header, without
+    decoding the pixels. Raises UploadError for anything else.
+    """
+    upload.seek(0)
+    head = upload.read(16)
+    upload.seek(0)
+    if not any(head[offset:offset + len(signature)] == signature for offset, signature, _ in SIGNATURES):
+        raise UploadError('%s is not a supported image' % upload.name)
+    try:
+        with Image.open(upload) as image:
+            image_format, (width, height) = image.format, image.size
+    except Exception:
+        raise UploadError('%s is not a valid image' % upload.name)
+    finally:
+        upload.seek(0)
+    if Image.MAX_IMAGE_PIXELS and width * height > Image.MAX_IMAGE_PIXELS:
+        raise UploadError('%s is too large (%dx%d)' % (upload.name, width, height))
+    return image_format
+
+
+def store(instance, field_name, upload):
+    field = instance._meta.get_field(field_name)
+    return field.storage.save(field.generate_filename(instance, upload.name), upload, max_length=field.max_length)
+
+
+def bulk_create(model, uploads, **values):
+    """
+    Create one `model` row per upload, with `values` for the other fields.
+    The uploads are sniffed and stored in a thread pool, then inserted in a
+    single query. Raises UploadError before storing anything if one of them
+    is not an acceptable image. Returns the created rows.
+    """
+    limit = getattr(settings, 'IMAGE_UPLOAD_MAX_FILES', 50)
+    if len(uploads) > limit:
+        raise UploadError('At most %d files can be uploaded at once' % limit)
+
+    instances = [model(**values) for _ in uploads]
+    source_field = getattr(model, 'image_source_field', 'image')
+    pipeline = hasattr(model, 'image_status')
+    workers = getattr(settings, 'IMAGE_UPLOAD_WORKERS', 4)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(sniff, uploads))
+        names = list(executor.map(store, instances, [source_field] * len(uploads), uploads))
+
+    for instance, name in zip(instances, names):
+        setattr(instance, source_field, name)
+        if pipeline:
+            instance.image_status = images.STATUS_PENDING
+
+    process_async = getattr(settings, 'IMAGE_PROCESSING_ASYNC', True)
+    with transaction.atomic():
+        created = model.objects.bulk_create(instances)
+        storage.acquire(collections.Counter(names))
+        if pipeline and process_async:
+            jobs.enqueue_many('images', created)
+    caching.bump_version(model)
+    for instance in created:
+        storage.remember(instance)
+        if pipeline and not process_async:
+            images.process(instance)
+    return created
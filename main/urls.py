@@ -1,18 +1,5 @@
 from django.urls import path, re_path 
-from . import views
-from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-
-schema_view = get_schema_view(
-    openapi.Info(
-      title="API Documentation",
-      default_version='v1',
-      description="API documentation for your project",
-    ),
-    public=True,
-    permission_classes=(permissions.AllowAny,), 
-)
+from . import schema, views
 
 
 urlpatterns_views = [
@@ -84,12 +71,24 @@ urlpatterns_views = [
     path('contact/create/', views.createContact, name='create_contact'),
     path('contact/update/<str:uuid>/', views.updateContact, name='update_contact'),
     path('contact/delete/<str:uuid>/', views.deleteContact, name='delete_contact'),
+
+    # Site
+    path('site/', views.viewSite, name='view_site'),
+
+    # Search
+    path('search/', views.viewSearch, name='view_search'),
+    path('typeahead/', views.viewTypeahead, name='view_typeahead'),
+
+    # Cache
+    path('cache/stats/', views.viewCacheStats, name='view_cache_stats'),
 ]
 
 urlpatterns = [
-    re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema.serve, name='schema-json'),
+    # The UIs load the schema from `schema-json` (see
+    # SWAGGER_SETTINGS/REDOC_SETTINGS['SPEC_URL']).
+    path('swagger/', schema.ui, {'renderer': 'swagger'}, name='schema-swagger-ui'),
+    path('redoc/', schema.ui, {'renderer': 'redoc'}, name='schema-redoc'),
 ] + urlpatterns_views 
 
 
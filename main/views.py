@@ -5,10 +5,13 @@ from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes, authentication_classes, parser_classes
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.authentication import TokenAuthentication
+from .auth import authentication
+from .auth.authentication import CachedTokenAuthentication
 from django.shortcuts import get_object_or_404
+from django.http import HttpResponse
+from django.conf import settings
 from rest_framework.parsers import MultiPartParser, FormParser
-from . import funcs
+from . import caching, contacts, funcs, images, search, translation, typeahead, uploads
 
 # --- Add import for drf_yasg decorators ---
 from drf_yasg.utils import swagger_auto_schema
@@ -16,6 +19,24 @@ from drf_yasg import openapi
 # --- End add import for drf_yasg decorators ---
 
 
+LANGUAGE_PARAMETER = openapi.Parameter('lang', openapi.IN_QUERY, description="Only return this language (uz, ru, en); translated fields are collapsed into `title`, `description`, ...", type=openapi.TYPE_STRING, enum=['uz', 'ru', 'en'])
+
+PAGINATION_PARAMETERS = [
+    openapi.Parameter('page', openapi.IN_QUERY, description="Page number", type=openapi.TYPE_INTEGER, default=1),
+    openapi.Parameter('page_size', openapi.IN_QUERY, description="Items per page", type=openapi.TYPE_INTEGER),
+    openapi.Parameter('cursor', openapi.IN_QUERY, description="Cursor pagination: `next_cursor` of the previous page, empty for the first page", type=openapi.TYPE_STRING),
+]
+
+FIELDS_PARAMETERS = [
+    openapi.Parameter('fields', openapi.IN_QUERY, description="Comma-separated list of fields to return", type=openapi.TYPE_STRING),
+    openapi.Parameter('expand', openapi.IN_QUERY, description="Comma-separated list of nested relations to include (e.g. `category,product_images,total_images` for products); when `fields` or `expand` is given, relations that are not listed are neither returned nor queried", type=openapi.TYPE_STRING),
+]
+
+READ_PARAMETERS = [LANGUAGE_PARAMETER] + FIELDS_PARAMETERS
+
+LIST_PARAMETERS = READ_PARAMETERS + PAGINATION_PARAMETERS
+
+
 #########################
 # Category
 #########################
@@ -23,6 +44,7 @@ from drf_yasg import openapi
 @swagger_auto_schema(
     method='GET',
     operation_description="View all categories.",
+    manual_parameters=LIST_PARAMETERS,
     responses={
         status.HTTP_200_OK: ser.CategorySerializer(many=True),
     },
@@ -30,11 +52,12 @@ from drf_yasg import openapi
 )
 
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
+@caching.conditional(models.Category)
+@caching.cache_response(models.Category)
 def viewCategory(request):
     data = models.Category.objects.filter(is_active=True)
-    serialized_data = ser.CategorySerializer(data, many=True)
-    return Response({"categories": serialized_data.data}, status=status.HTTP_200_OK)
+    return funcs.paginated_response(request, data, ser.CategorySerializer, "categories")
 
 @swagger_auto_schema(
     method='PUT',
@@ -48,10 +71,11 @@ def viewCategory(request):
     tags=["Category"]
 )
 @api_view(['PUT'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def updateCategory(request, uuid):
     category = get_object_or_404(models.Category, uuid=uuid)
+    images.attach_upload(category, request.FILES.get('image'))
     serializer = ser.CategorySerializer(category, data=request.data, partial=True)
 
     if serializer.is_valid():
@@ -73,15 +97,16 @@ def updateCategory(request, uuid):
 )
 
 @api_view(['POST'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def createCategory(request):
-    category = models.Category.objects.create(
+    category = models.Category(
         title_uz = request.data['title_uz'],
-        image = request.FILES.get('image'),
         description_uz =  request.data.get('description_uz'),
         priority = request.data['priority'],
     )
+    images.attach_upload(category, request.FILES.get('image'))
+    category.save()
     serializer = ser.CategorySerializer(category)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -98,7 +123,7 @@ def createCategory(request):
     tags=["Category"]
 )
 @api_view(['DELETE'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def deleteCategory(request, uuid):
     print("asdasda s-=-=-=-=-=-=-=-=")
@@ -115,10 +140,16 @@ def deleteCategory(request, uuid):
 
 @swagger_auto_schema(
     method='get',
-    operation_description="View active products. Initially returns 12 products, and more can be loaded incrementally (0-12, 12-24, 24-36, etc.).",
+    operation_description="View active products. Initially returns 12 products, and more can be loaded incrementally (0-12, 12-24, 24-36, etc.). "
+                          "Pass `cursor` (empty for the first page) to switch to cursor pagination: only the next `page_size` products are returned together with `next_cursor`.",
     manual_parameters=[
+        *READ_PARAMETERS,
         openapi.Parameter('category', openapi.IN_QUERY, description="Filter products by category UUID", type=openapi.TYPE_STRING),
         openapi.Parameter('limit', openapi.IN_QUERY, description="Number of products to fetch (increases by 12 each time)", type=openapi.TYPE_INTEGER, default=12),
+        openapi.Parameter('cursor', openapi.IN_QUERY, description="Cursor returned as `next_cursor` by the previous page; empty for the first page", type=openapi.TYPE_STRING),
+        openapi.Parameter('page_size', openapi.IN_QUERY, description="Products per page in cursor mode (max 100)", type=openapi.TYPE_INTEGER, default=12),
+        openapi.Parameter('page', openapi.IN_QUERY, description="Page number; switches to page/page_size pagination", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('with_total', openapi.IN_QUERY, description="Also return the total number of products in cursor mode", type=openapi.TYPE_BOOLEAN, default=False),
     ],
     responses={
         status.HTTP_200_OK: openapi.Response(
@@ -126,6 +157,8 @@ def deleteCategory(request, uuid):
             schema=openapi.Schema(type=openapi.TYPE_OBJECT,properties={
                     "products": openapi.Schema(type=openapi.TYPE_ARRAY,items=openapi.Schema(type=openapi.TYPE_OBJECT)),
                     "next_limit": openapi.Schema(type=openapi.TYPE_INTEGER,description="Next limit for fetching more products"),
+                    "next_cursor": openapi.Schema(type=openapi.TYPE_STRING,description="Cursor of the next page (cursor mode)"),
+                    "total": openapi.Schema(type=openapi.TYPE_INTEGER,description="Total number of products (cursor mode with `with_total`)"),
                     "has_more": openapi.Schema(type=openapi.TYPE_BOOLEAN,description="Indicates if more products are available")
                 },
             ),
@@ -137,7 +170,9 @@ def deleteCategory(request, uuid):
 
 
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
+@caching.conditional(models.Product, models.Category, models.ProductImage)
+@caching.cache_response(models.Product, models.Category, models.ProductImage)
 def viewProduct(request):
     products = models.Product.objects.filter(is_active=True)
     category = request.GET.get('category')
@@ -147,15 +182,22 @@ def viewProduct(request):
         category_instance = get_object_or_404(models.Category, uuid=category)
         products = products.filter(category=category_instance)
 
+    context = funcs.serializer_context(request, ordering=('priority', 'uuid'))
+    if 'cursor' in request.GET:
+        return viewProductPage(request, ser.ProductSerializer.setup_queryset(products, context), context)
+
+    if 'page' in request.GET:
+        return funcs.paginated_response(request, products, ser.ProductSerializer, "products")
+
     try:
         limit = int(request.GET.get('limit', 12)) 
     except ValueError:
         limit = 12
 
-    total_products = products.count()
-    product_list = products[:limit] 
+    total_products = caching.cached_count(products)
+    product_list = ser.ProductSerializer.setup_queryset(products, context)[:limit] 
 
-    serialized_data = ser.ProductSerializer(product_list, many=True)
+    serialized_data = ser.ProductSerializer(product_list, many=True, context=context)
 
     return Response({
         "products": serialized_data.data,
@@ -164,9 +206,28 @@ def viewProduct(request):
     }, status=status.HTTP_200_OK)
 
 
+def viewProductPage(request, products, context):
+    page_size = min(funcs.get_page_size(request, default=12), 100)
+
+    try:
+        page = funcs.paginate_keyset(products, request.GET.get('cursor'), page_size)
+    except ValueError as e:
+        return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    data = {
+        "products": ser.ProductSerializer(page['items'], many=True, context=context).data,
+        "next_cursor": page['next_cursor'],
+        "has_more": page['has_more'],
+    }
+    if request.GET.get('with_total') in ('1', 'true', 'True'):
+        data["total"] = caching.cached_count(products)
+    return Response(data, status=status.HTTP_200_OK)
+
+
 @swagger_auto_schema(
     method='GET',
     operation_description="View a specific product.",
+    manual_parameters=READ_PARAMETERS,
     responses={
         status.HTTP_200_OK: ser.ProductSerializer,
     },
@@ -174,10 +235,14 @@ def viewProduct(request):
 )
 
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
+@caching.conditional(models.Product, models.Category, models.ProductImage)
+@caching.cache_response(models.Product, models.Category, models.ProductImage)
 def viewProductDetail(request, uuid):
-    product = get_object_or_404(models.Product, uuid=uuid)
-    serialized_data = ser.ProductSerializer(product)
+    context = funcs.serializer_context(request)
+    products = ser.ProductSerializer.setup_queryset(models.Product.objects.all(), context)
+    product = get_object_or_404(products, uuid=uuid)
+    serialized_data = ser.ProductSerializer(product, context=context)
     return Response({"productDetail": serialized_data.data}, status=status.HTTP_200_OK)
 
 @swagger_auto_schema(
@@ -221,20 +286,20 @@ def viewProductDetail(request, uuid):
     tags=["Product"]
 )
 @api_view(['POST'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def createProduct(request):
     try: 
         category = get_object_or_404(models.Category, uuid=request.data['category'])
-        product = models.Product.objects.create(
+        product = models.Product(
             title_uz = request.data['title_uz'],
             price = request.data['price'] if request.data['price'] else 0, 
-            image_min = request.FILES.get('image'),
-            image_max = request.FILES.get('image'),
             category = category,
             description_uz =  request.data.get('description_uz'),
             priority = request.data['priority'],
         )
+        images.attach_upload(product, request.FILES.get('image'))
+        product.save()
         serializer = ser.ProductSerializer(product)
         return Response(serializer.data, status=status.HTTP_200_OK)
     except Exception as e:
@@ -252,7 +317,7 @@ def createProduct(request):
     tags=["Product"]
 )
 @api_view(['PUT'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def updateProduct(request, uuid):
     product = get_object_or_404(models.Product, uuid=uuid)
@@ -268,8 +333,7 @@ def updateProduct(request, uuid):
         product.title_en = request.data['title_en']
         product.title_ru = request.data['title_ru']
         product.price = request.data['price'] if request.data['price'] else 0
-        product.image_min = request.FILES.get('image')
-        product.image_max = request.FILES.get('image')
+        images.attach_upload(product, request.FILES.get('image'))
         product.description_uz = request.data['description_uz']
         product.description_en = request.data['description_en']
         product.description_ru = request.data['description_ru']
@@ -291,7 +355,7 @@ def updateProduct(request, uuid):
     tags=["Product"]
 )
 @api_view(['DELETE'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def deleteProduct(request, uuid):
     product = get_object_or_404(models.Product, uuid=uuid)
@@ -303,7 +367,7 @@ def deleteProduct(request, uuid):
 @swagger_auto_schema(
     method='GET',
     operation_description="View all product images. Optionally filter by product.",
-    manual_parameters=[openapi.Parameter('product', openapi.IN_QUERY, description="Filter product images by product", type=openapi.TYPE_STRING)],
+    manual_parameters=[openapi.Parameter('product', openapi.IN_QUERY, description="Filter product images by product", type=openapi.TYPE_STRING)] + LIST_PARAMETERS,
     responses={
         status.HTTP_200_OK: ser.ProductImageSerializer(many=True),
     },
@@ -311,15 +375,15 @@ def deleteProduct(request, uuid):
     tags=["ProductImage"]
 )
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
+@caching.conditional(models.ProductImage)
 def viewProductImage(request):
     product_images = models.ProductImage.objects.filter(is_active=True)
     product = request.GET.get('product')
     if product:
         product_images = product_images.filter(product=product)
 
-    serialized_data = ser.ProductImageSerializer(product_images, many=True)
-    return Response({"productImages": serialized_data.data}, status=status.HTTP_200_OK)
+    return funcs.paginated_response(request, product_images, ser.ProductImageSerializer, "productImages", ordering=('-created_at', 'uuid'))
 
 
 @swagger_auto_schema(
@@ -334,9 +398,10 @@ def viewProductImage(request):
 )
 
 @api_view(['POST'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @parser_classes([MultiPartParser, FormParser])
 def createProductImage(request):
+    uploads.spool(request)
     try:
         product = request.data.get('product')
         if not product:
@@ -344,16 +409,20 @@ def createProductImage(request):
 
         product_instance = get_object_or_404(models.Product, uuid=product)
 
-        images = request.FILES.getlist('image')
+        if uploads.rejected(request):
+            return Response({"message": "Files too large: %s" % ", ".join(uploads.rejected(request))}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
 
-        if not images:
-            return Response({"message": "No images provided"}, status=status.HTTP_400_BAD_REQUEST)
+        files = request.FILES.getlist('image')
 
-        for image in images:
-            models.ProductImage.objects.create(product=product_instance, image_min=image, image_max=image)
+        if not files:
+            return Response({"message": "No images provided"}, status=status.HTTP_400_BAD_REQUEST)
 
+        try:
+            created = uploads.bulk_create(models.ProductImage, files, product=product_instance)
+        except uploads.UploadError as e:
+            return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        serializer = ser.ProductImageSerializer(models.ProductImage.objects.filter(product=product_instance), many=True)
+        serializer = ser.ProductImageSerializer(created, many=True)
         return Response({"productImages": serializer.data}, status=status.HTTP_200_OK)
 
     except Exception as e:
@@ -372,10 +441,11 @@ def createProductImage(request):
     tags=["ProductImage"]
 )
 @api_view(['PUT'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def updateProductImage(request, uuid):
     product = get_object_or_404(models.ProductImage, uuid=uuid)
+    images.attach_upload(product, request.FILES.get('image'))
     serializer = ser.ProductImageSerializer(product, data=request.data, partial=True)
 
     if serializer.is_valid():
@@ -394,7 +464,7 @@ def updateProductImage(request, uuid):
     tags=["ProductImage"]
 )
 @api_view(['DELETE'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def deleteProductImage(request, uuid):
     product = get_object_or_404(models.ProductImage, uuid=uuid)
@@ -412,17 +482,19 @@ def deleteProductImage(request, uuid):
 @swagger_auto_schema(
     method='GET',
     operation_description="View all sliders.",
+    manual_parameters=LIST_PARAMETERS,
     responses={
         status.HTTP_200_OK: ser.SliderSerializer(many=True),
     },
     tags=["Slider"]
 )
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
+@caching.conditional(models.Slider)
+@caching.cache_response(models.Slider)
 def viewSlider(request):
     data = models.Slider.objects.filter(is_active=True)
-    serialized_data = ser.SliderSerializer(data, many=True)
-    return Response({"sliders": serialized_data.data}, status=status.HTTP_200_OK)
+    return funcs.paginated_response(request, data, ser.SliderSerializer, "sliders")
 
 
 
@@ -437,16 +509,16 @@ def viewSlider(request):
     tags=["Slider"]
 )
 @api_view(['POST'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @parser_classes([MultiPartParser, FormParser])
 def createSlider(request):
-    slider = models.Slider.objects.create(
+    slider = models.Slider(
         title_uz = request.data['title_uz'],
-        image_min = request.FILES.get('image'),
-        image_max = request.FILES.get('image'),
         description_uz =  request.data['description_uz'],
         priority = request.data['priority'],
     )
+    images.attach_upload(slider, request.FILES.get('image'))
+    slider.save()
     serializer = ser.SliderSerializer(slider)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -465,7 +537,7 @@ def createSlider(request):
     tags=["Slider"]
 )
 @api_view(['PUT'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def updateSlider(request, uuid):
     try:
@@ -473,8 +545,7 @@ def updateSlider(request, uuid):
         slider.title_uz = request.data['title_uz']
         slider.title_en = request.data['title_en']
         slider.title_ru = request.data['title_ru']
-        slider.image_min = request.FILES.get('image')
-        slider.image_max = request.FILES.get('image')
+        images.attach_upload(slider, request.FILES.get('image'))
         slider.description_uz = request.data['description_uz']
         slider.description_en = request.data['description_en']
         slider.description_ru = request.data['description_ru']
@@ -495,7 +566,7 @@ def updateSlider(request, uuid):
     tags=["Slider"]
 )
 @api_view(['DELETE'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def deleteSlider(request, uuid):
     slider = get_object_or_404(models.Slider, uuid=uuid)
@@ -513,17 +584,19 @@ def deleteSlider(request, uuid):
 @swagger_auto_schema(
     method='GET',
     operation_description="View all blogs.",
+    manual_parameters=LIST_PARAMETERS,
     responses={
         status.HTTP_200_OK: ser.BlogSerializer(many=True),
     },
     tags=["Blog"]
 )
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
+@caching.conditional(models.Blog)
+@caching.cache_response(models.Blog)
 def viewBlog(request):
     data = models.Blog.objects.filter(is_active=True)
-    serialized_data = ser.BlogSerializer(data, many=True)
-    return Response({"blogs": serialized_data.data}, status=status.HTTP_200_OK)
+    return funcs.paginated_response(request, data, ser.BlogSerializer, "blogs")
 
 
 
@@ -538,18 +611,18 @@ def viewBlog(request):
     tags=["Blog"]
 )
 @api_view(['POST'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @parser_classes([MultiPartParser, FormParser])
 @permission_classes([IsAuthenticated])
 def createBlog(request):
     try:
-        blog = models.Blog.objects.create(
+        blog = models.Blog(
             title_uz = request.data['title_uz'],
-            image_min = request.FILES.get('image'),
-            image_max = request.FILES.get('image'),
             description_uz =  request.data['description_uz'],
             priority = request.data['priority'],
         )
+        images.attach_upload(blog, request.FILES.get('image'))
+        blog.save()
         serializer = ser.BlogSerializer(blog)
         return Response(serializer.data, status=status.HTTP_200_OK)
     except Exception as e:
@@ -568,7 +641,7 @@ def createBlog(request):
     tags=["Blog"]
 )
 @api_view(['PUT'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def updateBlog(request, uuid):
     try:
@@ -576,8 +649,7 @@ def updateBlog(request, uuid):
         blog.title_uz = request.data['title_uz']
         blog.title_en = request.data['title_en']
         blog.title_ru = request.data['title_ru']
-        blog.image_min = request.FILES.get('image')
-        blog.image_max = request.FILES.get('image')
+        images.attach_upload(blog, request.FILES.get('image'))
         blog.description_uz = request.data['description_uz']
         blog.description_en = request.data['description_en']
         blog.description_ru = request.data['description_ru']
@@ -592,6 +664,7 @@ def updateBlog(request, uuid):
 @swagger_auto_schema(
     method='GET',
     operation_description="View a specific blog post.",
+    manual_parameters=READ_PARAMETERS,
     responses={
         status.HTTP_200_OK: ser.BlogSerializer,
     },
@@ -599,11 +672,14 @@ def updateBlog(request, uuid):
 )
 
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
+@caching.conditional(models.Blog)
+@caching.cache_response(models.Blog)
 def viewBlogDetail(request, uuid):
     try:
-        blog = get_object_or_404(models.Blog, uuid=uuid)
-        serialized_data = ser.BlogSerializer(blog)
+        context = funcs.serializer_context(request)
+        blog = get_object_or_404(ser.BlogSerializer.setup_queryset(models.Blog.objects.all(), context), uuid=uuid)
+        serialized_data = ser.BlogSerializer(blog, context=context)
         return Response({"blogDetail": serialized_data.data}, status=status.HTTP_200_OK)
     except Exception as e:
         return Response({"message": str(e)},status=status.HTTP_400_BAD_REQUEST)
@@ -619,7 +695,7 @@ def viewBlogDetail(request, uuid):
     tags=["Blog"]
 )
 @api_view(['DELETE'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def deleteBlog(request, uuid):
     blog = get_object_or_404(models.Blog, uuid=uuid)
@@ -637,6 +713,7 @@ def deleteBlog(request, uuid):
 @swagger_auto_schema(
     method='GET',
     operation_description="View company details. If multiple companies are found, the last one will be returned.",
+    manual_parameters=READ_PARAMETERS,
     responses={
         status.HTTP_200_OK: ser.CompanySerializer(many=True),
     },
@@ -644,16 +721,18 @@ def deleteBlog(request, uuid):
 )
 
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
+@caching.conditional(models.Company)
+@caching.cache_response(models.Company)
 def viewCompany(request):
     try:
-        data = models.Company.objects.filter(is_active=True)
-        if data.count() >= 1:
-            data = data.last()
-            serialized_data = ser.CompanySerializer(data)
+        context = funcs.serializer_context(request)
+        data = ser.CompanySerializer.setup_queryset(models.Company.objects.filter(is_active=True), context).last()
+        if data is not None:
+            serialized_data = ser.CompanySerializer(data, context=context)
             return Response({"company": serialized_data.data}, status=status.HTTP_200_OK)
         else:
-            return Response({"message": "Multiple companies found"},status=status.HTTP_400_BAD_REQUEST)
+            return Response({"message": "Company not found"},status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({"message": str(e)},status=status.HTTP_400_BAD_REQUEST)
 
@@ -668,7 +747,7 @@ def viewCompany(request):
 )
 
 @api_view(['POST'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def createCompany(request):
     try:
@@ -708,7 +787,7 @@ def createCompany(request):
 
 
 @api_view(['PUT'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def updateCompany(request, uuid):
     try:
@@ -731,17 +810,18 @@ def updateCompany(request, uuid):
 @swagger_auto_schema(
     method='GET',
     operation_description="View company addresses.",
+    manual_parameters=LIST_PARAMETERS,
     responses={
         status.HTTP_200_OK: ser.CompanyAddressSerializer(many=True),
     },
     tags=["CompanyAddress"]
 )
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
+@caching.conditional(models.CompanyAddress)
 def viewCompanyAddress(request):
     data = models.CompanyAddress.objects.filter(is_active=True)
-    serialized_data = ser.CompanyAddressSerializer(data, many=True)
-    return Response({"companyAddresses": serialized_data.data}, status=status.HTTP_200_OK)
+    return funcs.paginated_response(request, data, ser.CompanyAddressSerializer, "companyAddresses", ordering=('created_at', 'uuid'))
 
 
 
@@ -756,7 +836,7 @@ def viewCompanyAddress(request):
     tags=["CompanyAddress"]
 )
 @api_view(['POST'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def createCompanyAddress(request):
     serializer = ser.CompanyAddressSerializer(data=request.data)
@@ -778,7 +858,7 @@ def createCompanyAddress(request):
     tags=["CompanyAddress"]
 )
 @api_view(['PUT'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def updateCompanyAddress(request, uuid):
     companyaddress = get_object_or_404(models.CompanyAddress, uuid=uuid)
@@ -801,7 +881,7 @@ def updateCompanyAddress(request, uuid):
     tags=["CompanyAddress"]
 )
 @api_view(['DELETE'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def deleteCompanyAddress(request, uuid):
     companyaddress = get_object_or_404(models.CompanyAddress, uuid=uuid)
@@ -818,18 +898,18 @@ def deleteCompanyAddress(request, uuid):
 @swagger_auto_schema(
     method='GET',
     operation_description="View company images.",
+    manual_parameters=LIST_PARAMETERS,
     responses={
         status.HTTP_200_OK: ser.CompanyImageSerializer(many=True),
     },
     tags=["CompanyImage"]
 ) 
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
+@caching.conditional(models.CompanyImage)
 def viewCompanyImage(request):
     data = models.CompanyImage.objects.filter(is_active=True)
-    serialized_data = ser.CompanyImageSerializer(data, many=True)
-    
-    return Response({"companyImages": serialized_data.data}) 
+    return funcs.paginated_response(request, data, ser.CompanyImageSerializer, "companyImages", ordering=('created_at', 'uuid'))
 
 @swagger_auto_schema(
     method='POST',
@@ -842,16 +922,21 @@ def viewCompanyImage(request):
     tags=["CompanyImage"]
 )
 @api_view(['POST'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def createCompanyImage(request):
+    uploads.spool(request)
     try: 
-        images = request.FILES.getlist('images')
-        for image in images:
-            models.CompanyImage.objects.create(
-                image = image
-            )
-        return Response({"message": "Company images created"}, status=status.HTTP_200_OK)
+        if uploads.rejected(request):
+            return Response({"message": "Files too large: %s" % ", ".join(uploads.rejected(request))}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        try:
+            created = uploads.bulk_create(models.CompanyImage, request.FILES.getlist('images'))
+        except uploads.UploadError as e:
+            return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = ser.CompanyImageSerializer(created, many=True)
+        return Response({"message": "Company images created", "companyImages": serializer.data}, status=status.HTTP_200_OK)
     except Exception as e:
         return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -867,10 +952,11 @@ def createCompanyImage(request):
     tags=["CompanyImage"]
 )
 @api_view(['PUT'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def updateCompanyImage(request, uuid):
     companyimage = get_object_or_404(models.CompanyImage, uuid=uuid)
+    images.attach_upload(companyimage, request.FILES.get('image'))
     serializer = ser.CompanyImageSerializer(companyimage, data=request.data, partial=True)
 
     if serializer.is_valid():
@@ -889,7 +975,7 @@ def updateCompanyImage(request, uuid):
     tags=["CompanyImage"]
 )
 @api_view(['DELETE'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def deleteCompanyImage(request, uuid):
     companyimage = get_object_or_404(models.CompanyImage, uuid=uuid)
@@ -906,17 +992,18 @@ def deleteCompanyImage(request, uuid):
 @swagger_auto_schema(
     method='GET',
     operation_description="View company phone numbers.",
+    manual_parameters=LIST_PARAMETERS,
     responses={
         status.HTTP_200_OK: ser.CompanyPhoneSerializer(many=True),
     },
     tags=["CompanyPhone"]
 )
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
+@caching.conditional(models.CompanyPhone)
 def viewCompanyPhone(request):
     data = models.CompanyPhone.objects.filter(is_active=True)
-    serialized_data = ser.CompanyPhoneSerializer(data, many=True)
-    return Response({"companyPhones": serialized_data.data}, status=status.HTTP_200_OK)
+    return funcs.paginated_response(request, data, ser.CompanyPhoneSerializer, "companyPhones", ordering=('created_at', 'uuid'))
 
 
 @swagger_auto_schema(
@@ -930,7 +1017,7 @@ def viewCompanyPhone(request):
     tags=["CompanyPhone"]
 )
 @api_view(['POST'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def createCompanyPhone(request):
     serializer = ser.CompanyPhoneSerializer(data=request.data)
@@ -952,7 +1039,7 @@ def createCompanyPhone(request):
     tags=["CompanyPhone"]
 )
 @api_view(['PUT'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def updateCompanyPhone(request, uuid):
     companyphone = get_object_or_404(models.CompanyPhone, uuid=uuid)
@@ -975,7 +1062,7 @@ def updateCompanyPhone(request, uuid):
     tags=["CompanyPhone"]
 )
 @api_view(['DELETE'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def deleteCompanyPhone(request, uuid):
     companyphone = get_object_or_404(models.CompanyPhone, uuid=uuid)
@@ -992,17 +1079,18 @@ def deleteCompanyPhone(request, uuid):
 @swagger_auto_schema(
     method='GET',
     operation_description="View company emails.",
+    manual_parameters=LIST_PARAMETERS,
     responses={
         status.HTTP_200_OK: ser.CompanyEmailSerializer(many=True),
     },
     tags=["CompanyEmail"]
 )
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
+@caching.conditional(models.CompanyEmail)
 def viewCompanyEmail(request):
     data = models.CompanyEmail.objects.filter(is_active=True)
-    serialized_data = ser.CompanyEmailSerializer(data, many=True)
-    return Response({"companyEmails": serialized_data.data}, status=status.HTTP_200_OK)
+    return funcs.paginated_response(request, data, ser.CompanyEmailSerializer, "companyEmails", ordering=('created_at', 'uuid'))
 
 
 @swagger_auto_schema(
@@ -1016,7 +1104,7 @@ def viewCompanyEmail(request):
     tags=["CompanyEmail"]
 )
 @api_view(['POST'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def createCompanyEmail(request):
     serializer = ser.CompanyEmailSerializer(data=request.data)
@@ -1038,7 +1126,7 @@ def createCompanyEmail(request):
     tags=["CompanyEmail"]
 )
 @api_view(['PUT'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def updateCompanyEmail(request, uuid):
     companyemail = get_object_or_404(models.CompanyEmail, uuid=uuid)
@@ -1061,7 +1149,7 @@ def updateCompanyEmail(request, uuid):
     tags=["CompanyEmail"]
 )
 @api_view(['DELETE'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def deleteCompanyEmail(request, uuid):
     companyemail = get_object_or_404(models.CompanyEmail, uuid=uuid)
@@ -1078,38 +1166,55 @@ def deleteCompanyEmail(request, uuid):
 
 @swagger_auto_schema(
     method='GET',
-    operation_description="View all contacts.",
+    operation_description="View all contacts, newest first.",
+    manual_parameters=LIST_PARAMETERS,
     responses={
         status.HTTP_200_OK: ser.ContactSerializer(many=True),
     },
     tags=["Contact"]
 ) 
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 def viewContact(request):
     data = models.Contact.objects.filter(is_active=True)
-    serialized_data = ser.ContactSerializer(data, many=True)
-    return Response({"contacts": serialized_data.data}, status=status.HTTP_200_OK)
+    return funcs.paginated_response(request, data, ser.ContactSerializer, "contacts", ordering=('-created_at', 'uuid'))
 
 
 @swagger_auto_schema(
     method='POST',
-    operation_description="Create a new contact message.",
+    operation_description="Create a new contact message. Submissions are rate limited per client and per phone, "
+                          "a repeated submission is accepted without being stored again, and with buffered "
+                          "writes enabled the message is stored shortly after the 202 response.",
     request_body=ser.ContactSerializer,
     responses={
         status.HTTP_200_OK: ser.ContactSerializer,
+        status.HTTP_202_ACCEPTED: "Accepted (buffered or duplicate)",
         status.HTTP_400_BAD_REQUEST: "Bad Request",
+        status.HTTP_429_TOO_MANY_REQUESTS: "Too many submissions",
     },
     tags=["Contact"]
 )
 @api_view(['POST'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 def createContact(request):
+    wait = contacts.throttle('ip', funcs.client_ip(request))
+    if wait:
+        return Response({"message": "Too many submissions"}, status=status.HTTP_429_TOO_MANY_REQUESTS, headers={"Retry-After": str(wait)})
     serializer = ser.ContactSerializer(data=request.data)
-    if serializer.is_valid():
-        serializer.save()
-        return Response(serializer.data, status=status.HTTP_200_OK)
-    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    wait = contacts.throttle('phone', contacts.normalize_phone(serializer.validated_data.get('phone')))
+    if wait:
+        return Response({"message": "Too many submissions"}, status=status.HTTP_429_TOO_MANY_REQUESTS, headers={"Retry-After": str(wait)})
+    if contacts.is_duplicate(serializer.validated_data):
+        return Response({"message": "Contact received"}, status=status.HTTP_202_ACCEPTED)
+
+    if getattr(settings, 'CONTACT_BUFFERED', False) and contacts.buffer.add(models.Contact(**serializer.validated_data)):
+        contacts.record_submission(serializer.validated_data)
+        return Response({"message": "Contact received"}, status=status.HTTP_202_ACCEPTED)
+    serializer.save()
+    contacts.record_submission(serializer.validated_data)
+    return Response(serializer.data, status=status.HTTP_200_OK)
 
 
 @swagger_auto_schema(
@@ -1124,7 +1229,7 @@ def createContact(request):
     tags=["Contact"]
 )
 @api_view(['PUT'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 def updateContact(request, uuid):
     contact = get_object_or_404(models.Contact, uuid=uuid)
     serializer = ser.ContactSerializer(contact, data=request.data, partial=True)
@@ -1146,9 +1251,173 @@ def updateContact(request, uuid):
     tags=["Contact"]
 )
 @api_view(['DELETE'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 def deleteContact(request, uuid):
     contact = get_object_or_404(models.Contact, uuid=uuid)
     contact.is_active = False
     contact.save()
-    return Response({"message": "Contact deleted"},status=status.HTTP_200_OK)
\ No newline at end of file
+    return Response({"message": "Contact deleted"},status=status.HTTP_200_OK)
+
+
+
+#########################
+# Site
+#########################
+
+# key -> (model, serializer, ordering) of the lists in the site bootstrap;
+# the optional ones are only sent when listed in `include`.
+SITE_SECTIONS = {
+    'addresses': (models.CompanyAddress, ser.CompanyAddressSerializer, ('created_at', 'uuid')),
+    'phones': (models.CompanyPhone, ser.CompanyPhoneSerializer, ('created_at', 'uuid')),
+    'emails': (models.CompanyEmail, ser.CompanyEmailSerializer, ('created_at', 'uuid')),
+    'images': (models.CompanyImage, ser.CompanyImageSerializer, ('created_at', 'uuid')),
+}
+
+SITE_OPTIONAL_SECTIONS = {
+    'categories': (models.Category, ser.CategorySerializer, ('priority', 'uuid')),
+    'sliders': (models.Slider, ser.SliderSerializer, ('priority', 'uuid')),
+}
+
+SITE_MODELS = [models.Company] + [model for model, _, _ in (*SITE_SECTIONS.values(), *SITE_OPTIONAL_SECTIONS.values())]
+
+
+def site_data(lang, include):
+    """
+    The active company and the active rows of every section: one query each.
+    """
+    context = {'lang': lang, 'fields': None, 'expand': None, 'ordering': ()}
+    company = ser.CompanySerializer.setup_queryset(models.Company.objects.filter(is_active=True), context).last()
+    data = {"company": ser.CompanySerializer(company, context=context).data if company else None}
+    sections = dict(SITE_SECTIONS, **{name: SITE_OPTIONAL_SECTIONS[name] for name in include})
+    for name, (model, serializer_class, ordering) in sections.items():
+        section_context = dict(context, ordering=ordering)
+        queryset = serializer_class.setup_queryset(model.objects.filter(is_active=True).order_by(*ordering), section_context)
+        data[name] = serializer_class(queryset, many=True, context=section_context).data
+    return data
+
+
+@swagger_auto_schema(
+    method='GET',
+    operation_description="Everything the header and footer need in one response: the active company with its "
+                          "addresses, phones, emails and images, and optionally the active categories and sliders. "
+                          "The rendered response is cached until one of these changes.",
+    manual_parameters=[
+        LANGUAGE_PARAMETER,
+        openapi.Parameter('include', openapi.IN_QUERY, description="Comma-separated optional lists: categories, sliders", type=openapi.TYPE_STRING),
+    ],
+    tags=["Site"]
+)
+@api_view(['GET'])
+@authentication_classes([CachedTokenAuthentication])
+@caching.conditional(*SITE_MODELS)
+def viewSite(request):
+    lang = funcs.get_language(request)
+    include = sorted(set(funcs.get_list_param(request, 'include') or ()) & set(SITE_OPTIONAL_SECTIONS))
+    content = caching.cached_json(
+        'viewSite',
+        (lang, include),
+        SITE_MODELS,
+        lambda: site_data(lang, include),
+    )
+    return HttpResponse(content, content_type='application/json')
+
+
+#########################
+# Search
+#########################
+
+SEARCH_SERIALIZERS = {
+    'product': ser.ProductSerializer,
+    'blog': ser.BlogSerializer,
+}
+
+@swagger_auto_schema(
+    method='GET',
+    operation_description="Full-text search over the titles and descriptions (all languages) of products and blogs. "
+                          "Every word must match, as a prefix; results are ranked by relevance, title matches first.",
+    manual_parameters=[
+        openapi.Parameter('q', openapi.IN_QUERY, description="Search text", type=openapi.TYPE_STRING, required=True),
+        openapi.Parameter('type', openapi.IN_QUERY, description="Comma-separated kinds to search: product, blog (default both)", type=openapi.TYPE_STRING),
+        *READ_PARAMETERS,
+        openapi.Parameter('page', openapi.IN_QUERY, description="Page number", type=openapi.TYPE_INTEGER, default=1),
+        openapi.Parameter('page_size', openapi.IN_QUERY, description="Results per page", type=openapi.TYPE_INTEGER, default=20),
+    ],
+    tags=["Search"]
+)
+@api_view(['GET'])
+@authentication_classes([CachedTokenAuthentication])
+@caching.cache_response(models.Product, models.Blog)
+def viewSearch(request):
+    try:
+        page_number = int(request.GET.get('page', 1))
+    except ValueError:
+        page_number = 1
+    page = search.search(
+        request.GET.get('q', ''),
+        kinds=funcs.get_list_param(request, 'type'),
+        page=page_number,
+        page_size=funcs.get_page_size(request, 20),
+    )
+
+    context = funcs.serializer_context(request)
+    found = {}
+    for kind in {kind for kind, object_id, rank in page['items']}:
+        serializer_class = SEARCH_SERIALIZERS[kind]
+        ids = [object_id for item_kind, object_id, rank in page['items'] if item_kind == kind]
+        queryset = serializer_class.setup_queryset(serializer_class.Meta.model.objects.filter(uuid__in=ids), context)
+        for obj in queryset:
+            found[kind, obj.uuid] = serializer_class(obj, context=context).data
+
+    results = [
+        {"type": kind, "rank": rank, "item": found[kind, object_id]}
+        for kind, object_id, rank in page.pop('items') if (kind, object_id) in found
+    ]
+    return Response({"results": results, **page}, status=status.HTTP_200_OK)
+
+
+@swagger_auto_schema(
+    method='GET',
+    operation_description="Title suggestions for a search box: products and categories with a word of their title "
+                          "(in any language) starting with `q`, by priority. Served from memory.",
+    manual_parameters=[
+        openapi.Parameter('q', openapi.IN_QUERY, description="Typed text", type=openapi.TYPE_STRING, required=True),
+        openapi.Parameter('type', openapi.IN_QUERY, description="Comma-separated kinds to suggest: product, category (default both)", type=openapi.TYPE_STRING),
+        LANGUAGE_PARAMETER,
+        openapi.Parameter('limit', openapi.IN_QUERY, description="Number of suggestions (at most 50)", type=openapi.TYPE_INTEGER, default=10),
+    ],
+    tags=["Search"]
+)
+@api_view(['GET'])
+@authentication_classes([CachedTokenAuthentication])
+def viewTypeahead(request):
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 50)
+    except ValueError:
+        limit = 10
+    suggestions = typeahead.suggest(
+        request.GET.get('q', ''),
+        limit=limit,
+        lang=funcs.get_language(request),
+        kinds=funcs.get_list_param(request, 'type'),
+    )
+    return Response({"results": suggestions}, status=status.HTTP_200_OK)
+
+
+#########################
+# Cache
+#########################
+
+@swagger_auto_schema(
+    method='GET',
+    operation_description="Hit/miss counters of the response cache, the translation memory and the token cache (this process).",
+    tags=["Cache"]
+)
+@api_view(['GET'])
+@authentication_classes([CachedTokenAuthentication])
+@permission_classes([IsAuthenticated])
+def viewCacheStats(request):
+    return Response({
+        "responses": caching.response_stats.stats(),
+        "translationMemory": translation.memory.stats(),
+        "authTokens": authentication.tokens.stats(),
+    }, status=status.HTTP_200_OK)